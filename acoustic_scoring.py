@@ -0,0 +1,312 @@
+from functools import lru_cache
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from audio_processing import find_voice_range, is_silent, resample
+
+# 特徴量の抽出条件（16kHz、25ms窓、10msシフト）
+FEATURE_SAMPLE_RATE = 16000
+FRAME_LENGTH = 400
+HOP_LENGTH = 160
+N_FFT = 512
+N_MELS = 40
+N_MFCC = 13
+FRAME_SECONDS = HOP_LENGTH / FEATURE_SAMPLE_RATE
+# ピッチの探索範囲（Hz）と、有声とみなす自己相関の強さ
+PITCH_MIN_HZ = 70
+PITCH_MAX_HZ = 400
+VOICING_THRESHOLD = 0.3
+# 基本周期の整数倍のラグと判定する、自己相関の強さの比
+OCTAVE_ERROR_RATIO = 0.85
+# 有声とみなすエネルギーの閾値（最大エネルギーに対するdB）
+VOICING_ENERGY_DB = -30.0
+# 発話区間の検出時に前後に残す余白（ミリ秒）
+VOICE_PADDING_MS = 50
+# 採点に必要な発話の長さ（秒）
+MIN_VOICE_SECONDS = 0.3
+# 採点する学習者の発話の長さの上限（お手本の長さに対する倍率）
+# DTWの距離行列はお手本と学習者のフレーム数の積の大きさになるため、長すぎる録音は採点しない
+MAX_LEARNER_LENGTH_RATIO = 3.0
+# 類似度を0とみなす、整列した区間の平均距離（正規化したMFCCのユークリッド距離）
+COST_SCALE = 6.0
+# 区間の平均距離が全体の平均のこの倍率以上、かつこの値以上の場合に「ずれが大きい」とする
+MISMATCH_FACTOR = 1.3
+MISMATCH_MIN_COST = 3.0
+# 抑揚の一致度の計算に必要な、両方が有声のフレーム数
+MIN_VOICED_FRAMES = 10
+
+
+@lru_cache(maxsize=None)
+def mel_filterbank(sample_rate=FEATURE_SAMPLE_RATE, n_fft=N_FFT, n_mels=N_MELS, fmin=60.0):
+    """
+    メルフィルタバンク（メル数 × 周波数ビン数）を作成
+    """
+    def to_mel(hz):
+        return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+    def to_hz(mel):
+        return 700.0 * (10 ** (mel / 2595.0) - 1.0)
+
+    points = to_hz(np.linspace(to_mel(fmin), to_mel(sample_rate / 2), n_mels + 2))
+    bins = np.fft.rfftfreq(n_fft, 1.0 / sample_rate)
+    lower, center, upper = points[:-2, None], points[1:-1, None], points[2:, None]
+    rising = (bins - lower) / (center - lower)
+    falling = (upper - bins) / (upper - center)
+    return np.maximum(0.0, np.minimum(rising, falling)).astype(np.float32)
+
+
+@lru_cache(maxsize=None)
+def dct_matrix(n_mfcc=N_MFCC, n_mels=N_MELS):
+    """
+    対数メルスペクトルからMFCCを求める直交DCT-II行列（MFCC数 × メル数）を作成
+    """
+    basis = np.cos(np.pi / n_mels * (np.arange(n_mels) + 0.5)[None, :] * np.arange(n_mfcc)[:, None])
+    basis *= np.sqrt(2.0 / n_mels)
+    basis[0] /= np.sqrt(2.0)
+    return basis.astype(np.float32)
+
+
+def frame_signal(samples):
+    """
+    音声をフレーム（フレーム数 × FRAME_LENGTH）に分割
+    """
+    if len(samples) < FRAME_LENGTH:
+        samples = np.pad(samples, (0, FRAME_LENGTH - len(samples)))
+    return sliding_window_view(samples, FRAME_LENGTH)[::HOP_LENGTH]
+
+
+def estimate_pitch(frames, energy_db):
+    """
+    フレームごとの基本周波数を自己相関で推定（無声のフレームは0）
+    """
+    spectrum = np.fft.rfft(frames, n=2 * N_FFT)
+    autocorrelation = np.fft.irfft(spectrum.real ** 2 + spectrum.imag ** 2)[:, :FRAME_LENGTH]
+    # ラグが大きいほど重なりが減って値が小さくなる偏りを補正
+    autocorrelation /= (FRAME_LENGTH - np.arange(FRAME_LENGTH)) / FRAME_LENGTH
+    power = np.maximum(autocorrelation[:, 0], 1e-10)
+
+    min_lag = FEATURE_SAMPLE_RATE // PITCH_MAX_HZ
+    max_lag = FEATURE_SAMPLE_RATE // PITCH_MIN_HZ
+    rows = np.arange(len(frames))
+    lags = np.argmax(autocorrelation[:, min_lag:max_lag + 1], axis=1) + min_lag
+    peak = autocorrelation[rows, lags]
+    # 基本周期の整数倍のラグを選んだ場合（1オクターブ以上低い推定）は、ほぼ同じ強さの短いラグに置き換える
+    for divisor in (3, 2):
+        candidates = np.stack([lags // divisor + offset for offset in (-1, 0, 1)], axis=1)
+        candidates = np.clip(candidates, min_lag, max_lag)
+        values = autocorrelation[rows[:, None], candidates]
+        best = np.argmax(values, axis=1)
+        replace = values[rows, best] >= OCTAVE_ERROR_RATIO * peak
+        lags = np.where(replace, candidates[rows, best], lags)
+        peak = np.where(replace, values[rows, best], peak)
+    strength = peak / power
+    voiced = (strength >= VOICING_THRESHOLD) & (energy_db >= energy_db.max() + VOICING_ENERGY_DB)
+    return np.where(voiced, FEATURE_SAMPLE_RATE / lags, 0.0)
+
+
+def extract_features(samples, sample_rate):
+    """
+    モノラル音声からフレームごとの特徴量を抽出
+    Returns:
+        MFCC（フレーム数 × N_MFCC）、エネルギー（dB）、ピッチ（Hz。無声は0）の辞書
+    """
+    samples = resample(np.asarray(samples, dtype=np.float32), sample_rate, FEATURE_SAMPLE_RATE)
+    frames = frame_signal(samples)
+    frames = frames - frames.mean(axis=1, keepdims=True)
+
+    spectrum = np.fft.rfft(frames * np.hanning(FRAME_LENGTH).astype(np.float32), n=N_FFT)
+    power = spectrum.real ** 2 + spectrum.imag ** 2
+    log_mel = np.log(power @ mel_filterbank().T + 1e-6)
+    energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+    return {
+        "mfcc": log_mel @ dct_matrix().T,
+        "energy_db": energy_db,
+        "pitch": estimate_pitch(frames, energy_db),
+    }
+
+
+def normalize_features(mfcc):
+    """
+    話者・録音環境の違いを吸収するため、MFCC（0次を除く）を平均0・分散1に正規化
+    """
+    coefficients = mfcc[:, 1:]
+    return (coefficients - coefficients.mean(axis=0)) / (coefficients.std(axis=0) + 1e-6)
+
+
+def pairwise_distances(reference, learner):
+    """
+    2つの特徴量列の全フレームの組み合わせのユークリッド距離（参照フレーム数 × 学習者フレーム数）
+    """
+    squared = (
+        np.sum(reference ** 2, axis=1)[:, None]
+        + np.sum(learner ** 2, axis=1)[None, :]
+        - 2.0 * reference @ learner.T
+    )
+    return np.sqrt(np.maximum(squared, 0.0))
+
+
+def dtw(cost):
+    """
+    動的時間伸縮（DTW）で2つの特徴量列を整列
+    同じ反対角線上のセルは互いに依存しないため、反対角線ごとにまとめて計算する
+    Args:
+        cost: フレーム間の距離（n × m）
+    Returns:
+        整列経路の (参照フレームの番号の配列, 学習者フレームの番号の配列)
+    """
+    n, m = cost.shape
+    accumulated = np.full((n + 1, m + 1), np.inf)
+    accumulated[0, 0] = 0.0
+    for diagonal in range(2, n + m + 1):
+        i = np.arange(max(1, diagonal - m), min(n, diagonal - 1) + 1)
+        j = diagonal - i
+        accumulated[i, j] = cost[i - 1, j - 1] + np.minimum(
+            np.minimum(accumulated[i - 1, j - 1], accumulated[i - 1, j]),
+            accumulated[i, j - 1]
+        )
+
+    # 終点から累積距離が最小の方向に戻って経路を求める
+    path = []
+    i, j = n, m
+    while i > 0 and j > 0:
+        path.append((i - 1, j - 1))
+        step = np.argmin((accumulated[i - 1, j - 1], accumulated[i - 1, j], accumulated[i, j - 1]))
+        if step == 0:
+            i, j = i - 1, j - 1
+        elif step == 1:
+            i -= 1
+        else:
+            j -= 1
+    path.reverse()
+    reference_index, learner_index = np.array(path).T
+    return reference_index, learner_index
+
+
+def to_semitones(pitch):
+    """
+    ピッチ（Hz）を平均からの半音数に変換（話者の声の高さの違いを除く）
+    """
+    semitones = 12 * np.log2(pitch)
+    return semitones - semitones.mean()
+
+
+def score_shadowing_audio(reference, reference_rate, learner, learner_rate, segment_seconds=0.5):
+    """
+    お手本の音声と学習者の音声を特徴量のDTWで整列し、タイミング・話す速さ・区間ごとのずれを求める
+    Args:
+        reference: お手本（音声合成）のモノラル音声
+        reference_rate: お手本のサンプリング周波数
+        learner: 学習者の録音のモノラル音声
+        learner_rate: 学習者の録音のサンプリング周波数
+        segment_seconds: ずれを集計するお手本の区間の長さ（秒）
+    Returns:
+        採点結果の辞書（無音、発話が短すぎる、またはお手本に比べて長すぎて採点できない場合はNone）
+    """
+    # ほぼ無音の録音はfind_voice_rangeが全体を返すため、長さの判定より先に除外する
+    if is_silent(learner, learner_rate) or is_silent(reference, reference_rate):
+        return None
+
+    reference_start, reference_end = find_voice_range(reference, reference_rate, padding_ms=VOICE_PADDING_MS)
+    learner_start, learner_end = find_voice_range(learner, learner_rate, padding_ms=VOICE_PADDING_MS)
+    reference_seconds = float((reference_end - reference_start) / reference_rate)
+    learner_seconds = float((learner_end - learner_start) / learner_rate)
+    if min(reference_seconds, learner_seconds) < MIN_VOICE_SECONDS:
+        return None
+    if learner_seconds > reference_seconds * MAX_LEARNER_LENGTH_RATIO:
+        return None
+
+    reference_features = extract_features(reference[reference_start:reference_end], reference_rate)
+    learner_features = extract_features(learner[learner_start:learner_end], learner_rate)
+    cost = pairwise_distances(
+        normalize_features(reference_features["mfcc"]), normalize_features(learner_features["mfcc"])
+    )
+    reference_index, learner_index = dtw(cost)
+    path_cost = cost[reference_index, learner_index]
+    mean_cost = float(path_cost.mean())
+
+    # 発話開始からの経過時間の差（正の値は学習者が遅れている）
+    reference_times = reference_index * FRAME_SECONDS
+    lag = learner_index * FRAME_SECONDS - reference_times
+    # 整列経路の傾き（学習者の経過時間 / お手本の経過時間）の逆数を話す速さの比とする
+    slope = 1.0
+    if len(np.unique(reference_index)) > 1:
+        slope = np.polyfit(reference_times, learner_index * FRAME_SECONDS, 1)[0]
+    rate_ratio = float(1.0 / slope) if slope > 0 else None
+
+    # 抑揚：両方が有声のフレームのピッチの動き（半音）の相関
+    reference_pitch = reference_features["pitch"][reference_index]
+    learner_pitch = learner_features["pitch"][learner_index]
+    voiced = (reference_pitch > 0) & (learner_pitch > 0)
+    intonation_correlation = None
+    if voiced.sum() >= MIN_VOICED_FRAMES:
+        reference_semitones = to_semitones(reference_pitch[voiced])
+        learner_semitones = to_semitones(learner_pitch[voiced])
+        if reference_semitones.std() > 0 and learner_semitones.std() > 0:
+            intonation_correlation = float(np.corrcoef(reference_semitones, learner_semitones)[0, 1])
+
+    # 強弱：それぞれの最大エネルギーを基準にしたエネルギーの差（dB）
+    energy_difference = (
+        (learner_features["energy_db"] - learner_features["energy_db"].max())[learner_index]
+        - (reference_features["energy_db"] - reference_features["energy_db"].max())[reference_index]
+    )
+
+    # お手本の区間ごとに、整列した経路上の距離・遅れ・強弱の差を集計
+    segment_frames = max(int(round(segment_seconds / FRAME_SECONDS)), 1)
+    segment_index = reference_index // segment_frames
+    counts = np.bincount(segment_index)
+    segment_costs = np.bincount(segment_index, weights=path_cost) / np.maximum(counts, 1)
+    segment_lags = np.bincount(segment_index, weights=lag) / np.maximum(counts, 1)
+    segment_energy = np.bincount(segment_index, weights=energy_difference) / np.maximum(counts, 1)
+    segments = [
+        {
+            "start": number * segment_frames * FRAME_SECONDS,
+            "end": min((number + 1) * segment_frames * FRAME_SECONDS, reference_seconds),
+            "cost": float(segment_costs[number]),
+            "lag_seconds": float(segment_lags[number]),
+            "energy_difference_db": float(segment_energy[number]),
+            "mismatch": bool(
+                segment_costs[number] >= mean_cost * MISMATCH_FACTOR and segment_costs[number] >= MISMATCH_MIN_COST
+            ),
+        }
+        for number in range(len(counts)) if counts[number]
+    ]
+
+    return {
+        "similarity": float(np.clip(1.0 - mean_cost / COST_SCALE, 0.0, 1.0)),
+        "reference_seconds": reference_seconds,
+        "learner_seconds": learner_seconds,
+        # 録音開始から話し始めるまでの時間の、お手本との差
+        "onset_lag_seconds": float(learner_start / learner_rate - reference_start / reference_rate),
+        "mean_lag_seconds": float(lag.mean()),
+        "max_lag_seconds": float(lag[np.argmax(np.abs(lag))]),
+        "rate_ratio": rate_ratio,
+        "intonation_correlation": intonation_correlation,
+        "segments": segments,
+    }
+
+
+def format_acoustic_evaluation(result):
+    """
+    音声の比較結果を【音声の比較】セクションのテキストに変換
+    """
+    lines = [
+        "【音声の比較】",
+        f"✓ お手本の音声との類似度：{result['similarity']:.0%}",
+    ]
+    rate_ratio = result["rate_ratio"]
+    if rate_ratio is not None:
+        if rate_ratio > 1.1:
+            pace = "お手本より速め"
+        elif rate_ratio < 0.9:
+            pace = "お手本よりゆっくり"
+        else:
+            pace = "お手本とほぼ同じ"
+        lines.append(f"・話す速さ：お手本の{rate_ratio:.2f}倍（{pace}）")
+    lines.append(f"・お手本に対する遅れ：平均{result['mean_lag_seconds']:+.2f}秒（最大{result['max_lag_seconds']:+.2f}秒）")
+    if result["intonation_correlation"] is not None:
+        lines.append(f"・抑揚の一致度：{result['intonation_correlation']:.2f}（1に近いほどお手本と同じ抑揚）")
+    mismatches = [segment for segment in result["segments"] if segment["mismatch"]]
+    for segment in mismatches:
+        lines.append(f"△ {segment['start']:.1f}〜{segment['end']:.1f}秒付近の発音・リズムがお手本と異なります")
+    if not mismatches:
+        lines.append("✓ 全体を通してお手本に近いリズムで発音できています")
+    return "  \n".join(lines)
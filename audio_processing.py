@@ -0,0 +1,240 @@
+import io
+import os
+import time
+import numpy as np
+from capabilities import can_convert_audio, load_audio_segment
+from time_stretch import read_wav, write_wav
+
+# 16bit PCMの振幅に揃えるための係数（サンプル幅ごと）
+SAMPLE_WIDTH_SCALES = {
+    1: 256.0,
+    2: 1.0,
+    3: 1.0 / 256,
+    4: 1.0 / 65536,
+}
+# wavのヘッダーのバイト数
+WAV_HEADER_BYTES = 44
+# 全体がほぼ無音とみなす、フレームの最大エネルギー（16bit PCMの振幅でのdB）
+SILENCE_ENERGY_DB = 20.0
+
+
+def decode_audio(audio_buffer):
+    """
+    音声バッファを (16bit PCMの振幅のfloat配列, サンプリング周波数) に変換
+    wavは標準ライブラリで読み込み、それ以外はpydub（ffmpeg）で読み込む
+    """
+    audio_data = audio_buffer.getvalue()
+    try:
+        samples, sample_rate, sample_width = read_wav(audio_data)
+        return samples * SAMPLE_WIDTH_SCALES[sample_width], sample_rate
+    except Exception:
+        if not can_convert_audio():
+            raise
+
+    extension = os.path.splitext(audio_buffer.name)[1].lstrip(".").lower() or None
+    segment = load_audio_segment().from_file(io.BytesIO(audio_data), format=extension)
+    samples = np.array(segment.get_array_of_samples(), dtype=np.float32).reshape(-1, segment.channels)
+    if segment.sample_width == 1:
+        # 8bitのpydubのサンプルは符号付き
+        samples = samples * 256.0
+    else:
+        samples = samples * SAMPLE_WIDTH_SCALES[segment.sample_width]
+    return samples, segment.frame_rate
+
+
+def resample(samples, sample_rate, target_rate):
+    """
+    モノラル音声を指定のサンプリング周波数に変換（ダウンサンプリング時は移動平均で高域を落とす）
+    """
+    if sample_rate == target_rate or len(samples) == 0:
+        return samples
+
+    ratio = sample_rate / target_rate
+    if ratio > 1:
+        width = int(np.ceil(ratio))
+        samples = np.convolve(samples, np.ones(width, dtype=np.float32) / width, mode="same")
+
+    target_length = int(len(samples) / ratio)
+    positions = np.arange(target_length, dtype=np.float64) * ratio
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def frame_energy_db(samples, sample_rate, frame_ms=20):
+    """
+    フレームごとのエネルギー（dB）を求める（端数のサンプルは含めない）
+    """
+    frame_length = max(int(sample_rate * frame_ms / 1000), 1)
+    frame_count = len(samples) // frame_length
+    frames = samples[:frame_count * frame_length].reshape(frame_count, frame_length)
+    return 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+
+
+def is_silent(samples, sample_rate, frame_ms=20):
+    """
+    全体がほぼ無音（最も大きいフレームのエネルギーが閾値未満）か
+    """
+    energy_db = frame_energy_db(samples, sample_rate, frame_ms)
+    return len(energy_db) == 0 or energy_db.max() < SILENCE_ENERGY_DB
+
+
+def find_voice_range(samples, sample_rate, frame_ms=20, threshold_db=-35.0, padding_ms=200):
+    """
+    フレームごとのエネルギーから発話区間を検出し、前後の無音を除いた範囲を返す
+    Args:
+        threshold_db: 最大エネルギーに対する発話とみなす閾値（dB）
+        padding_ms: 発話区間の前後に残す余白（ミリ秒）
+    Returns:
+        (開始サンプル, 終了サンプル)。発話が見つからない場合は全体
+    """
+    energy_db = frame_energy_db(samples, sample_rate, frame_ms)
+    if len(energy_db) == 0:
+        return 0, len(samples)
+
+    frame_length = max(int(sample_rate * frame_ms / 1000), 1)
+    voiced = np.flatnonzero(energy_db >= energy_db.max() + threshold_db)
+    # 全体がほぼ無音（振幅が極小）の場合は切り取らない
+    if len(voiced) == 0 or energy_db.max() < SILENCE_ENERGY_DB:
+        return 0, len(samples)
+
+    padding = int(sample_rate * padding_ms / 1000)
+    start = max(voiced[0] * frame_length - padding, 0)
+    end = min((voiced[-1] + 1) * frame_length + padding, len(samples))
+    return start, end
+
+
+def encode_audio(samples, sample_rate, output_format):
+    """
+    モノラル音声をバイト列に変換（wav以外はpydubで圧縮形式に変換）
+    """
+    wav_data = write_wav(samples[:, None], sample_rate, 2)
+    if output_format == "wav" or not can_convert_audio():
+        # ffmpegが利用できない場合はwavのまま送る
+        return wav_data, "wav"
+
+    try:
+        compressed = io.BytesIO()
+        load_audio_segment().from_wav(io.BytesIO(wav_data)).export(compressed, format=output_format)
+        return compressed.getvalue(), output_format
+    except Exception:
+        return wav_data, "wav"
+
+
+def preprocess_for_transcription(audio_buffer, target_rate=16000, output_format="wav", threshold_db=-35.0):
+    """
+    文字起こし前の音声の前処理（前後の無音の除去、モノラル化、サンプリング周波数の変換、圧縮）
+    Args:
+        audio_buffer: 音声入力のバッファ
+        target_rate: 変換後のサンプリング周波数
+        output_format: 変換後の形式（"wav" / "mp3" / "ogg" など）
+        threshold_db: 発話とみなすエネルギーの閾値（最大エネルギーに対するdB）
+    Returns:
+        (前処理後の音声バッファ, 処理前後のバイト数・長さ・処理時間の辞書)
+    """
+    start_time = time.perf_counter()
+    bytes_before = len(audio_buffer.getbuffer())
+
+    samples, sample_rate = decode_audio(audio_buffer)
+    seconds_before = len(samples) / sample_rate
+
+    mono = samples.mean(axis=1)
+    start, end = find_voice_range(mono, sample_rate, threshold_db=threshold_db)
+    mono = resample(mono[start:end], sample_rate, target_rate)
+    audio_data, audio_format = encode_audio(mono, target_rate, output_format)
+
+    processed = io.BytesIO(audio_data)
+    processed.name = f"{os.path.splitext(audio_buffer.name)[0]}.{audio_format}"
+
+    stats = {
+        "bytes_before": bytes_before,
+        "bytes_after": len(audio_data),
+        "seconds_before": seconds_before,
+        "seconds_after": len(mono) / target_rate,
+        "processing_ms": (time.perf_counter() - start_time) * 1000,
+    }
+    return processed, stats
+
+
+def find_split_points(samples, sample_rate, max_chunk_seconds, search_seconds=5.0, frame_ms=20):
+    """
+    長い音声を最大長以下に分割する位置を、各区間の終わり付近で最も静かな位置から選ぶ
+    Returns:
+        分割位置（サンプル番号）のリスト
+    """
+    max_length = int(sample_rate * max_chunk_seconds)
+    search_length = min(int(sample_rate * search_seconds), max_length // 2)
+    frame_length = max(int(sample_rate * frame_ms / 1000), 1)
+
+    split_points = []
+    start = 0
+    while len(samples) - start > max_length:
+        # 区間の終わりから search_seconds 以内で、フレームのエネルギーが最小の位置で分割
+        search_start = start + max_length - search_length
+        window = samples[search_start:start + max_length]
+        frame_count = len(window) // frame_length
+        frames = window[:frame_count * frame_length].reshape(frame_count, frame_length)
+        quietest = int(np.argmin(np.mean(frames ** 2, axis=1)))
+        split_point = search_start + quietest * frame_length + frame_length // 2
+        split_points.append(split_point)
+        start = split_point
+    return split_points
+
+
+def split_audio(audio_buffer, max_chunk_seconds, overlap_seconds=1.0, output_format="wav", max_chunk_bytes=None):
+    """
+    長い音声を無音付近で区切り、前後を少し重ねた複数のバッファに分割
+    Args:
+        max_chunk_seconds: 1つのチャンクの最大長（秒）
+        overlap_seconds: 隣り合うチャンクを重ねる長さ（秒）
+        max_chunk_bytes: 1つのチャンクの最大バイト数（アップロードの上限。Noneの場合は長さのみで区切る）
+    Returns:
+        音声バッファのリスト（分割不要な場合は元のバッファのみ）
+    """
+    samples, sample_rate = decode_audio(audio_buffer)
+    if max_chunk_bytes is not None:
+        # チャンクは16bit・モノラルのwavの大きさを超えない（圧縮形式はこれより小さい）ため、その大きさで長さを制限
+        max_chunk_seconds = min(
+            max_chunk_seconds, (max_chunk_bytes - WAV_HEADER_BYTES) / (sample_rate * 2) - overlap_seconds
+        )
+    fits = max_chunk_bytes is None or len(audio_buffer.getbuffer()) <= max_chunk_bytes
+    if len(samples) <= sample_rate * max_chunk_seconds and fits:
+        return [audio_buffer]
+
+    mono = samples.mean(axis=1)
+    overlap = int(sample_rate * overlap_seconds)
+    boundaries = [0] + find_split_points(mono, sample_rate, max_chunk_seconds) + [len(mono)]
+
+    base_name = os.path.splitext(audio_buffer.name)[0]
+    chunks = []
+    for index, (start, end) in enumerate(zip(boundaries, boundaries[1:])):
+        chunk_start = max(start - overlap, 0)
+        audio_data, audio_format = encode_audio(mono[chunk_start:end], sample_rate, output_format)
+        chunk = io.BytesIO(audio_data)
+        chunk.name = f"{base_name}_{index:03d}.{audio_format}"
+        chunks.append(chunk)
+    return chunks
+
+
+def merge_transcripts(texts, max_overlap_words=12):
+    """
+    チャンクごとの文字起こし結果を順番に連結し、重ねた区間で重複した単語を取り除く
+    """
+    merged_words = []
+    for text in texts:
+        words = text.split()
+        # 直前の末尾と今回の先頭で一致する最長の単語列を重複とみなす
+        overlap = 0
+        for length in range(min(max_overlap_words, len(merged_words), len(words)), 0, -1):
+            tail = [normalize_overlap_word(word) for word in merged_words[-length:]]
+            head = [normalize_overlap_word(word) for word in words[:length]]
+            if tail == head:
+                overlap = length
+                break
+        merged_words.extend(words[overlap:])
+    return " ".join(merged_words)
+
+
+def normalize_overlap_word(word):
+    """
+    重複判定用に単語の大文字・小文字と前後の句読点をそろえる
+    """
+    return word.strip(".,!?;:\"'()").lower()
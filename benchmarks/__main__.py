@@ -0,0 +1,252 @@
+import argparse
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+# 作業ディレクトリを移動してもアプリのモジュールを読み込めるよう、リポジトリのルートを絶対パスで追加
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.compare import compare_results, flatten_results, format_comparison, load_results, save_results
+from benchmarks.fake_openai import MP3_ENCODING_AVAILABLE, FakeOpenAIConfig, FakeOpenAIServer
+
+DEFAULT_BASELINE_PATH = os.path.join(REPO_ROOT, "benchmarks", "baseline.json")
+
+
+@contextmanager
+def benchmark_environment(args):
+    """
+    ローカルのOpenAI互換サーバーを起動し、アプリがそのサーバーと一時的な作業ディレクトリを使うようにする
+    Returns:
+        (サーバー, 作業ディレクトリ)
+    """
+    config = FakeOpenAIConfig(
+        chat_latency=args.chat_latency,
+        chat_words=args.chat_words,
+        transcription_latency=args.transcription_latency,
+        speech_latency=args.speech_latency,
+        speech_seconds=args.speech_seconds,
+    )
+    server = FakeOpenAIServer(config).start()
+    original_dir = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix="english_conversation_bench_")
+    # アバター画像は作業ディレクトリからの相対パスで参照される
+    shutil.copytree(os.path.join(REPO_ROOT, "images"), os.path.join(work_dir, "images"))
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ["OPENAI_API_KEY"] = "benchmark"
+    try:
+        os.chdir(work_dir)
+        import constants as ct
+        ct.AUDIO_PERSIST_ENABLED = args.persist
+        yield server, work_dir
+    finally:
+        os.chdir(original_dir)
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def get_meta(args, server):
+    return {
+        "created_at": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "persist": args.persist,
+        "mp3_encoding": MP3_ENCODING_AVAILABLE,
+        "config": vars(server.config),
+    }
+
+
+def run_benchmarks(args):
+    """
+    一時ディレクトリ内でモードごとの処理と音声処理を計測
+    """
+    with benchmark_environment(args) as (server, work_dir):
+        import functions as ft
+        quiet_streamlit_logging()
+        from benchmarks.audio import run_audio_benchmarks
+        from benchmarks.pipeline import run_pipeline_benchmarks
+
+        started_at = time.time()
+        results = {
+            "meta": {**get_meta(args, server), "iterations": args.iterations, "speed": args.speed},
+            "pipeline": run_pipeline_benchmarks(ft, work_dir, args.iterations, args.speed, args.input_seconds),
+            "audio": run_audio_benchmarks(ft, work_dir, args.iterations, args.speech_seconds),
+        }
+        results["meta"]["elapsed_seconds"] = time.time() - started_at
+        results["meta"]["fake_server_requests"] = server.requests
+    return results
+
+
+def run_load(args):
+    """
+    一時ディレクトリ内で、同時に利用する人数を増やしながらmain.pyを操作して計測
+    """
+    with benchmark_environment(args) as (server, _):
+        # アプリのモジュール（Streamlitのロガーを含む）を読み込んでから警告を抑制
+        import functions
+        quiet_streamlit_logging()
+        from benchmarks.load_test import run_load_test
+
+        started_at = time.time()
+        results = run_load_test(
+            os.path.join(REPO_ROOT, "main.py"),
+            sorted(args.users),
+            args.turns,
+            (args.think_min, args.think_max),
+            args.input_seconds,
+            args.latency_factor,
+            stop_on_degradation=not args.keep_going,
+        )
+        results["meta"] = {
+            **get_meta(args, server),
+            "turns": args.turns,
+            "think_time": [args.think_min, args.think_max],
+            "elapsed_seconds": time.time() - started_at,
+            "fake_server_requests": server.requests,
+        }
+    return results
+
+
+def run_startup(args):
+    """
+    一時ディレクトリ内で、新しいプロセスでのmain.pyの最初の表示と再実行の処理時間を計測
+    """
+    with benchmark_environment(args) as (server, _):
+        from benchmarks.startup import run_startup_benchmark
+
+        started_at = time.time()
+        results = run_startup_benchmark(os.path.join(REPO_ROOT, "main.py"), args.processes, args.reruns)
+        results["meta"] = {
+            **get_meta(args, server),
+            "elapsed_seconds": time.time() - started_at,
+        }
+    return results
+
+
+def print_summary(results):
+    for group in ("pipeline", "audio"):
+        for name, stages in results[group].items():
+            if "skipped" in stages:
+                print(f"{group}/{name}: skipped ({stages['skipped']})")
+        for path, stats in flatten_results({group: results[group]}).items():
+            print(
+                f"{path:<46} wall {stats['wall_ms']:>9.1f} ms  cpu {stats['cpu_ms']:>9.1f} ms  "
+                f"disk {stats['disk_bytes']:>10} B  peak RSS {(stats['peak_rss_bytes'] or 0) / 2 ** 20:>7.1f} MiB"
+            )
+
+
+def quiet_streamlit_logging():
+    """
+    スクリプト実行外でStreamlitの関数を呼び出した際の警告を抑制
+    """
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+
+def add_environment_arguments(parser):
+    """
+    ローカルのOpenAI互換サーバーの応答時間・応答サイズと、音声入力の設定の引数を追加
+    """
+    parser.add_argument("--input-seconds", type=float, default=4.0, help="音声入力の長さ（秒）")
+    parser.add_argument("--chat-latency", type=float, default=0.3, help="Chat Completions APIの応答時間（秒）")
+    parser.add_argument("--chat-words", type=int, default=15, help="回答の単語数")
+    parser.add_argument("--transcription-latency", type=float, default=0.5, help="文字起こしAPIの応答時間（秒）")
+    parser.add_argument("--speech-latency", type=float, default=0.4, help="音声合成APIの応答時間（秒）")
+    parser.add_argument("--speech-seconds", type=float, default=4.0, help="音声合成の応答音声の長さ（秒）")
+    parser.add_argument("--persist", action="store_true", help="音声ファイルをディスクに保存する設定で計測")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="OpenAI APIを呼ばずに、ローカルの模擬サーバーに対してアプリの処理時間を計測する"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="計測を実行")
+    add_environment_arguments(run_parser)
+    run_parser.add_argument("--iterations", type=int, default=5, help="モード・再生速度ごとの繰り返し回数")
+    run_parser.add_argument("--speed", type=float, default=1.0, help="モードごとの処理で使う再生速度")
+    run_parser.add_argument("--output", help="計測結果のJSONの保存先")
+    run_parser.add_argument("--save-baseline", action="store_true", help="計測結果を基準（baseline.json）として保存")
+    run_parser.add_argument("--compare", metavar="BASELINE", help="計測後に比較する基準のJSON")
+    run_parser.add_argument("--tolerance", type=float, default=0.25, help="回帰とみなす増加率")
+
+    load_parser = subparsers.add_parser("load", help="複数の学習者が同時に利用する場合の負荷試験を実行")
+    add_environment_arguments(load_parser)
+    load_parser.add_argument("--users", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="同時に利用する人数（段階ごと）")
+    load_parser.add_argument("--turns", type=int, default=3, help="学習者1人あたりのターン数（モードを順に切り替える）")
+    load_parser.add_argument("--think-min", type=float, default=1.0, help="操作の間の待ち時間の最小値（秒）")
+    load_parser.add_argument("--think-max", type=float, default=3.0, help="操作の間の待ち時間の最大値（秒）")
+    load_parser.add_argument("--latency-factor", type=float, default=2.0, help="劣化とみなすp95の増加倍率")
+    load_parser.add_argument("--keep-going", action="store_true", help="劣化した後も全ての人数で計測する")
+    load_parser.add_argument("--output", help="計測結果のJSONの保存先")
+
+    startup_parser = subparsers.add_parser("startup", help="起動直後の最初の表示と再実行ごとの処理時間を計測")
+    add_environment_arguments(startup_parser)
+    startup_parser.add_argument("--processes", type=int, default=3, help="新しいプロセスで起動する回数")
+    startup_parser.add_argument("--reruns", type=int, default=10, help="プロセスごとの操作なしの再実行の回数")
+    startup_parser.add_argument("--output", help="計測結果のJSONの保存先")
+
+    check_parser = subparsers.add_parser("check", help="回帰の確認を実行（失敗があれば終了コード1）")
+    check_parser.add_argument("names", nargs="*", help="実行する確認の関数名（省略時はすべて）")
+
+    compare_parser = subparsers.add_parser("compare", help="保存済みの計測結果を比較")
+    compare_parser.add_argument("current", help="今回の計測結果のJSON")
+    compare_parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH, help="基準の計測結果のJSON")
+    compare_parser.add_argument("--tolerance", type=float, default=0.25, help="回帰とみなす増加率")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "check":
+        from benchmarks.checks import format_checks, run_checks
+        results = run_checks(args.names)
+        print(format_checks(results))
+        return 1 if any(error is not None for _, error in results) else 0
+
+    if args.command == "load":
+        results = run_load(args)
+        from benchmarks.load_test import format_load_test
+        print(format_load_test(results))
+        if args.output:
+            save_results(results, args.output)
+        return 0
+
+    if args.command == "startup":
+        results = run_startup(args)
+        from benchmarks.startup import format_startup
+        print(format_startup(results))
+        if args.output:
+            save_results(results, args.output)
+        return 0
+
+    if args.command == "run":
+        results = run_benchmarks(args)
+        print_summary(results)
+        if args.output:
+            save_results(results, args.output)
+        if args.save_baseline:
+            save_results(results, DEFAULT_BASELINE_PATH)
+        if not args.compare:
+            return 0
+        baseline = load_results(args.compare)
+    else:
+        results = load_results(args.current)
+        baseline = load_results(args.baseline)
+
+    rows, regressions = compare_results(baseline, results, args.tolerance)
+    print(format_comparison(rows))
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+import os
+import constants as ct
+from benchmarks.fake_openai import MP3_ENCODING_AVAILABLE, create_speech_payloads
+from benchmarks.measurement import StageRecorder
+from time_stretch import read_wav, write_wav
+
+
+def make_unique_wav(wav_data, number):
+    """
+    速度別の音声の保持領域にヒットしないよう、先頭のサンプルだけを変えたwavデータを作成
+    """
+    samples, sample_rate, sample_width = read_wav(wav_data)
+    samples[0, 0] = number % 30000
+    return write_wav(samples, sample_rate, sample_width)
+
+
+def run_audio_benchmarks(ft, work_dir, iterations, speech_seconds=4.0):
+    """
+    save_to_wavを音声合成の形式ごとに、play_wavを再生速度（PLAY_SPEED_OPTION）ごとに繰り返し実行して計測
+    save_to_wavのmp3はffmpegが利用できる場合のみ計測する
+    play_wavは速度別の音声を事前に作成していない場合（cold）と作成済みの場合（warm）を計測する
+    Args:
+        ft: functionsモジュール
+        work_dir: 音声ファイルを書き込む作業ディレクトリ
+        iterations: 再生速度ごとの繰り返し回数
+        speech_seconds: 音声の長さ（秒）
+    """
+    payloads = create_speech_payloads(speech_seconds)
+    audio_output_dir = os.path.join(work_dir, ct.AUDIO_OUTPUT_DIR)
+    results = {"save_to_wav": {}, "play_wav": {}}
+    number = 0
+
+    recorder = StageRecorder(work_dir)
+    response_formats = ["pcm", "mp3"] if MP3_ENCODING_AVAILABLE else ["pcm"]
+    for response_format in response_formats:
+        for _ in range(iterations):
+            number += 1
+            with recorder.measure(response_format):
+                ft.save_to_wav(
+                    payloads[response_format], os.path.join(audio_output_dir, f"audio_{number:06d}.wav"), response_format
+                )
+    results["save_to_wav"] = recorder.summary()
+
+    for speed in ct.PLAY_SPEED_OPTION:
+        recorder = StageRecorder(work_dir)
+        for _ in range(iterations):
+            number += 1
+            audio_output = ft.create_audio_buffer(make_unique_wav(payloads["wav"], number), f"audio_{number:06d}.wav")
+            with recorder.measure("cold"):
+                ft.play_wav(audio_output, speed)
+            with recorder.measure("warm"):
+                ft.play_wav(audio_output, speed)
+        results["play_wav"][str(speed)] = recorder.summary()
+    return results
@@ -0,0 +1,233 @@
+import traceback
+
+
+def check_alignment_prefers_missing_and_extra():
+    """
+    1語の抜けの後ろの単語が、連鎖的に置き換えと判定されないことを確認
+    """
+    from scoring import score_answer
+
+    result = score_answer("The quick brown fox jumps.", "the quick fox jumped over")
+    assert result["correct"] == ["the", "quick", "fox"], result
+    assert result["missing"] == ["brown"], result
+    assert result["substituted"] == [("jumps", "jumped")], result
+    assert result["extra"] == ["over"], result
+
+
+def check_alignment_keeps_single_substitution():
+    """
+    同じ位置の1語の言い間違いは、抜けと余分ではなく置き換えと判定されることを確認
+    """
+    from scoring import score_answer
+
+    result = score_answer("I like apples.", "I like oranges")
+    assert result["substituted"] == [("apples", "oranges")], result
+    assert result["missing"] == [] and result["extra"] == [], result
+
+
+def check_silent_recording_not_scored():
+    """
+    無音の録音が音響的な採点の対象にならず、発話のある録音は採点されることを確認
+    """
+    import numpy as np
+    from acoustic_scoring import score_shadowing_audio
+
+    sample_rate = 16000
+    t = np.arange(int(sample_rate * 1.5)) / sample_rate
+    reference = (3000 * np.sin(2 * np.pi * 150 * t) * (0.5 + 0.5 * np.sin(2 * np.pi * 3 * t))).astype(np.float32)
+    silence = np.zeros(2 * sample_rate, dtype=np.float32)
+    assert score_shadowing_audio(reference, sample_rate, silence, sample_rate) is None
+    assert score_shadowing_audio(reference, sample_rate, reference.copy(), sample_rate) is not None
+
+
+def check_session_workspaces_isolated(sessions=16, files_per_session=20):
+    """
+    同時に利用する複数のセッションが互いのファイルを上書き・参照せず、
+    セッションの終了（作業ディレクトリの参照がなくなり、ファイナライザが実行された時点）で作業ディレクトリが削除されることを確認
+    """
+    import gc
+    import os
+    import shutil
+    import tempfile
+    import threading
+    from storage import AudioStorageManager, SessionWorkspace
+
+    root = tempfile.mkdtemp(prefix="english_conversation_check_")
+    input_root, output_root = os.path.join(root, "input"), os.path.join(root, "output")
+    storage_manager = AudioStorageManager([input_root, output_root], 2 ** 30, 2 ** 30, 3600)
+    barrier = threading.Barrier(sessions)
+    # セッションID -> (作業ディレクトリ, 作業ディレクトリ内で見つかったファイル)
+    results = {}
+    errors = []
+
+    def run_session(index):
+        try:
+            workspace = SessionWorkspace(f"session-{index}", input_root, output_root, storage_manager)
+            directories = [workspace.input_dir, workspace.output_dir]
+            barrier.wait()
+            written = set()
+            for _ in range(files_per_session):
+                for path in (workspace.input_path(), workspace.output_path("mp3")):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    with open(path, "wb") as f:
+                        f.write(workspace.session_id.encode())
+                    storage_manager.register(path, workspace.session_id)
+                    written.add(path)
+            # 全てのセッションが書き込み終えてから、自分の作業ディレクトリの内容を確認
+            barrier.wait()
+            found = {}
+            for directory in directories:
+                for name in os.listdir(directory):
+                    path = os.path.join(directory, name)
+                    with open(path, "rb") as f:
+                        found[path] = f.read().decode()
+            results[workspace.session_id] = (directories, written, found)
+        except Exception as e:
+            errors.append(e)
+
+    try:
+        threads = [threading.Thread(target=run_session, args=(index,)) for index in range(sessions)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors, errors
+        assert len(results) == sessions, sorted(results)
+
+        for session_id, (_, written, found) in results.items():
+            assert set(found) == written, (session_id, set(found) ^ written)
+            assert set(found.values()) == {session_id}, (session_id, set(found.values()))
+
+        # 作業ディレクトリの参照はスレッド内のみのため、ここではファイナライザが実行済み
+        gc.collect()
+        for session_id, (directories, _, _) in results.items():
+            for directory in directories:
+                assert not os.path.exists(directory), (session_id, directory)
+        storage_manager.sweep()
+        assert storage_manager.usage()["sessions"] == {}, storage_manager.usage()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def check_tts_cache_single_flight(requests=8):
+    """
+    同じテキストの音声合成を同時に要求しても、APIの呼び出し（create_func）が1回だけであることを確認
+    """
+    import shutil
+    import tempfile
+    import threading
+    import time
+    from tts_cache import TTSCache
+
+    cache_dir = tempfile.mkdtemp(prefix="english_conversation_check_")
+    calls = []
+
+    def create():
+        calls.append(threading.get_ident())
+        time.sleep(0.2)
+        return b"audio"
+
+    try:
+        cache = TTSCache(cache_dir, 2 ** 20)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(cache.get_or_create("Hello.", "tts-1", "alloy", "pcm", create)))
+            for _ in range(requests)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(calls) == 1, calls
+        assert results == [b"audio"] * requests, results
+        assert cache.stats()["coalesced"] == requests - 1, cache.stats()
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def check_long_recording_not_scored():
+    """
+    お手本に比べて長すぎる録音は、大きな距離行列を作らずに採点の対象外になることを確認
+    """
+    import numpy as np
+    from acoustic_scoring import MAX_LEARNER_LENGTH_RATIO, score_shadowing_audio
+
+    sample_rate = 16000
+    t = np.arange(int(sample_rate * 1.5)) / sample_rate
+    reference = (3000 * np.sin(2 * np.pi * 150 * t) * (0.5 + 0.5 * np.sin(2 * np.pi * 3 * t))).astype(np.float32)
+    repeats = int(MAX_LEARNER_LENGTH_RATIO) + 1
+    assert score_shadowing_audio(reference, sample_rate, np.tile(reference, repeats), sample_rate) is None
+    assert score_shadowing_audio(reference, sample_rate, np.tile(reference, 2), sample_rate) is not None
+
+
+def check_session_history_shared_key(messages_per_tab=5):
+    """
+    同じセッションのキーを開いた2つのタブが交互にメッセージを追加しても、互いのメッセージを上書きしないことを確認
+    """
+    import os
+    import shutil
+    import tempfile
+    from session_history import SessionHistory, SessionHistoryStore
+
+    root = tempfile.mkdtemp(prefix="english_conversation_check_")
+    try:
+        store = SessionHistoryStore(os.path.join(root, "history.db"))
+        tabs = [SessionHistory(store, "shared", memory_messages=3) for _ in range(2)]
+        expected = []
+        for index in range(messages_per_tab):
+            for tab_index, tab in enumerate(tabs):
+                message = {"role": "user", "content": f"tab{tab_index}-{index}"}
+                tab.append(message)
+                expected.append(message)
+        # 各タブは自分の追加時点までのメッセージを欠けなく参照でき、再読み込みすると全てのメッセージを参照できる
+        for tab in tabs:
+            assert tab[:] == expected[:len(tab)], tab[:]
+            assert tab[-3:] == expected[len(tab) - 3:len(tab)], tab[-3:]
+        assert SessionHistory(store, "shared", memory_messages=3)[:] == expected
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+CHECKS = [
+    check_alignment_prefers_missing_and_extra,
+    check_alignment_keeps_single_substitution,
+    check_silent_recording_not_scored,
+    check_long_recording_not_scored,
+    check_session_workspaces_isolated,
+    check_session_history_shared_key,
+    check_tts_cache_single_flight,
+]
+
+
+def run_checks(names=None):
+    """
+    動作確認（回帰の確認）を実行
+    Args:
+        names: 実行する確認の関数名のリスト（省略時はすべて）
+    Returns:
+        (確認の関数名, 失敗時のエラー内容またはNone) のリスト
+    """
+    results = []
+    for check in CHECKS:
+        if names and check.__name__ not in names:
+            continue
+        try:
+            check()
+            results.append((check.__name__, None))
+        except Exception:
+            results.append((check.__name__, traceback.format_exc()))
+    return results
+
+
+def format_checks(results):
+    """
+    確認結果をテキストに変換
+    """
+    lines = []
+    for name, error in results:
+        lines.append(f"{'ok  ' if error is None else 'FAIL'} {name}")
+        if error is not None:
+            lines.append(error.rstrip())
+    failed = sum(1 for _, error in results if error is not None)
+    lines.append(f"{len(results) - failed} passed, {failed} failed")
+    return "\n".join(lines)
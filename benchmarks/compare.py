@@ -0,0 +1,78 @@
+import json
+
+# 比較する指標と、誤差として扱う差の下限（これ以下の増加は回帰とみなさない）
+COMPARED_METRICS = {
+    "wall_ms": 5.0,
+    "cpu_ms": 5.0,
+    "disk_bytes": 64 * 1024,
+    "peak_rss_bytes": 16 * 1024 * 1024,
+}
+
+
+def load_results(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_results(results, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+def flatten_results(results, prefix=""):
+    """
+    計測結果を "pipeline/MODE_1/transcribe_audio" のようなパスと指標の辞書に変換
+    """
+    flattened = {}
+    for key, value in results.items():
+        if key == "meta" or not isinstance(value, dict):
+            continue
+        path = f"{prefix}/{key}" if prefix else key
+        if "wall_ms" in value:
+            flattened[path] = value
+        else:
+            flattened.update(flatten_results(value, path))
+    return flattened
+
+
+def compare_results(baseline, current, tolerance=0.25):
+    """
+    基準の計測結果と今回の計測結果を比較
+    Args:
+        tolerance: 回帰とみなす増加率（0.25で25%以上の増加）
+    Returns:
+        (比較結果の行のリスト, 回帰した行のリスト)
+    """
+    baseline_stages = flatten_results(baseline)
+    current_stages = flatten_results(current)
+    rows = []
+    regressions = []
+    for path in sorted(set(baseline_stages) & set(current_stages)):
+        for metric, floor in COMPARED_METRICS.items():
+            before = baseline_stages[path].get(metric)
+            after = current_stages[path].get(metric)
+            if before is None or after is None:
+                continue
+            change = (after - before) / before if before else 0.0
+            regressed = after - before > floor and after > before * (1 + tolerance)
+            row = {"stage": path, "metric": metric, "baseline": before, "current": after,
+                   "change": change, "regressed": regressed}
+            rows.append(row)
+            if regressed:
+                regressions.append(row)
+    return rows, regressions
+
+
+def format_comparison(rows):
+    """
+    比較結果を表形式のテキストに変換
+    """
+    lines = [f"{'stage':<45} {'metric':<15} {'baseline':>14} {'current':>14} {'change':>8}"]
+    for row in rows:
+        mark = "  REGRESSION" if row["regressed"] else ""
+        lines.append(
+            f"{row['stage']:<45} {row['metric']:<15} {row['baseline']:>14.1f} {row['current']:>14.1f} "
+            f"{row['change']:>+8.0%}{mark}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,223 @@
+import io
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from time_stretch import write_wav
+
+# pydubとffmpegが利用できる場合のみ、音声合成の応答を本物のmp3にする
+try:
+    from pydub import AudioSegment
+    from pydub.utils import which
+    MP3_ENCODING_AVAILABLE = which("ffmpeg") is not None
+except ImportError:
+    MP3_ENCODING_AVAILABLE = False
+
+# 音声合成APIのpcm形式（24kHz・16bit・モノラル）
+TTS_SAMPLE_RATE = 24000
+
+SENTENCE_WORDS = (
+    "I would love to grab a coffee with you after the meeting if you have time today"
+).split()
+
+
+class FakeOpenAIConfig:
+    """
+    ローカルのOpenAI互換サーバーの応答時間と応答サイズの設定
+    """
+
+    def __init__(self, chat_latency=0.3, chat_words=15, chat_stream_interval=0.02,
+                 transcription_latency=0.5, transcription_text=None,
+                 speech_latency=0.4, speech_seconds=4.0):
+        """
+        Args:
+            chat_latency: Chat Completions APIの応答時間（秒。ストリーミングの場合は最初のチャンクまで）
+            chat_words: 回答の単語数
+            chat_stream_interval: ストリーミング時のチャンクの間隔（秒）
+            transcription_latency: 文字起こしAPIの応答時間（秒）
+            transcription_text: 文字起こし結果（Noneの場合は固定の英文）
+            speech_latency: 音声合成APIの応答時間（秒）
+            speech_seconds: 音声合成の応答音声の長さ（秒）
+        """
+        self.chat_latency = chat_latency
+        self.chat_words = chat_words
+        self.chat_stream_interval = chat_stream_interval
+        self.transcription_latency = transcription_latency
+        self.transcription_text = transcription_text or "I would like to grab a coffee after the meeting today"
+        self.speech_latency = speech_latency
+        self.speech_seconds = speech_seconds
+
+
+def create_tone(seconds, sample_rate):
+    """
+    発話の代わりに使う、音量の変化する合成音（モノラルのfloat配列）を作成
+    """
+    t = np.arange(int(seconds * sample_rate), dtype=np.float32) / sample_rate
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 3 * t)
+    return (8000 * envelope * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def create_speech_payloads(seconds):
+    """
+    音声合成の応答に使う形式ごとの音声データを作成
+    mp3はffmpegが利用できない場合、同じサイズ（128kbps相当）の復号できないデータで代用する
+    """
+    samples = create_tone(seconds, TTS_SAMPLE_RATE)
+    wav_data = write_wav(samples[:, None], TTS_SAMPLE_RATE, 2)
+    payloads = {
+        "wav": wav_data,
+        "pcm": np.clip(samples, -32768, 32767).astype("<i2").tobytes(),
+    }
+    if MP3_ENCODING_AVAILABLE:
+        mp3_buffer = io.BytesIO()
+        AudioSegment.from_wav(io.BytesIO(wav_data)).export(mp3_buffer, format="mp3")
+        payloads["mp3"] = mp3_buffer.getvalue()
+    else:
+        payloads["mp3"] = b"\xff\xfb\x90\x00" + bytes(int(seconds * 16000))
+    return payloads
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """
+    functions.pyが使うOpenAI APIのエンドポイント（chat / audio.transcriptions / audio.speech）を模擬する
+    """
+
+    # 共有クライアントの接続プールが接続を再利用できるようkeep-aliveを有効にする
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        server = self.server
+        server.count_request(self.path, len(body))
+        if self.path.endswith("/chat/completions"):
+            self.handle_chat(json.loads(body))
+        elif self.path.endswith("/audio/transcriptions"):
+            time.sleep(server.config.transcription_latency)
+            self.send_json({"text": server.config.transcription_text})
+        elif self.path.endswith("/audio/speech"):
+            self.handle_speech(json.loads(body))
+        else:
+            self.send_json({"error": {"message": f"unknown path: {self.path}"}}, status=404)
+
+    def send_json(self, payload, status=200):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_chat(self, request):
+        config = self.server.config
+        # 音声合成キャッシュにヒットしないよう、回答ごとに異なる文にする
+        number = next(self.server.response_counter)
+        words = list(itertools.islice(itertools.cycle(SENTENCE_WORDS), config.chat_words))
+        text = " ".join(words) + f" number {number}."
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in request["messages"]) // 4
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(words) + 2,
+            "total_tokens": prompt_tokens + len(words) + 2,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+        time.sleep(config.chat_latency)
+
+        if not request.get("stream"):
+            self.send_json({
+                "id": f"chatcmpl-{number}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request["model"],
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        base = {"id": f"chatcmpl-{number}", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": request["model"]}
+        for index, word in enumerate(text.split(" ")):
+            if index:
+                time.sleep(config.chat_stream_interval)
+            delta = word if index == 0 else f" {word}"
+            self.send_event({**base, "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]})
+        self.send_event({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if request.get("stream_options", {}).get("include_usage"):
+            self.send_event({**base, "choices": [], "usage": usage})
+        self.send_chunk(b"data: [DONE]\n\n")
+        self.send_chunk(b"")
+
+    def send_event(self, payload):
+        self.send_chunk(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+
+    def send_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def handle_speech(self, request):
+        config = self.server.config
+        response_format = request.get("response_format", "mp3")
+        payload = self.server.speech_payloads.get(response_format, self.server.speech_payloads["mp3"])
+        time.sleep(config.speech_latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """
+    ローカルで起動するOpenAI互換のサーバー（ベンチマーク・負荷試験用）
+    """
+
+    daemon_threads = True
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        """
+        Args:
+            config: 応答時間と応答サイズの設定（FakeOpenAIConfig）
+            port: 待ち受けるポート（0の場合は空いているポート）
+        """
+        super().__init__((host, port), FakeOpenAIHandler)
+        self.config = config or FakeOpenAIConfig()
+        self.speech_payloads = create_speech_payloads(self.config.speech_seconds)
+        self.response_counter = itertools.count(1)
+        self._lock = threading.Lock()
+        self.requests = {}
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def count_request(self, path, request_bytes):
+        with self._lock:
+            stats = self.requests.setdefault(path, {"requests": 0, "request_bytes": 0})
+            stats["requests"] += 1
+            stats["request_bytes"] += request_bytes
+
+    def start(self):
+        """
+        別スレッドでリクエストの受け付けを開始
+        """
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
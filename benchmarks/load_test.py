@@ -0,0 +1,276 @@
+import gc
+import random
+import threading
+import time
+from contextlib import contextmanager
+import constants as ct
+from benchmarks.measurement import get_current_rss_bytes
+from benchmarks.pipeline import create_input_audio
+from tracing import percentile
+
+UPLOAD_OPTION = "📁 ファイルアップロード"
+DICTATION_ANSWER = "I would like to grab a coffee after the meeting"
+
+
+@contextmanager
+def concurrent_app_tests():
+    """
+    AppTestを複数のスレッドから同時に実行できるようにする（終了時に元に戻す）
+    AppTestは実行ごとにプロセス全体の状態を書き換えるため、以下の3点を調整する
+    - 実行終了時にRuntimeのインスタンスがNoneに戻され、実行中の他のセッションが失敗する
+      → 実行中の他のセッションには直前のインスタンスを返す
+    - 実行ごとのスクリプトのコンパイルが同時に行われるとCPythonの内部エラーになる
+      → コンパイルを直列化する
+    - 設定（global.appTest）の一時的な上書きが入れ子になり、他のセッションの実行中に元に戻される
+      → 計測中は常に上書きした状態にする
+    """
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1.util import build_mock_config_get_option
+
+    original_instance = Runtime.__dict__["instance"]
+    original_exists = Runtime.__dict__["exists"]
+    original_get_bytecode = ScriptCache.get_bytecode
+    original_get_option = config.get_option
+    last_instance = [None]
+    compile_lock = threading.Lock()
+
+    def instance(cls):
+        if cls._instance is not None:
+            last_instance[0] = cls._instance
+            return cls._instance
+        if last_instance[0] is None:
+            raise RuntimeError("Runtime hasn't been created!")
+        return last_instance[0]
+
+    def exists(cls):
+        return cls._instance is not None or last_instance[0] is not None
+
+    def get_bytecode(self, script_path):
+        with compile_lock:
+            return original_get_bytecode(self, script_path)
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(exists)
+    ScriptCache.get_bytecode = get_bytecode
+    config.get_option = build_mock_config_get_option({"global.appTest": True})
+    try:
+        yield
+    finally:
+        Runtime.instance = original_instance
+        Runtime.exists = original_exists
+        ScriptCache.get_bytecode = original_get_bytecode
+        config.get_option = original_get_option
+
+
+class SimulatedLearner:
+    """
+    AppTestでmain.pyを操作し、1人の学習者として各モードの練習を繰り返す
+    """
+
+    def __init__(self, script_path, input_audio, think_time, seed, timeout=120):
+        """
+        Args:
+            script_path: main.pyのパス
+            input_audio: 音声入力としてアップロードするwavデータ
+            think_time: 操作の間の待ち時間（秒）の (最小, 最大)
+            seed: 待ち時間の乱数のシード
+            timeout: 1回の再実行のタイムアウト（秒）
+        """
+        from streamlit.testing.v1 import AppTest
+        self.app = AppTest.from_file(script_path, default_timeout=timeout)
+        self.input_audio = input_audio
+        self.think_time = think_time
+        self.random = random.Random(seed)
+        # (操作, 再実行にかかった秒数) のリスト
+        self.reruns = []
+        self.errors = []
+        self.turns = 0
+
+    def think(self):
+        time.sleep(self.random.uniform(*self.think_time))
+
+    def rerun(self, action):
+        """
+        スクリプトを再実行して所要時間を記録
+        """
+        start_time = time.perf_counter()
+        self.app.run()
+        self.reruns.append((action, time.perf_counter() - start_time))
+        self.errors.extend(f"{action}: {exception.value}" for exception in self.app.exception)
+
+    def open(self):
+        self.rerun("first_paint")
+
+    def start_mode(self, mode):
+        """
+        モードを選択して「開始」ボタンを押す
+        """
+        self.app.selectbox[1].select(mode)
+        self.rerun("select_mode")
+        self.app.button[0].click()
+        self.rerun("start")
+
+    def answer_by_audio(self):
+        """
+        音声ファイルのアップロードで回答
+        """
+        if self.app.radio[0].value != UPLOAD_OPTION:
+            self.app.radio[0].set_value(UPLOAD_OPTION)
+            self.rerun("select_upload")
+        self.think()
+        self.app.file_uploader[0].upload(f"answer_{self.turns:04d}.wav", self.input_audio, "audio/wav")
+        self.rerun("turn")
+
+    def run_turn(self, mode):
+        """
+        1ターン分の練習（日常英会話は1往復、シャドーイング・ディクテーションは1問）
+        """
+        self.start_mode(mode)
+        if mode == ct.MODE_1:
+            self.answer_by_audio()
+            # 同じ音声で再度処理されないよう、アップロードしたファイルを取り消す
+            self.app.file_uploader[0].set_value(None)
+            self.rerun("clear_upload")
+        elif mode == ct.MODE_2:
+            self.answer_by_audio()
+        else:
+            self.think()
+            self.app.chat_input[0].set_value(DICTATION_ANSWER)
+            self.rerun("turn")
+        self.turns += 1
+
+    def run(self, modes, turns):
+        try:
+            self.open()
+            for number in range(turns):
+                self.think()
+                self.run_turn(modes[number % len(modes)])
+        except Exception as e:
+            self.errors.append(f"{type(e).__name__}: {e}")
+
+
+def summarize_reruns(durations):
+    durations = sorted(durations)
+    return {
+        "count": len(durations),
+        "p50_ms": percentile(durations, 0.50) * 1000,
+        "p95_ms": percentile(durations, 0.95) * 1000,
+        "p99_ms": percentile(durations, 0.99) * 1000,
+    }
+
+
+def run_load_level(script_path, users, turns, think_time, input_audio, modes, seed=0):
+    """
+    指定の人数の学習者を同時に動かし、スループット・再実行の所要時間・セッションあたりのメモリを計測
+    """
+    gc.collect()
+    rss_before = get_current_rss_bytes()
+    learners = [
+        SimulatedLearner(script_path, input_audio, think_time, seed + index)
+        for index in range(users)
+    ]
+    # 学習者ごとに開始するモードをずらす
+    threads = [
+        threading.Thread(
+            target=learner.run, args=(modes[index % len(modes):] + modes[:index % len(modes)], turns),
+            name=f"learner-{index}"
+        )
+        for index, learner in enumerate(learners)
+    ]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start_time
+    gc.collect()
+    rss_after = get_current_rss_bytes()
+
+    reruns = [rerun for learner in learners for rerun in learner.reruns]
+    errors = [error for learner in learners for error in learner.errors]
+    completed_turns = sum(learner.turns for learner in learners)
+    actions = sorted({action for action, _ in reruns})
+    return {
+        "users": users,
+        "elapsed_seconds": elapsed,
+        "turns": completed_turns,
+        "turns_per_second": completed_turns / elapsed,
+        "reruns_per_second": len(reruns) / elapsed,
+        "reruns": summarize_reruns([duration for _, duration in reruns]),
+        "actions": {
+            action: summarize_reruns([duration for name, duration in reruns if name == action])
+            for action in actions
+        },
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "memory_per_session_bytes": max(rss_after - rss_before, 0) / users,
+        "rss_bytes": rss_after,
+    }
+
+
+def find_degradation(levels, latency_factor):
+    """
+    1ターン分の処理（"turn"）のp95が最小人数の時の latency_factor 倍を超えるか、エラーが発生した最初の人数を返す
+    """
+    baseline = levels[0]["actions"].get("turn", levels[0]["reruns"])["p95_ms"]
+    for level in levels:
+        p95 = level["actions"].get("turn", level["reruns"])["p95_ms"]
+        if level["errors"] or p95 > baseline * latency_factor:
+            return level["users"]
+    return None
+
+
+def run_load_test(script_path, user_levels, turns, think_time, input_seconds=4.0,
+                  latency_factor=2.0, modes=None, stop_on_degradation=True):
+    """
+    同時に利用する人数を段階的に増やして計測し、性能が劣化し始める人数を求める
+    Args:
+        script_path: main.pyのパス
+        user_levels: 同時に利用する人数のリスト（昇順）
+        turns: 学習者1人あたりのターン数
+        think_time: 操作の間の待ち時間（秒）の (最小, 最大)
+        latency_factor: 劣化とみなすp95の増加倍率
+    """
+    modes = modes or [ct.MODE_1, ct.MODE_2, ct.MODE_3]
+    input_audio = create_input_audio(input_seconds)
+    levels = []
+    with concurrent_app_tests():
+        # モジュールの読み込みや共有リソースの作成を計測に含めないよう、1人分を事前に実行
+        run_load_level(script_path, 1, len(modes), think_time, input_audio, modes)
+        for users in user_levels:
+            levels.append(run_load_level(script_path, users, turns, think_time, input_audio, modes))
+            degraded_at = find_degradation(levels, latency_factor)
+            if stop_on_degradation and degraded_at is not None:
+                break
+    return {
+        "levels": levels,
+        "latency_factor": latency_factor,
+        "degraded_at_users": find_degradation(levels, latency_factor),
+    }
+
+
+def format_load_test(results):
+    """
+    計測結果を表形式のテキストに変換
+    """
+    lines = [
+        f"{'users':>5} {'turns/s':>8} {'reruns/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'turn p95':>9} {'errors':>6} {'MiB/session':>11}"
+    ]
+    for level in results["levels"]:
+        turn_p95 = level["actions"].get("turn", level["reruns"])["p95_ms"]
+        lines.append(
+            f"{level['users']:>5} {level['turns_per_second']:>8.2f} {level['reruns_per_second']:>9.2f} "
+            f"{level['reruns']['p50_ms']:>8.0f} {level['reruns']['p95_ms']:>8.0f} {level['reruns']['p99_ms']:>8.0f} "
+            f"{turn_p95:>9.0f} {level['errors']:>6} {level['memory_per_session_bytes'] / 2 ** 20:>11.1f}"
+        )
+    if results["degraded_at_users"] is None:
+        lines.append(f"no degradation (turn p95 within {results['latency_factor']}x and no errors)")
+    else:
+        lines.append(
+            f"degraded at {results['degraded_at_users']} users "
+            f"(turn p95 over {results['latency_factor']}x of {results['levels'][0]['users']} user(s), or errors)"
+        )
+    return "\n".join(lines)
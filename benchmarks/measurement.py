@@ -0,0 +1,118 @@
+import os
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+
+# resourceはWindowsでは利用できない（ピークRSSは記録しない）
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    RESOURCE_AVAILABLE = False
+
+
+def read_io_write_bytes():
+    """
+    プロセスがストレージに書き込んだバイト数を取得（/proc/self/ioがない環境ではNone）
+    """
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("write_bytes:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def get_peak_rss_bytes():
+    """
+    プロセスのピークRSS（バイト）を取得
+    """
+    if not RESOURCE_AVAILABLE:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOSはバイト、Linuxはキロバイト単位
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def get_current_rss_bytes():
+    """
+    プロセスの現在のRSS（バイト）を取得（/proc/self/statusがない環境ではピークRSS）
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return get_peak_rss_bytes()
+
+
+def get_directory_bytes(directory):
+    """
+    ディレクトリ以下のファイルの合計バイト数を取得
+    """
+    total = 0
+    for root, _, names in os.walk(directory):
+        for name in names:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class StageRecorder:
+    """
+    処理段階ごとの経過時間・CPU時間・ディスクへの書き込み量・ピークRSSを計測する
+    """
+
+    def __init__(self, work_dir):
+        """
+        Args:
+            work_dir: アプリの音声ファイルを書き込む作業ディレクトリ（増えたバイト数を計測する）
+        """
+        self.work_dir = work_dir
+        self.samples = {}
+
+    @contextmanager
+    def measure(self, stage):
+        io_before = read_io_write_bytes()
+        disk_before = get_directory_bytes(self.work_dir)
+        cpu_before = time.process_time()
+        wall_before = time.perf_counter()
+        yield
+        wall = time.perf_counter() - wall_before
+        cpu = time.process_time() - cpu_before
+        io_after = read_io_write_bytes()
+        self.samples.setdefault(stage, []).append({
+            "wall_ms": wall * 1000,
+            "cpu_ms": cpu * 1000,
+            "io_write_bytes": io_after - io_before if io_before is not None else None,
+            "disk_bytes": get_directory_bytes(self.work_dir) - disk_before,
+            "peak_rss_bytes": get_peak_rss_bytes(),
+        })
+
+    def summary(self):
+        """
+        処理段階ごとに、経過時間・CPU時間は中央値、書き込み量は平均、ピークRSSは最大値にまとめる
+        """
+        return {stage: summarize_samples(samples) for stage, samples in self.samples.items()}
+
+
+def summarize_samples(samples):
+    wall = sorted(sample["wall_ms"] for sample in samples)
+    io_values = [sample["io_write_bytes"] for sample in samples if sample["io_write_bytes"] is not None]
+    rss_values = [sample["peak_rss_bytes"] for sample in samples if sample["peak_rss_bytes"] is not None]
+    return {
+        "iterations": len(samples),
+        "wall_ms": statistics.median(wall),
+        "wall_ms_max": wall[-1],
+        "cpu_ms": statistics.median(sample["cpu_ms"] for sample in samples),
+        "io_write_bytes": int(statistics.mean(io_values)) if io_values else None,
+        "disk_bytes": int(statistics.mean(sample["disk_bytes"] for sample in samples)),
+        "peak_rss_bytes": max(rss_values) if rss_values else None,
+    }
@@ -0,0 +1,96 @@
+import os
+import numpy as np
+import streamlit as st
+import constants as ct
+from benchmarks.fake_openai import create_tone
+from benchmarks.measurement import StageRecorder
+from time_stretch import write_wav
+
+# 音声入力の代わりに使う合成音のサンプリング周波数
+INPUT_SAMPLE_RATE = 44100
+
+
+def create_input_audio(seconds):
+    """
+    録音した音声の代わりに使う、前後に無音を含むステレオのwavデータを作成
+    """
+    silence = np.zeros(INPUT_SAMPLE_RATE // 2, dtype=np.float32)
+    samples = np.concatenate([silence, create_tone(seconds, INPUT_SAMPLE_RATE), silence])
+    return write_wav(np.repeat(samples[:, None], 2, axis=1), INPUT_SAMPLE_RATE, 2)
+
+
+def run_mode_turn(ft, mode, recorder, input_audio, work_dir, number, speed):
+    """
+    1つのモードの1ターン分の処理を、画面描画以外はmain.pyと同じ順番で実行して計測
+    """
+    st.session_state.mode = mode
+    audio_output_file_path = os.path.join(work_dir, ct.AUDIO_OUTPUT_DIR, f"bench_{number:06d}.wav")
+
+    if mode == ct.MODE_1:
+        with recorder.measure("create_audio_buffer"):
+            audio_input = ft.create_audio_buffer(input_audio, f"bench_{number:06d}.wav")
+        with recorder.measure("transcribe_audio"):
+            audio_input_text = ft.transcribe_audio(audio_input).text
+        # main.pyと同じく、回答の生成と文ごとの音声合成・ストリーミング再生を並行して行う
+        with recorder.measure("generate_response_with_speech"):
+            llm_response, llm_response_audio = ft.generate_response_with_speech(
+                ct.SYSTEM_TEMPLATE_BASIC_CONVERSATION, audio_input_text, st.session_state.conversation_history, speed
+            )
+        st.session_state.conversation_history.extend([
+            {"role": "user", "content": audio_input_text},
+            {"role": "assistant", "content": llm_response}
+        ])
+        with recorder.measure("save_to_wav"):
+            audio_output = ft.save_to_wav(llm_response_audio, audio_output_file_path)
+        with recorder.measure("play_wav"):
+            ft.play_wav(audio_output, speed)
+        return
+
+    # シャドーイング・ディクテーション：問題文の生成と再生（事前生成・問題文のバンクは使わずに毎回生成）
+    with recorder.measure("generate_problem"):
+        problem, llm_response_audio = ft.create_problem(
+            ft.get_openai_client(), ft.get_tts_cache(), st.session_state.englv,
+            ft.get_prompt_cache_stats(), ft.get_tracer()
+        )
+    with recorder.measure("save_to_wav"):
+        audio_output = ft.save_to_wav(llm_response_audio, audio_output_file_path)
+    with recorder.measure("play_wav"):
+        ft.play_wav(audio_output, speed)
+
+    if mode == ct.MODE_2:
+        with recorder.measure("create_audio_buffer"):
+            audio_input = ft.create_audio_buffer(input_audio, f"bench_{number:06d}.wav")
+        with recorder.measure("transcribe_audio"):
+            answer = ft.transcribe_audio(audio_input).text
+    else:
+        answer = "I would like to grab coffee after the meeting"
+
+    with recorder.measure("evaluate_answer"):
+        ft.evaluate_answer(problem, answer, st.session_state.englv)
+
+
+def run_pipeline_benchmarks(ft, work_dir, iterations, speed=1.0, input_seconds=4.0, modes=None):
+    """
+    モードごとに1ターン分の処理を繰り返し実行し、処理段階ごとの計測結果を返す
+    Args:
+        ft: functionsモジュール（ローカルのOpenAI互換サーバーを向くよう環境変数を設定してから読み込む）
+        work_dir: 音声ファイルを書き込む作業ディレクトリ
+        iterations: モードごとの繰り返し回数
+        speed: 再生速度
+        input_seconds: 音声入力の長さ（秒）
+    """
+    st.session_state.englv = ct.ENGLISH_LEVEL_OPTION[0]
+    st.session_state.speed = speed
+    st.session_state.conversation_history = ft.create_conversation_memory()
+    input_audio = create_input_audio(input_seconds)
+
+    results = {}
+    number = 0
+    for mode in modes or [ct.MODE_1, ct.MODE_2, ct.MODE_3]:
+        recorder = StageRecorder(work_dir)
+        for _ in range(iterations):
+            number += 1
+            with recorder.measure("turn"):
+                run_mode_turn(ft, mode, recorder, input_audio, work_dir, number, speed)
+        results[ct.TRACE_MODE_LABELS[mode]] = recorder.summary()
+    return results
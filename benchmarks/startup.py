@@ -0,0 +1,139 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+# 最初の画面表示までに読み込まれていないことを確認する、読み込みに時間のかかるモジュール
+DEFERRED_MODULES = ["openai", "numpy", "pydub", "audio_recorder_streamlit"]
+
+
+def measure_process(main_path, reruns):
+    """
+    （新しいプロセスで実行）main.pyの最初の実行と、操作なしの再実行の処理時間を計測
+    AppTest自体の準備・待機時間を除くため、スクリプトの実行部分の時間のみを計測する
+    Streamlitの読み込みはサーバーの起動時に済んでいるため、最初の実行の計測には含めない
+    Args:
+        main_path: main.pyのパス
+        reruns: 再実行の回数
+    Returns:
+        計測結果の辞書（時間はミリ秒）
+    """
+    start_time = time.perf_counter()
+    from streamlit.runtime.scriptrunner import script_runner
+    from streamlit.runtime.scriptrunner_utils.script_run_context import ScriptRunContext
+    from streamlit.testing.v1 import AppTest
+    streamlit_import_ms = (time.perf_counter() - start_time) * 1000
+
+    # スクリプトの実行ごとの (開始時刻, 終了時刻)
+    script_runs = []
+    original_exec = script_runner.exec_func_with_error_handling
+
+    def exec_func_with_error_handling(func, ctx):
+        script_start = time.perf_counter()
+        try:
+            return original_exec(func, ctx)
+        finally:
+            script_runs.append((script_start, time.perf_counter()))
+
+    # 最初の要素がブラウザに送られた時点を最初の画面表示とする
+    first_paint = {}
+    original_enqueue = ScriptRunContext.enqueue
+
+    def enqueue(self, msg):
+        if "time" not in first_paint and msg.HasField("delta"):
+            first_paint["time"] = time.perf_counter()
+            first_paint["modules"] = [name for name in DEFERRED_MODULES if name in sys.modules]
+        return original_enqueue(self, msg)
+
+    script_runner.exec_func_with_error_handling = exec_func_with_error_handling
+    ScriptRunContext.enqueue = enqueue
+    app = AppTest.from_file(main_path, default_timeout=120)
+    app.run()
+    run_start, run_end = script_runs[0]
+
+    # バックグラウンドでのモジュールの読み込みが終わってから再実行を計測
+    preload_start = time.perf_counter()
+    for thread in threading.enumerate():
+        if thread.name == "preload":
+            thread.join()
+    preload_wait_ms = (time.perf_counter() - preload_start) * 1000
+
+    for _ in range(reruns):
+        app.run()
+
+    return {
+        "streamlit_import_ms": streamlit_import_ms,
+        "first_paint_ms": (first_paint.get("time", run_start) - run_start) * 1000,
+        "first_run_ms": (run_end - run_start) * 1000,
+        "preload_wait_ms": preload_wait_ms,
+        "modules_at_first_paint": first_paint.get("modules", []),
+        "rerun_ms": [(end - start) * 1000 for start, end in script_runs[1:]],
+        "exceptions": [str(exception.value) for exception in app.exception],
+    }
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        "mean_ms": statistics.fmean(values) if values else 0.0,
+        "p50_ms": values[len(values) // 2] if values else 0.0,
+        "max_ms": values[-1] if values else 0.0,
+    }
+
+
+def run_startup_benchmark(main_path, processes, reruns):
+    """
+    新しいプロセスでmain.pyを実行し、最初の画面表示までの時間と再実行ごとの処理時間を計測
+    （モジュールの読み込みを含めて計測するため、1回ごとにプロセスを起動し直す）
+    Args:
+        main_path: main.pyのパス
+        processes: プロセスを起動する回数
+        reruns: プロセスごとの再実行の回数
+    """
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [repo_root, os.environ.get("PYTHONPATH")])))
+    samples = []
+    for _ in range(processes):
+        process_start = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, "-m", "benchmarks.startup", main_path, str(reruns)],
+            env=env, capture_output=True, text=True, check=True
+        )
+        sample = json.loads(completed.stdout.strip().splitlines()[-1])
+        sample["process_ms"] = (time.perf_counter() - process_start) * 1000
+        samples.append(sample)
+
+    return {
+        "processes": processes,
+        "reruns": reruns,
+        "process": summarize([sample["process_ms"] for sample in samples]),
+        "streamlit_import": summarize([sample["streamlit_import_ms"] for sample in samples]),
+        "first_paint": summarize([sample["first_paint_ms"] for sample in samples]),
+        "first_run": summarize([sample["first_run_ms"] for sample in samples]),
+        "preload_wait": summarize([sample["preload_wait_ms"] for sample in samples]),
+        "rerun": summarize([value for sample in samples for value in sample["rerun_ms"]]),
+        "modules_at_first_paint": sorted({name for sample in samples for name in sample["modules_at_first_paint"]}),
+        "exceptions": [exception for sample in samples for exception in sample["exceptions"]],
+    }
+
+
+def format_startup(results):
+    """
+    計測結果を表形式のテキストに変換
+    """
+    lines = [f"{'stage':<18} {'mean ms':>9} {'p50 ms':>9} {'max ms':>9}"]
+    for stage in ("process", "streamlit_import", "first_paint", "first_run", "preload_wait", "rerun"):
+        stats = results[stage]
+        lines.append(f"{stage:<18} {stats['mean_ms']:>9.1f} {stats['p50_ms']:>9.1f} {stats['max_ms']:>9.1f}")
+    lines.append(f"loaded at first paint: {', '.join(results['modules_at_first_paint']) or 'none'}")
+    if results["exceptions"]:
+        lines.append(f"exceptions: {results['exceptions']}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # run_startup_benchmarkから起動される計測用のプロセス（最後の行に計測結果のJSONを出力）
+    print(json.dumps(measure_process(sys.argv[1], int(sys.argv[2]))))
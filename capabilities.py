@@ -0,0 +1,100 @@
+import importlib
+import shutil
+import threading
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def has_module(name):
+    """
+    モジュールが利用できるか（実際に読み込んで判定し、結果はプロセスで1回のみ確認）
+    インストール済みでも読み込みに失敗する場合（audioopのないPython 3.13上のpydubなど）は利用できないと判定する
+    """
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        return False
+    return True
+
+
+@lru_cache(maxsize=None)
+def has_command(name):
+    """
+    コマンドがPATH上にあるか（結果はプロセスで1回のみ確認）
+    """
+    return shutil.which(name) is not None
+
+
+def has_pydub():
+    return has_module("pydub")
+
+
+def has_ffmpeg():
+    return has_command("ffmpeg")
+
+
+def has_audio_recorder():
+    return has_module("audio_recorder_streamlit")
+
+
+def can_convert_audio():
+    """
+    wav以外の音声形式の読み込み・変換ができるか（pydubとffmpegの両方が必要）
+    """
+    return has_pydub() and has_ffmpeg()
+
+
+@lru_cache(maxsize=None)
+def load_audio_segment():
+    """
+    pydubのAudioSegmentを初めて使う時に読み込む（can_convert_audio()がTrueの場合のみ呼び出す）
+    """
+    from pydub import AudioSegment
+    return AudioSegment
+
+
+@lru_cache(maxsize=None)
+def load_audio_recorder():
+    """
+    録音コンポーネントを初めて使う時に読み込む（has_audio_recorder()がTrueの場合のみ呼び出す）
+    """
+    from audio_recorder_streamlit import audio_recorder
+    return audio_recorder
+
+
+def get_capabilities():
+    """
+    音声機能の利用可否の一覧を取得
+    """
+    return {
+        "pydub": has_pydub(),
+        "ffmpeg": has_ffmpeg(),
+        "audio_recorder": has_audio_recorder(),
+    }
+
+
+_preload_lock = threading.Lock()
+_preloaded = set()
+
+
+def preload_modules(names):
+    """
+    重いモジュールをバックグラウンドのスレッドで読み込み、最初の画面表示を待たせずに後の処理に備える
+    （読み込み中に同じモジュールをimportした場合は、Pythonのimportロックにより完了を待つ）
+    Args:
+        names: モジュール名のリスト（プロセスで1回のみ読み込みを開始）
+    """
+    with _preload_lock:
+        names = [name for name in names if name not in _preloaded]
+        _preloaded.update(names)
+    if not names:
+        return
+
+    def run():
+        for name in names:
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                pass
+
+    threading.Thread(target=run, name="preload", daemon=True).start()
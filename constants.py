@@ -6,15 +6,126 @@ USER_ICON_PATH = "images/user_icon.jpg"
 AI_ICON_PATH = "images/ai_icon.jpg"
 AUDIO_INPUT_DIR = "audio/input"
 AUDIO_OUTPUT_DIR = "audio/output"
+# 音声入出力をファイルとして保存するか（Falseの場合はメモリ上のみで処理）
+AUDIO_PERSIST_ENABLED = False
+# 保存した音声ファイルの上限（超えた分はバックグラウンドで古いものから削除）
+AUDIO_STORAGE_MAX_BYTES = 500 * 1024 * 1024
+AUDIO_STORAGE_SESSION_MAX_BYTES = 50 * 1024 * 1024
+AUDIO_STORAGE_MAX_AGE_SECONDS = 60 * 60
+AUDIO_STORAGE_SWEEP_INTERVAL_SECONDS = 60
 PLAY_SPEED_OPTION = [2.0, 1.5, 1.2, 1.0, 0.8, 0.6]
 ENGLISH_LEVEL_OPTION = ["初級者", "中級者", "上級者"]
 
+# 全セッションで共有するOpenAIクライアントの設定
+OPENAI_MAX_CONNECTIONS = 100
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = 20
+OPENAI_KEEPALIVE_EXPIRY_SECONDS = 60
+# 429・5xx・タイムアウト時の再試行回数（ジッター付きの指数バックオフ）
+OPENAI_MAX_RETRIES = 3
+# エンドポイントごとのタイムアウト（秒）
+OPENAI_TIMEOUT_CHAT_SECONDS = 30
+OPENAI_TIMEOUT_WHISPER_SECONDS = 120
+OPENAI_TIMEOUT_TTS_SECONDS = 60
+# エンドポイントごとの1分あたりのリクエスト数（rpm）・トークン数（tpm）の上限（アカウントの利用枠に合わせて変更）
+# 全セッションのリクエストをこの上限に収まるように送り、対話中の処理を事前生成・要約などより優先する
+OPENAI_RATE_LIMITS = {
+    "chat": {"rpm": 500, "tpm": 200000},
+    "whisper": {"rpm": 500, "tpm": None},
+    "tts": {"rpm": 500, "tpm": None},
+}
+# エンドポイントごとの送信待ちのリクエスト数の上限（投機的な処理はこの半分で拒否）
+OPENAI_MAX_QUEUED_REQUESTS = 64
+
+# 音声合成（TTS）の設定
+TTS_MODEL = "tts-1"
+TTS_VOICE = "alloy"
+# 音声合成結果の形式
+# "pcm"（推奨）: wavのヘッダーを付けるだけで再生でき、ffmpegが不要（データ量は圧縮形式の約3倍）
+# "mp3" / "aac" / "opus" / "flac": データ量が小さいが、再生速度の変更と音声の比較にはffmpegが必要
+# "wav" / "opus" / "flac" は文ごとの音声を連結できないため、会話の回答は全文の生成後にまとめて音声合成する
+TTS_RESPONSE_FORMAT = "pcm"
+# 音声合成結果のキャッシュ（容量上限を超えると古く使われたものから削除）
+TTS_CACHE_DIR = f"{AUDIO_OUTPUT_DIR}/tts_cache"
+TTS_CACHE_MAX_BYTES = 200 * 1024 * 1024
+# 音声合成の完了を待たず、受信したチャンクから順に再生する
+TTS_STREAMING_ENABLED = True
+TTS_STREAM_CHUNK_BYTES = 4096
+TTS_STREAM_FIRST_FLUSH_BYTES = 8192
+# 回答をトークン単位で表示し、文が完成するたびに音声合成する
+CHAT_STREAMING_ENABLED = True
+TTS_SENTENCE_MIN_CHARS = 20
+TTS_PIPELINE_MAX_WORKERS = 8
+# 選択中の再生速度の音声の事前作成（ピッチを保ったまま速度を変更）
+TIME_STRETCH_MAX_WORKERS = 2
+SPEED_VARIANT_MAX_CLIPS = 32
+# 文字起こし前の音声の前処理（前後の無音の除去、モノラル化、サンプリング周波数の変換）
+TRANSCRIPTION_PREPROCESS_ENABLED = True
+TRANSCRIPTION_SAMPLE_RATE = 16000
+# アップロード形式（"wav" 以外はffmpegが必要。利用できない場合はwavで送信）
+TRANSCRIPTION_UPLOAD_FORMAT = "wav"
+TRANSCRIPTION_VAD_THRESHOLD_DB = -35.0
+# 長い音声は無音付近で分割し、並列で文字起こし
+TRANSCRIPTION_CHUNK_SECONDS = 60
+TRANSCRIPTION_CHUNK_OVERLAP_SECONDS = 1.0
+TRANSCRIPTION_MAX_CONCURRENCY = 8
+# 文字起こしAPIのアップロードの上限（25MB）に余裕を持たせた、1チャンクの最大バイト数
+TRANSCRIPTION_MAX_UPLOAD_BYTES = 24 * 1024 * 1024
+# 会話履歴としてプロンプトに含めるトークン数の上限（超えた古い会話は要約）
+CONVERSATION_TOKEN_BUDGET = 1500
+CONVERSATION_MAX_MESSAGES = 40
+CONVERSATION_SUMMARY_MAX_WORKERS = 2
+# 単語単位の照合による正確さがこの値以上の場合、LLMを使わずに評価結果を作成
+LOCAL_EVALUATION_MIN_ACCURACY = 0.95
+# 次の問題を事前生成するスレッド数（全セッション共有）
+PREFETCH_MAX_WORKERS = 4
+# 処理段階ごとの処理時間の計測
+# トレースのラベルに使うモード名
+TRACE_MODE_LABELS = {MODE_1: "MODE_1", MODE_2: "MODE_2", MODE_3: "MODE_3"}
+# サイドバーに処理時間のp50/p95/p99とプロンプトキャッシュ・評価結果のキャッシュのヒット率を表示するか（管理者向け）
+ADMIN_SIDEBAR_ENABLED = False
+# 計測結果をPrometheusのテキスト形式・JSONでファイルに書き出すか
+METRICS_EXPORT_ENABLED = False
+METRICS_EXPORT_DIR = "metrics"
+METRICS_EXPORT_INTERVAL_SECONDS = 30
+# 画面に表示する直近のメッセージ数（古いメッセージはボタンを押すごとにこの件数ずつ表示）
+CHAT_HISTORY_PAGE_SIZE = 20
+# 問題文のバンク（英語レベル・カテゴリごとに問題文と音声データをSQLiteに保存し、全ユーザーで再利用）
+PROBLEM_BANK_ENABLED = True
+PROBLEM_BANK_PATH = "data/problem_bank.sqlite3"
+# 1回の生成でまとめて作成する問題数
+PROBLEM_BANK_BATCH_SIZE = 10
+# ユーザーに未出題の問題がこの数を下回ったら、バックグラウンドで補充
+PROBLEM_BANK_REFILL_THRESHOLD = 5
+# 画面に表示するメッセージ一覧の保存先（セッションごとにSQLiteに保存し、メモリ上には直近の分のみ保持）
+SESSION_HISTORY_PATH = "data/session_history.sqlite3"
+SESSION_HISTORY_MEMORY_MESSAGES = 40
+# 最後のメッセージからこの秒数が経過したセッションのメッセージ一覧は、起動時に削除
+SESSION_HISTORY_MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+# セッションのキーを保存するURLのクエリパラメータ（サーバーの再起動後に同じURLで開くと復元）
+SESSION_QUERY_PARAM = "session"
+# シャドーイングで、問題文の音声と音声入力の発音・リズムをローカルで比較して表示するか
+ACOUSTIC_SCORING_ENABLED = True
+# LLMによる評価結果のキャッシュ（正規化した問題文・回答・英語レベルが同じ場合に再利用。全セッション共有）
+EVALUATION_CACHE_MAX_ENTRIES = 2000
+EVALUATION_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+# 評価結果のキャッシュをディスクにも保存するか（プロセスの再起動後も再利用）
+EVALUATION_CACHE_PERSIST_ENABLED = False
+EVALUATION_CACHE_PATH = "data/evaluation_cache.sqlite3"
+
 # 英語講師として自由な会話をさせ、文法間違いをさりげなく訂正させるプロンプト
 SYSTEM_TEMPLATE_BASIC_CONVERSATION = """
     You are a conversational English tutor. Engage in a natural and free-flowing conversation with the user. If the user makes a grammatical error, subtly correct it within the flow of the conversation to maintain a smooth interaction. Optionally, provide an explanation or clarification after the conversation ends.
 """
 
-# 約15語のシンプルな英文生成を指示するプロンプト
+# 古い会話を要約させるプロンプト
+SYSTEM_TEMPLATE_CONVERSATION_SUMMARY = """
+    You maintain a running summary of a conversation between an English learner and an English tutor.
+    Merge the current summary with the new conversation into one concise summary of at most 120 words.
+    Keep the topics discussed, facts the learner shared about themselves, and recurring grammar mistakes.
+    Output only the summary.
+"""
+
+# 英語レベルに合わせたシンプルな英文生成を指示するプロンプト
 SYSTEM_TEMPLATE_CREATE_PROBLEM = """
     Generate 1 sentence that reflect natural English used in daily conversations, workplace, and social settings:
     - Casual conversational expressions
@@ -23,33 +134,66 @@ SYSTEM_TEMPLATE_CREATE_PROBLEM = """
     - Sentences with situational nuances and emotions
     - Expressions reflecting cultural and regional contexts
 
-    Limit your response to an English sentence of approximately 15 words with clear and understandable context.
+    Limit your response to one English sentence with clear and understandable context, following the learner level given by the user.
 """
 
-# 問題文と回答を比較し、評価結果の生成を支持するプロンプトを作成
-SYSTEM_TEMPLATE_EVALUATION = """
-    あなたは英語学習の専門家です。
-    以下の「LLMによる問題文」と「ユーザーによる回答文」を比較し、分析してください：
+# 問題文のカテゴリ（問題文のバンクのキー）と、生成時の説明
+PROBLEM_CATEGORIES = {
+    "casual": "Casual conversational expressions",
+    "business": "Polite business language",
+    "friends": "Friendly phrases used among friends",
+    "emotion": "Sentences with situational nuances and emotions",
+    "culture": "Expressions reflecting cultural and regional contexts",
+}
 
-    【LLMによる問題文】
-    問題文：{llm_text}
+# 問題文をまとめて生成させるプロンプト（1行に1問、「カテゴリ: 問題文」の形式）
+SYSTEM_TEMPLATE_CREATE_PROBLEM_BATCH = """
+    Generate sentences that reflect natural English used in daily conversations, workplace, and social settings.
+    Each sentence belongs to one of the following categories:
+""" + "".join(f"    - {category}: {description}\n" for category, description in PROBLEM_CATEGORIES.items()) + """
+    Spread the sentences across the categories, and make every sentence different in topic and structure
+    with clear and understandable context, following the learner level given by the user.
+    Output one sentence per line in the form "category: sentence", without numbering or any other text.
+"""
 
-    【ユーザーによる回答文】
-    回答文：{user_text}
+# 英語レベルごとの問題文の難易度（問題文の生成時にユーザーメッセージとして渡す）
+PROBLEM_LEVEL_GUIDES = {
+    "初級者": "a beginner learner, using basic vocabulary and simple grammar in about 8 to 10 words",
+    "中級者": "an intermediate learner, using everyday vocabulary in about 15 words",
+    "上級者": "an advanced learner, using idiomatic expressions and complex grammar in about 20 words",
+}
 
-    【分析項目】
-    1. 単語の正確性（誤った単語、抜け落ちた単語、追加された単語）
-    2. 文法的な正確性
-    3. 文の完成度
+# 問題文の生成時に渡すユーザーメッセージ（英語レベルのみを含め、システムプロンプトは固定のままにする）
+CREATE_PROBLEM_INPUT_TEMPLATE = "Generate a new sentence for {level_guide}."
+CREATE_PROBLEM_BATCH_INPUT_TEMPLATE = "Generate {count} sentences for {level_guide}."
 
-    フィードバックは以下のフォーマットで日本語で提供してください：
+# 単語単位の照合結果をもとに、アドバイスのみの生成を指示するプロンプト
+SYSTEM_TEMPLATE_EVALUATION_ADVICE = """
+    あなたは英語学習の専門家です。
+    ユーザーメッセージの「LLMによる問題文」と「ユーザーによる回答文」を単語単位で照合した結果をもとに、アドバイスを作成してください。
 
-    【評価】 # ここで改行を入れる
-    ✓ 正確に再現できた部分 # 項目を複数記載
-    △ 改善が必要な部分 # 項目を複数記載
-    
-    【アドバイス】
-    次回の練習のためのポイント
+    照合結果の繰り返しや見出しは不要です。「次回の練習のためのポイント」のみを日本語で簡潔に提供してください。
+    誤った単語については、聞き間違えやすい理由や文法的な観点からの説明を含めてください。
+    説明の難しさと用語は、ユーザーメッセージの「ユーザーの英語レベル」に合わせてください。
 
     ユーザーの努力を認め、前向きな姿勢で次の練習に取り組めるような励ましのコメントを含めてください。
-"""
\ No newline at end of file
+"""
+
+# アドバイスの生成時にユーザーメッセージとして渡す、回答ごとの入力
+# （システムプロンプトを固定の文字列にしてプロンプトキャッシュを効かせるため、可変部分はこちらに含める）
+EVALUATION_ADVICE_INPUT_TEMPLATE = """【ユーザーの英語レベル】
+{level}
+
+【LLMによる問題文】
+問題文：{llm_text}
+
+【ユーザーによる回答文】
+回答文：{user_text}
+
+【照合結果】
+{alignment}
+"""
+
+# 照合結果がほぼ完全一致の場合のアドバイス
+LOCAL_EVALUATION_ADVICE_PERFECT = "完璧です！この調子で、再生速度を上げるなどして練習を続けましょう。"
+LOCAL_EVALUATION_ADVICE_NEAR_PERFECT = "あと一歩で完璧です！△の部分を意識して、もう一度聞いてみましょう。"
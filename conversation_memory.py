@@ -0,0 +1,179 @@
+import threading
+from collections import deque
+
+# tiktokenは任意の依存関係（利用できない場合は文字数から概算）
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+# 1メッセージあたりの役割・区切りのトークン数
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def get_encoding():
+    """
+    トークン数の計測に使うtiktokenのエンコーディングを取得（利用できない場合はNone）
+    """
+    global _encoding, _encoding_loaded
+    with _encoding_lock:
+        if not _encoding_loaded:
+            _encoding_loaded = True
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding("o200k_base")
+            except Exception:
+                _encoding = None
+    return _encoding
+
+
+def count_tokens(text):
+    """
+    テキストのトークン数を計測（tiktokenが利用できない場合は4文字を1トークンとして概算）
+    """
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def count_message_tokens(message):
+    """
+    メッセージ1件分のトークン数を計測
+    """
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+class ConversationMemory:
+    """
+    トークン数の上限に収まるように会話履歴を管理する
+    上限を超えた古い会話はバックグラウンドで要約し、要約と直近の会話だけをプロンプトに含める
+    """
+
+    def __init__(self, token_budget, max_messages, summarize_func=None, executor=None,
+                 summary_prefix="Summary of the earlier conversation:"):
+        """
+        Args:
+            token_budget: プロンプトに含める会話履歴（要約を含む）のトークン数の上限
+            max_messages: メモリ上に保持するメッセージ数の上限
+            summarize_func: (これまでの要約, 要約するメッセージのリスト) を受け取り新しい要約を返す関数
+            executor: 要約を実行するExecutor（Noneの場合は要約せずに古い会話を破棄）
+            summary_prefix: 要約をプロンプトに含める際の前置き
+        """
+        self.token_budget = token_budget
+        self.max_messages = max_messages
+        self.summarize_func = summarize_func
+        self.executor = executor
+        self.summary_prefix = summary_prefix
+        # 要約が即座に完了した場合に備え、コールバック内で再取得できるRLockを使う
+        self._lock = threading.RLock()
+        # (メッセージ, トークン数) のリスト（古い順）
+        self._messages = deque()
+        self.summary = ""
+        self._summary_tokens = 0
+        self._summarizing = False
+        self._total_tokens = 0
+        self.last_stats = {"history_tokens": 0, "prompt_tokens": 0, "saved_tokens": 0}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._messages)
+
+    def extend(self, messages):
+        """
+        会話履歴にメッセージを追加し、上限を超えた場合は古い会話の要約を開始
+        """
+        with self._lock:
+            for message in messages:
+                tokens = count_message_tokens(message)
+                self._messages.append((message, tokens))
+                self._total_tokens += tokens
+            self._schedule_compaction()
+
+    def _stored_tokens(self):
+        return self._summary_tokens + sum(tokens for _, tokens in self._messages)
+
+    def _schedule_compaction(self):
+        """
+        保持している会話がトークン数の上限を超えた場合、直近の会話（上限の半分）を残して古い会話を要約する
+        （ロック取得済みで呼び出す）
+        """
+        if self.executor is None or self.summarize_func is None:
+            # 要約しない場合は上限を超えた古い会話を破棄
+            while len(self._messages) > self.max_messages:
+                self._messages.popleft()
+            return
+
+        if self._summarizing or self._stored_tokens() <= self.token_budget:
+            self._trim_overflow()
+            return
+
+        keep_tokens = 0
+        keep_count = 0
+        for _, tokens in reversed(self._messages):
+            if keep_tokens + tokens > self.token_budget // 2:
+                break
+            keep_tokens += tokens
+            keep_count += 1
+        compact_count = len(self._messages) - keep_count
+        if compact_count <= 0:
+            return
+
+        old_messages = [message for message, _ in list(self._messages)[:compact_count]]
+        self._summarizing = True
+        future = self.executor.submit(self.summarize_func, self.summary, old_messages)
+        future.add_done_callback(lambda f: self._finish_compaction(f, old_messages))
+
+    def _trim_overflow(self):
+        """
+        要約の完了を待つ間もメッセージ数の上限を守る（破棄したメッセージは要約中の範囲に含まれる）
+        （ロック取得済みで呼び出す）
+        """
+        if not self._summarizing:
+            return
+        while len(self._messages) > self.max_messages:
+            self._messages.popleft()
+
+    def _finish_compaction(self, future, old_messages):
+        """
+        要約の完了時に、要約済みの古いメッセージを取り除いて要約を更新
+        """
+        with self._lock:
+            self._summarizing = False
+            try:
+                summary = future.result()
+            except Exception:
+                # 要約に失敗した場合は次にメッセージが追加されたときに再試行
+                return
+            self.summary = summary
+            self._summary_tokens = count_tokens(self.summary_prefix + summary) + MESSAGE_OVERHEAD_TOKENS
+            summarized = {id(message) for message in old_messages}
+            while self._messages and id(self._messages[0][0]) in summarized:
+                self._messages.popleft()
+            if self._stored_tokens() > self.token_budget:
+                self._schedule_compaction()
+
+    def context_messages(self):
+        """
+        プロンプトに含める会話履歴（要約と、上限に収まる直近のメッセージ）を取得
+        """
+        with self._lock:
+            selected = []
+            used_tokens = 0
+            if self.summary:
+                selected.append({"role": "system", "content": f"{self.summary_prefix} {self.summary}"})
+                used_tokens += self._summary_tokens
+            recent = []
+            for message, tokens in reversed(self._messages):
+                if used_tokens + tokens > self.token_budget:
+                    break
+                recent.append(message)
+                used_tokens += tokens
+            selected.extend(reversed(recent))
+
+            # 会話全体をそのまま送った場合と比べて削減できたトークン数
+            self.last_stats = {
+                "history_tokens": self._total_tokens,
+                "prompt_tokens": used_tokens,
+                "saved_tokens": max(self._total_tokens - used_tokens, 0),
+            }
+            return selected
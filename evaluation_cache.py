@@ -0,0 +1,160 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from scoring import normalize_words
+
+
+class EvaluationCache:
+    """
+    評価結果（LLMによるアドバイス）のキャッシュ（全セッションで共有）
+    正規化した (問題文, 回答, 英語レベル) をキーとし、件数上限と有効期限付きでメモリ上に保持する
+    ディスクへの保存を有効にした場合はSQLiteにも保存し、プロセスの再起動後も再利用する
+    同じキーの生成が実行中の場合は、その完了を待って結果を共有する（LLMの呼び出しは1回のみ）
+    """
+
+    def __init__(self, max_entries, ttl_seconds, db_path=None):
+        """
+        Args:
+            max_entries: メモリ上に保持する件数の上限（超えたら古く使われたものから破棄）
+            ttl_seconds: 評価結果の有効期限（秒）
+            db_path: ディスクに保存する場合のSQLiteのデータベースファイルのパス
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # キー -> (評価結果, 有効期限)。先頭ほど古く使われたもの
+        self._entries = OrderedDict()
+        # キー -> 生成中の結果を受け取るFuture
+        self._inflight = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._connection = None
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+            with self._connection:
+                self._connection.execute("PRAGMA journal_mode=WAL")
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS evaluations (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                self._connection.execute("DELETE FROM evaluations WHERE expires_at <= ?", (time.time(),))
+
+    @staticmethod
+    def make_key(problem, answer, level, prompt_version=""):
+        """
+        キャッシュキー（SHA-256）を作成（大文字・小文字、句読点、短縮形、数字の表記ゆれは同じキーになる）
+        Args:
+            prompt_version: プロンプトの版（プロンプトの変更後は別のキーになる）
+        """
+        payload = "\x1f".join([
+            prompt_version, level or "", " ".join(normalize_words(problem)), " ".join(normalize_words(answer))
+        ])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _get_locked(self, key, now):
+        """
+        メモリ上・ディスク上の評価結果を取得（ロック取得済みで呼び出す。存在しない場合はNone）
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+
+        if self._connection is not None:
+            row = self._connection.execute(
+                "SELECT value, expires_at FROM evaluations WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is not None:
+                self._put_locked(key, row[0], row[1])
+                self.disk_hits += 1
+                return row[0]
+        return None
+
+    def _put_locked(self, key, value, expires_at):
+        """
+        評価結果をメモリ上に保持し、件数上限を超えた分を破棄（ロック取得済みで呼び出す）
+        """
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_create(self, key, create_func):
+        """
+        評価結果を取得し、存在しない場合は create_func で作成して保持
+        同じキーの作成が実行中の場合は、その完了を待って同じ結果を返す
+        """
+        with self._lock:
+            value = self._get_locked(key, time.time())
+            if value is not None:
+                return value
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            value = future.result()
+            if value is None:
+                # 実行中の生成が失敗・中断された場合は、改めて作成する
+                return self.get_or_create(key, create_func)
+            return value
+
+        try:
+            value = create_func()
+        except BaseException:
+            with self._lock:
+                del self._inflight[key]
+            future.set_result(None)
+            raise
+
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._put_locked(key, value, expires_at)
+            if self._connection is not None:
+                with self._connection:
+                    self._connection.execute(
+                        "INSERT OR REPLACE INTO evaluations (key, value, expires_at) VALUES (?, ?, ?)",
+                        (key, value, expires_at)
+                    )
+            del self._inflight[key]
+        future.set_result(value)
+        return value
+
+    def snapshot(self):
+        """
+        ヒット率などの統計情報を取得
+        ヒットにはメモリ上・ディスク上の結果の利用と、実行中の生成の結果の共有を含める
+        """
+        with self._lock:
+            hits = self.hits + self.disk_hits + self.coalesced
+            requests = hits + self.misses
+            return {
+                "requests": requests,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "coalesced": self.coalesced,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "hit_rate": hits / requests if requests else 0.0,
+            }
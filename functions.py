@@ -1,36 +1,556 @@
 import streamlit as st
 import os
-import time
-from pathlib import Path
-import wave
-import numpy as np
-
-# 音声録音ライブラリを条件付きインポート
-try:
-    from audio_recorder_streamlit import audio_recorder
-    AUDIOREC_AVAILABLE = True
-except ImportError:
-    st.warning("audio_recorder_streamlit が利用できません。音声録音機能が制限されます。")
-    AUDIOREC_AVAILABLE = False
-
-# pydubを条件付きインポート
-try:
-    from pydub import AudioSegment
-    from pydub.utils import which
-    PYDUB_AVAILABLE = True
-    
-    # ffmpegの可用性をチェック
-    if not which("ffmpeg"):
-        st.warning("ffmpegが見つかりません。一部の音声機能が制限される可能性があります。")
-except ImportError:
-    st.warning("pydubが利用できません。音声変換機能が制限されます。")
-    PYDUB_AVAILABLE = False
+import io
+import hashlib
+import re
+import uuid
+import functools
+import multiprocessing
+
+# 録音コンポーネント・pydub・ffmpegの利用可否はプロセスで1回のみ、必要になった時点で確認する（モジュールは確認時に読み込む）
+# （numpyを使う音声処理のモジュールとOpenAI SDKも、必要になった時点で読み込む）
+from capabilities import (
+    can_convert_audio, has_audio_recorder, has_ffmpeg, has_pydub, load_audio_recorder, load_audio_segment,
+    preload_modules
+)
+
+# フラグメント（画面の一部のみの再実行）はStreamlit 1.37以降で利用可能
+# 利用できない場合は通常の関数として実行（操作のたびに画面全体を再実行）
+if hasattr(st, "fragment"):
+    fragment = st.fragment
+elif hasattr(st, "experimental_fragment"):
+    fragment = st.experimental_fragment
+else:
+    def fragment(func):
+        return func
 # Streamlit and core libraries only - no langchain
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import constants as ct
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from openai_client import OpenAIClientStats, PromptCacheStats, create_openai_client
+from tts_cache import TTSCache
+from request_scheduler import SPECULATIVE, RequestScheduler, request_priority
+from evaluation_cache import EvaluationCache
+from session_history import SessionHistory, SessionHistoryStore
+from problem_bank import DEFAULT_CATEGORY, ProblemBank, normalize_problem_text, parse_problem_batch
+from tracing import TraceStore
+from conversation_memory import ConversationMemory
+from storage import AudioStorageManager, SessionWorkspace
+from scoring import format_alignment, format_evaluation, score_answer
+from streaming_audio import (
+    SentenceBuffer, StreamingAudioPlayer, can_concatenate, is_streaming_supported, pcm_to_wav, stream_speech
+)
+
+# 最初の画面表示の後にバックグラウンドで読み込んでおくモジュール
+PRELOAD_MODULES = ["openai", "audio_processing", "acoustic_scoring", "time_stretch"]
+
+@st.cache_resource
+def get_openai_client_stats():
+    """
+    共有OpenAIクライアントのリクエスト・接続プールの集計を取得
+    """
+    return OpenAIClientStats()
+
+@st.cache_resource
+def get_openai_client():
+    """
+    全セッションで共有するOpenAIクライアントを取得（接続プールとkeep-aliveを共有し、429・5xxは再試行）
+    """
+    return create_openai_client(
+        os.environ["OPENAI_API_KEY"],
+        get_openai_client_stats(),
+        max_connections=ct.OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=ct.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=ct.OPENAI_KEEPALIVE_EXPIRY_SECONDS,
+        max_retries=ct.OPENAI_MAX_RETRIES,
+        scheduler=get_request_scheduler()
+    )
+
+@st.cache_resource
+def get_request_scheduler():
+    """
+    OpenAI APIのリクエストの流量制御を取得（全セッションで共有）
+    """
+    return RequestScheduler(ct.OPENAI_RATE_LIMITS, ct.OPENAI_MAX_QUEUED_REQUESTS, trace_store=get_trace_store())
+
+def run_speculative(func, *args):
+    """
+    投機的な処理（事前生成・要約など）として実行し、OpenAI APIのリクエストを対話中の処理より後に送る
+    """
+    with request_priority(SPECULATIVE):
+        return func(*args)
+
+@st.cache_resource
+def get_prompt_cache_stats():
+    """
+    プロンプトキャッシュのヒット状況の集計を取得（全セッションで共有）
+    """
+    return PromptCacheStats()
+
+@st.cache_resource
+def get_trace_store():
+    """
+    処理段階ごとの処理時間の集計を取得し、設定が有効な場合はファイルへの定期的な書き出しを開始（全セッションで共有）
+    """
+    trace_store = TraceStore()
+    if ct.METRICS_EXPORT_ENABLED:
+        trace_store.start_export(ct.METRICS_EXPORT_DIR, ct.METRICS_EXPORT_INTERVAL_SECONDS)
+    return trace_store
+
+@st.cache_resource
+def get_tts_cache():
+    """
+    音声合成キャッシュを取得（全セッションで共有）
+    """
+    return TTSCache(ct.TTS_CACHE_DIR, ct.TTS_CACHE_MAX_BYTES)
+
+@st.cache_resource
+def get_storage_manager():
+    """
+    音声ファイルの保存領域の管理を取得し、掃除スレッドを開始（全セッションで共有）
+    """
+    storage_manager = AudioStorageManager(
+        [ct.AUDIO_INPUT_DIR, ct.AUDIO_OUTPUT_DIR],
+        max_total_bytes=ct.AUDIO_STORAGE_MAX_BYTES,
+        max_session_bytes=ct.AUDIO_STORAGE_SESSION_MAX_BYTES,
+        max_age_seconds=ct.AUDIO_STORAGE_MAX_AGE_SECONDS,
+        sweep_interval_seconds=ct.AUDIO_STORAGE_SWEEP_INTERVAL_SECONDS,
+        excluded_directories=[ct.TTS_CACHE_DIR]
+    )
+    storage_manager.start()
+    return storage_manager
+
+@st.cache_resource
+def get_prefetch_executor():
+    """
+    問題の事前生成用スレッドプールを取得（全セッションで共有）
+    """
+    return ThreadPoolExecutor(max_workers=ct.PREFETCH_MAX_WORKERS, thread_name_prefix="prefetch")
+
+@st.cache_resource
+def get_problem_bank():
+    """
+    問題文のバンクを取得（全セッションで共有）
+    """
+    return ProblemBank(ct.PROBLEM_BANK_PATH)
+
+@st.cache_resource
+def get_evaluation_cache():
+    """
+    評価結果のキャッシュを取得（全セッションで共有）
+    """
+    return EvaluationCache(
+        ct.EVALUATION_CACHE_MAX_ENTRIES,
+        ct.EVALUATION_CACHE_TTL_SECONDS,
+        ct.EVALUATION_CACHE_PATH if ct.EVALUATION_CACHE_PERSIST_ENABLED else None
+    )
+
+@st.cache_resource
+def get_session_history_store():
+    """
+    メッセージ一覧の保存先を取得（全セッションで共有）
+    """
+    return SessionHistoryStore(ct.SESSION_HISTORY_PATH, ct.SESSION_HISTORY_MAX_AGE_SECONDS)
+
+@st.cache_resource
+def get_speed_variant_store():
+    """
+    再生速度ごとの音声の保持領域を取得（全セッションで共有）
+    """
+    from time_stretch import SpeedVariantStore
+
+    executor = ProcessPoolExecutor(
+        max_workers=ct.TIME_STRETCH_MAX_WORKERS,
+        mp_context=multiprocessing.get_context("spawn")
+    )
+    return SpeedVariantStore(executor, ct.SPEED_VARIANT_MAX_CLIPS)
+
+@st.cache_resource
+def get_transcription_executor():
+    """
+    長い音声のチャンクを並列で文字起こしするスレッドプールを取得（全セッションで共有）
+    """
+    return ThreadPoolExecutor(max_workers=ct.TRANSCRIPTION_MAX_CONCURRENCY, thread_name_prefix="transcribe")
+
+@st.cache_resource
+def get_summary_executor():
+    """
+    会話履歴の要約用スレッドプールを取得（全セッションで共有）
+    """
+    return ThreadPoolExecutor(max_workers=ct.CONVERSATION_SUMMARY_MAX_WORKERS, thread_name_prefix="summary")
+
+@st.cache_resource
+def get_tts_executor():
+    """
+    文単位の音声合成用スレッドプールを取得（全セッションで共有）
+    """
+    return ThreadPoolExecutor(max_workers=ct.TTS_PIPELINE_MAX_WORKERS, thread_name_prefix="tts")
+
+def get_trace_labels():
+    """
+    現在のセッションのモード・英語レベル・再生速度をトレースのラベルとして取得
+    """
+    return {
+        "mode": ct.TRACE_MODE_LABELS.get(st.session_state.get("mode"), "none"),
+        "level": str(st.session_state.get("englv", "none")),
+        "speed": str(st.session_state.get("speed", "none")),
+    }
+
+def get_tracer():
+    """
+    現在のセッションのラベルを付けてスパンを記録するTracerを取得
+    （バックグラウンドスレッドにはメインスレッドで取得したTracerを渡す）
+    """
+    return get_trace_store().bind(get_trace_labels())
+
+def trace_stage(stage):
+    """
+    関数の処理時間を、現在のセッションのラベルを付けて記録するデコレーター
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_tracer().span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def display_latency_stats():
+    """
+    処理段階ごとの処理時間のp50/p95/p99を表示し、Prometheusのテキスト形式・JSONでダウンロードできるようにする
+    """
+    trace_store = get_trace_store()
+    st.markdown("**処理時間（ms）**")
+    summary = trace_store.summary()
+    if not summary:
+        st.caption("まだ計測結果がありません")
+    else:
+        st.dataframe(
+            [
+                {
+                    "stage": stage,
+                    "count": stats["count"],
+                    "p50": round(stats["p50"] * 1000),
+                    "p95": round(stats["p95"] * 1000),
+                    "p99": round(stats["p99"] * 1000),
+                }
+                for stage, stats in summary.items()
+            ],
+            hide_index=True,
+            use_container_width=True
+        )
+    st.download_button("Prometheus形式", trace_store.to_prometheus(), file_name="metrics.prom", mime="text/plain")
+    st.download_button("JSON形式", trace_store.to_json(), file_name="metrics.json", mime="application/json")
+
+def display_prompt_cache_stats():
+    """
+    プロンプトキャッシュのヒット率（キャッシュされたトークン数 / プロンプトのトークン数）をプロンプトごとに表示
+    """
+    snapshot = get_prompt_cache_stats().snapshot()
+    st.markdown("**プロンプトキャッシュ**")
+    total = snapshot["total"]
+    st.metric("ヒット率", f"{total['hit_rate']:.0%}", help=f"{total['cached_tokens']}/{total['prompt_tokens']} tokens")
+    for name, stats in sorted(snapshot["prompts"].items()):
+        st.caption(
+            f"{name}: {stats['hit_rate']:.0%}（{stats['cached_tokens']}/{stats['prompt_tokens']} tokens, "
+            f"{stats['cached_requests']}/{stats['requests']} requests）"
+        )
+
+def display_evaluation_cache_stats():
+    """
+    評価結果のキャッシュのヒット率を表示
+    """
+    snapshot = get_evaluation_cache().snapshot()
+    st.markdown("**評価結果のキャッシュ**")
+    st.metric("ヒット率", f"{snapshot['hit_rate']:.0%}", help=f"{snapshot['requests']} requests")
+    st.caption(
+        f"メモリ {snapshot['hits']}・ディスク {snapshot['disk_hits']}・同時リクエストの共有 {snapshot['coalesced']}・"
+        f"生成 {snapshot['misses']}（保持 {snapshot['entries']}件、破棄 {snapshot['evictions']}件）"
+    )
+
+def display_tts_cache_stats():
+    """
+    音声合成キャッシュのヒット率と、キャッシュによって削減できた時間・文字数の推計を表示
+    """
+    stats = get_tts_cache().stats()
+    st.markdown("**音声合成キャッシュ**")
+    st.metric("ヒット率", f"{stats['hit_rate']:.0%}", help=f"{stats['hits'] + stats['misses']} requests")
+    st.caption(
+        f"削減 {stats['saved_seconds']:.1f}秒・{stats['saved_characters']}文字・同時リクエストの共有 {stats['coalesced']}"
+        f"（保持 {stats['entries']}件、{stats['total_bytes'] / 2 ** 20:.1f}/{stats['max_bytes'] / 2 ** 20:.0f}MiB、破棄 {stats['evictions']}件）"
+    )
+
+def display_audio_storage_usage():
+    """
+    音声ファイルの保存領域の使用量（直近の掃除時点）と、これまでに削除した量を表示
+    """
+    usage = get_storage_manager().usage()
+    st.markdown("**音声ファイルの保存領域**")
+    st.caption(
+        f"{usage['total_bytes'] / 2 ** 20:.1f}/{usage['max_total_bytes'] / 2 ** 20:.0f}MiB・{usage['files']}ファイル・"
+        f"{len(usage['sessions'])}セッション（削除 {usage['deleted_files']}ファイル、{usage['deleted_bytes'] / 2 ** 20:.1f}MiB）"
+    )
+    if usage["sessions"]:
+        st.caption(
+            f"セッションごとの最大 {max(usage['sessions'].values()) / 2 ** 20:.1f}/"
+            f"{usage['max_session_bytes'] / 2 ** 20:.0f}MiB"
+        )
+
+def display_conversation_memory_stats():
+    """
+    現在のセッションの直近のプロンプトに含めた会話履歴のトークン数と、要約によって削減できたトークン数を表示
+    """
+    conversation_history = st.session_state.get("conversation_history")
+    if conversation_history is None:
+        return
+    stats = conversation_history.last_stats
+    st.markdown("**会話履歴**")
+    st.caption(
+        f"{len(conversation_history)}件・プロンプト {stats['prompt_tokens']}/{conversation_history.token_budget} tokens"
+        f"（会話全体 {stats['history_tokens']} tokens、削減 {stats['saved_tokens']} tokens）"
+    )
+
+def display_audio_preprocess_stats():
+    """
+    現在のセッションの直近の文字起こしで、前処理（無音の除去・モノラル化・リサンプリング）によって削減できた量を表示
+    """
+    stats = st.session_state.get("audio_preprocess_stats")
+    if stats is None:
+        return
+    st.markdown("**文字起こしの前処理**")
+    st.caption(
+        f"{stats['bytes_before'] / 1024:.0f}KB → {stats['bytes_after'] / 1024:.0f}KB・"
+        f"{stats['seconds_before']:.1f}秒 → {stats['seconds_after']:.1f}秒（処理 {stats['processing_ms']:.0f}ms）"
+    )
+
+def display_request_scheduler_stats():
+    """
+    OpenAI APIのエンドポイント・優先度ごとの送信待ちの状況を表示
+    """
+    st.markdown("**APIの送信待ち**")
+    for endpoint, stats in get_request_scheduler().snapshot().items():
+        st.caption(f"{endpoint}: 待ち {stats['queue_depth']}件")
+        for priority, values in stats["priorities"].items():
+            st.caption(
+                f"　{priority}: p50 {values['p50_wait'] * 1000:.0f}ms・p95 {values['p95_wait'] * 1000:.0f}ms・"
+                f"最大 {values['max_wait'] * 1000:.0f}ms（{values['requests']}件、拒否 {values['rejected']}件）"
+            )
+
+def display_openai_client_stats():
+    """
+    共有OpenAIクライアントの接続プールの状態と、エンドポイントごとのリクエスト数・再試行対象の応答数を表示
+    """
+    snapshot = get_openai_client_stats().snapshot()
+    st.markdown("**OpenAIクライアント**")
+    pool = snapshot["pool"]
+    st.caption(f"送信中 {snapshot['in_flight']}件・接続 {pool['connections']}（待機中 {pool['idle_connections']}）")
+    for endpoint, stats in sorted(snapshot["endpoints"].items()):
+        average_ms = stats["total_seconds"] / stats["requests"] * 1000 if stats["requests"] else 0.0
+        st.caption(
+            f"{endpoint}: {stats['requests']}件・平均 {average_ms:.0f}ms・"
+            f"エラー {stats['errors']}件（再試行対象 {stats['retryable']}件）"
+        )
+
+def create_audio_buffer(audio_data, name):
+    """
+    音声データをファイル名付きのメモリ上のバッファに変換
+    Args:
+        audio_data: 音声データ（bytes / memoryview）
+        name: 形式判定やWhisperへのアップロードに使うファイル名
+    """
+    audio_buffer = io.BytesIO(audio_data)
+    audio_buffer.name = os.path.basename(name)
+    return audio_buffer
+
+def create_speech_buffer(speech_audio, audio_file_path, response_format=None):
+    """
+    音声合成の結果をファイル名付きのバッファに変換（pcm形式はwavのヘッダーを付けてwav形式にする）
+    Args:
+        speech_audio: 音声合成の結果
+        audio_file_path: ファイル名の基にするパス（拡張子は音声データの形式に合わせて付け替える）
+        response_format: 音声データの形式（省略時はTTS_RESPONSE_FORMAT）
+    """
+    response_format = response_format or ct.TTS_RESPONSE_FORMAT
+    base_path = os.path.splitext(audio_file_path)[0]
+    if response_format == "pcm":
+        return create_audio_buffer(pcm_to_wav(speech_audio), f"{base_path}.wav")
+    return create_audio_buffer(speech_audio, f"{base_path}.{response_format}")
+
+# 拡張子とStreamlitの音声プレーヤー用の形式の対応（音声合成APIのopus形式はOggコンテナ）
+AUDIO_MIME_TYPES = {
+    "mp3": "audio/mp3",
+    "opus": "audio/ogg",
+    "aac": "audio/aac",
+    "flac": "audio/flac",
+    "wav": "audio/wav",
+}
+# pydub（ffmpeg）で読み込む際の形式名が拡張子と異なるもの
+PYDUB_FORMATS = {
+    "opus": "ogg",
+}
+
+def get_audio_format(audio_buffer):
+    """
+    バッファのファイル名からStreamlitの音声プレーヤー用の形式を判定
+    """
+    extension = os.path.splitext(audio_buffer.name)[1].lstrip(".").lower()
+    return AUDIO_MIME_TYPES.get(extension, f"audio/{extension}")
+
+def decode_to_wav(audio_buffer):
+    """
+    圧縮形式の音声バッファをpydub（ffmpeg）でwav形式のバイト列に変換
+    """
+    extension = os.path.splitext(audio_buffer.name)[1].lstrip(".").lower()
+    audio_wav = io.BytesIO()
+    load_audio_segment().from_file(
+        io.BytesIO(audio_buffer.getvalue()), format=PYDUB_FORMATS.get(extension, extension)
+    ).export(audio_wav, format="wav")
+    return audio_wav.getvalue()
+
+def persist_audio(audio_buffer, audio_file_path):
+    """
+    音声の保存設定が有効な場合のみ、バッファの内容をファイルに保存
+    """
+    if not ct.AUDIO_PERSIST_ENABLED:
+        return
+    os.makedirs(os.path.dirname(audio_file_path), exist_ok=True)
+    with open(audio_file_path, "wb") as f:
+        f.write(audio_buffer.getbuffer())
+    # 保存領域の容量管理のため、セッションに紐づけて登録
+    get_storage_manager().register(audio_file_path, get_session_id())
+
+def get_session_id():
+    """
+    現在のStreamlitセッションのIDを取得（スクリプト実行中でない場合はNone）
+    """
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
+
+def create_session_workspace():
+    """
+    現在のセッション専用の音声ファイルの作業ディレクトリを作成
+    """
+    return SessionWorkspace(get_session_id(), ct.AUDIO_INPUT_DIR, ct.AUDIO_OUTPUT_DIR, get_storage_manager())
+
+@functools.lru_cache(maxsize=None)
+def prepare_directories():
+    """
+    必要なディレクトリを作成（プロセスで1回のみ。再実行のたびには確認しない）
+    """
+    os.makedirs(ct.AUDIO_INPUT_DIR, exist_ok=True)
+    os.makedirs(ct.AUDIO_OUTPUT_DIR, exist_ok=True)
+    os.makedirs("images", exist_ok=True)
+
+def display_capability_warnings():
+    """
+    音声機能に必要なライブラリ・コマンドが利用できない場合に警告を表示
+    pydub・ffmpegは、音声合成・アップロードに圧縮形式を設定している場合のみ必要
+    （利用可否の確認でモジュールを読み込むため、不要な場合はpydubを確認しない）
+    """
+    if not has_audio_recorder():
+        st.warning("audio_recorder_streamlit が利用できません。音声録音機能が制限されます。")
+    if ct.TTS_RESPONSE_FORMAT in ("pcm", "wav") and ct.TRANSCRIPTION_UPLOAD_FORMAT == "wav":
+        return
+    if not has_pydub():
+        st.warning("pydubが利用できません。音声変換機能が制限されます。")
+    elif not has_ffmpeg():
+        st.warning("ffmpegが見つかりません。一部の音声機能が制限される可能性があります。")
+
+@functools.lru_cache(maxsize=None)
+def get_avatar_path(icon_path):
+    """
+    アイコンファイルが存在する場合はそのパス、存在しない場合はNoneを返す（Streamlitのデフォルトアバターを使用）
+    再実行やメッセージごとにファイルの存在を確認しないよう、プロセスで1回のみ判定
+    """
+    if os.path.exists(icon_path):
+        return icon_path
+    return None
+
+def is_fragment_run():
+    """
+    画面の一部（フラグメント）のみを再実行しているかどうか
+    """
+    ctx = get_script_run_ctx()
+    return bool(ctx is not None and getattr(ctx, "fragment_ids_this_run", None))
 
-def record_audio(audio_input_file_path):
+def get_session_key():
     """
-    音声入力を受け取って音声ファイルを作成（録音機能付き）
+    メッセージ一覧の保存に使うセッションのキーを、URLのクエリパラメータから取得（ない場合は作成して設定）
+    サーバーの再起動後も、同じURLで開き直せば同じキーになる
+    """
+    session_key = st.query_params.get(ct.SESSION_QUERY_PARAM, "")
+    if not re.fullmatch(r"[0-9a-f]{32}", session_key):
+        session_key = uuid.uuid4().hex
+        st.query_params[ct.SESSION_QUERY_PARAM] = session_key
+    return session_key
+
+def create_session_history():
+    """
+    現在のセッションのメッセージ一覧を作成（保存済みのメッセージがあれば復元）
+    """
+    return SessionHistory(get_session_history_store(), get_session_key(), ct.SESSION_HISTORY_MEMORY_MESSAGES)
+
+def get_clip_id(audio_data):
+    """
+    音声データの内容から、速度別の音声を保持するためのクリップIDを作成
+    """
+    return hashlib.sha1(audio_data).hexdigest()
+
+def get_audio_input(audio_input_file_path, keep_open=False):
+    """
+    音声入力を取得（入力の受け付け中は、入力欄のみをフラグメントとして再実行する）
+    Args:
+        audio_input_file_path: 音声の保存設定が有効な場合の保存先パス
+        keep_open: 音声入力を受け取った後、次の入力欄を続けて表示するか
+    Returns:
+        音声入力のバッファ（音声入力が完了していない場合はNone）
+    """
+    # 入力欄のフラグメントで受け取った音声入力（この実行では入力欄を描画していない）
+    audio_input = st.session_state.pop("pending_audio_input", None)
+    rendered = audio_input is None
+    if rendered:
+        audio_input_fragment(audio_input_file_path, get_audio_input_key())
+        audio_input = st.session_state.pop("pending_audio_input", None)
+    if audio_input is None:
+        return None
+
+    # 次の入力では新しい入力欄を表示（同じ音声が再度処理されないようにする）
+    st.session_state.audio_input_count += 1
+    if keep_open and not rendered:
+        audio_input_fragment(audio_input_file_path, get_audio_input_key())
+    return audio_input
+
+def get_audio_input_key():
+    """
+    入力欄のウィジェットのキー（音声入力を受け取るたびに変わる）
+    """
+    return f"audio_input_{st.session_state.audio_input_count}"
+
+@fragment
+def audio_input_fragment(audio_input_file_path, widget_key):
+    """
+    音声入力欄を表示
+    入力方法の切り替えや録音・アップロードではこの部分のみを再実行し、会話の一覧は再描画しない
+    音声入力が完了したらsession_stateに保持し、画面全体を再実行して入力後の処理を進める
+    """
+    audio_input = record_audio(audio_input_file_path, widget_key)
+    if audio_input is None:
+        return
+    st.session_state.pending_audio_input = audio_input
+    if is_fragment_run():
+        st.rerun()
+
+# 計測されるのは入力欄の描画と、入力完了時のバッファの作成・保存の時間（学習者が録音している時間は含まない）
+@trace_stage("audio_input_widget")
+def record_audio(audio_input_file_path, widget_key=None):
+    """
+    音声入力を受け取ってメモリ上の音声データを作成（録音機能付き）
+    Args:
+        audio_input_file_path: 音声の保存設定が有効な場合の保存先パス
+        widget_key: 録音・アップロードのウィジェットのキー
+    Returns:
+        音声入力のバッファ（音声入力が完了していない場合はNone）
     """
     
     # 録音方法を選択
@@ -41,17 +561,18 @@ def record_audio(audio_input_file_path):
     )
     
     if audio_input_method == "📱 リアルタイム録音":
-        return record_audio_realtime(audio_input_file_path)
+        return record_audio_realtime(audio_input_file_path, widget_key)
     else:
-        return record_audio_upload(audio_input_file_path)
+        return record_audio_upload(audio_input_file_path, widget_key)
 
-def record_audio_realtime(audio_input_file_path):
+def record_audio_realtime(audio_input_file_path, widget_key=None):
     """
     リアルタイム音声録音機能
     """
-    if not AUDIOREC_AVAILABLE:
+    if not has_audio_recorder():
         st.error("音声録音機能が利用できません。ファイルアップロード機能をご利用ください。")
         st.stop()
+    audio_recorder = load_audio_recorder()
     
     st.write("🎤 **音声を録音してください**")
     st.info("録音ボタンを押して話してください。話し終わったら停止ボタンを押してください。")
@@ -63,29 +584,30 @@ def record_audio_realtime(audio_input_file_path):
         neutral_color="#6aa36f",
         icon_name="microphone",
         icon_size="2x",
+        key=widget_key and f"{widget_key}_recorder",
     )
     
     if wav_audio_data is not None:
-        # 録音データをファイルに保存
-        with open(audio_input_file_path, "wb") as f:
-            f.write(wav_audio_data)
+        # 録音データをメモリ上に保持
+        audio_input = create_audio_buffer(wav_audio_data, audio_input_file_path)
+        persist_audio(audio_input, audio_input_file_path)
         
         st.success("✅ 音声が録音されました！")
         
         # 録音した音声を再生して確認
         st.write("📻 **録音内容を確認**")
-        st.audio(audio_input_file_path, format='audio/wav')
+        st.audio(wav_audio_data, format='audio/wav')
         
         # 録音をやり直すオプション
         if st.button("🔄 録音をやり直す"):
             st.rerun()
             
-        return True
+        return audio_input
     else:
         st.info("音声を録音してください")
-        return False
+        return None
 
-def record_audio_upload(audio_input_file_path):
+def record_audio_upload(audio_input_file_path, widget_key=None):
     """
     音声ファイルアップロード機能
     """
@@ -94,187 +616,577 @@ def record_audio_upload(audio_input_file_path):
     uploaded_file = st.file_uploader(
         "音声ファイルをアップロードしてください",
         type=['wav', 'mp3', 'm4a', 'ogg'],
-        help="録音した音声ファイルを選択してアップロードしてください"
+        help="録音した音声ファイルを選択してアップロードしてください",
+        key=widget_key and f"{widget_key}_upload"
     )
     
     if uploaded_file is not None:
-        # アップロードされたファイルを保存
-        with open(audio_input_file_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
+        # アップロードされたデータをメモリ上に保持（Whisperが形式を判定できるよう元の拡張子を使う）
+        extension = os.path.splitext(uploaded_file.name)[1]
+        audio_input_file_path = os.path.splitext(audio_input_file_path)[0] + extension
+        audio_input = create_audio_buffer(uploaded_file.getbuffer(), audio_input_file_path)
+        persist_audio(audio_input, audio_input_file_path)
         st.success("✅ 音声ファイルがアップロードされました！")
         
         # アップロードした音声を再生して確認
         st.write("📻 **アップロード内容を確認**")
-        st.audio(audio_input_file_path)
+        st.audio(uploaded_file)
         
-        return True
+        return audio_input
     else:
         st.info("音声ファイルをアップロードしてください")
-        return False
+        return None
 
-def transcribe_audio(audio_input_file_path):
+def transcribe_chunk(openai_obj, audio_chunk):
     """
-    音声入力ファイルから文字起こしテキストを取得
+    1つの音声チャンクを文字起こし
+    （通信エラー・タイムアウト・429・5xxの再試行は共有クライアントに任せ、4xxなどはそのまま例外にする）
+    st.session_stateを参照しないため、スレッドプールから呼び出せる
+    """
+    audio_chunk.seek(0)
+    return openai_obj.audio.transcriptions.create(
+        model="whisper-1",
+        file=audio_chunk,
+        language="en",
+        timeout=ct.OPENAI_TIMEOUT_WHISPER_SECONDS
+    ).text
+
+@trace_stage("transcribe_audio")
+def transcribe_audio(audio_input):
+    """
+    音声入力データから文字起こしテキストを取得
+    長い音声は無音付近で分割し、チャンクごとに並列で文字起こしして連結する
     Args:
-        audio_input_file_path: 音声入力ファイルのパス
+        audio_input: 音声入力のバッファ（record_audioの戻り値）
     """
+    from audio_processing import merge_transcripts, preprocess_for_transcription, split_audio
+    from openai.types.audio import Transcription
+
+    # 前後の無音を除去し、モノラル・16kHzに変換してアップロード量を削減
+    if ct.TRANSCRIPTION_PREPROCESS_ENABLED:
+        try:
+            audio_input, st.session_state.audio_preprocess_stats = preprocess_for_transcription(
+                audio_input,
+                ct.TRANSCRIPTION_SAMPLE_RATE,
+                ct.TRANSCRIPTION_UPLOAD_FORMAT,
+                ct.TRANSCRIPTION_VAD_THRESHOLD_DB
+            )
+        except Exception:
+            # 前処理できない形式の場合はそのままアップロード
+            pass
 
-    with open(audio_input_file_path, 'rb') as audio_input_file:
-        transcript = st.session_state.openai_obj.audio.transcriptions.create(
-            model="whisper-1",
-            file=audio_input_file,
-            language="en"
+    try:
+        audio_chunks = split_audio(
+            audio_input,
+            ct.TRANSCRIPTION_CHUNK_SECONDS,
+            ct.TRANSCRIPTION_CHUNK_OVERLAP_SECONDS,
+            ct.TRANSCRIPTION_UPLOAD_FORMAT,
+            ct.TRANSCRIPTION_MAX_UPLOAD_BYTES
         )
-    
-    # 音声入力ファイルを削除
-    os.remove(audio_input_file_path)
+    except Exception:
+        # 分割できない形式の場合はそのままアップロード
+        audio_chunks = [audio_input]
+
+    openai_obj = get_openai_client()
+    if len(audio_chunks) == 1:
+        return Transcription(text=transcribe_chunk(openai_obj, audio_chunks[0]))
 
-    return transcript
+    # チャンクごとに並列で文字起こしし、元の順番で連結
+    futures = [
+        get_transcription_executor().submit(transcribe_chunk, openai_obj, audio_chunk)
+        for audio_chunk in audio_chunks
+    ]
+    return Transcription(text=merge_transcripts([future.result() for future in futures]))
 
-def save_to_wav(llm_response_audio, audio_output_file_path):
+@trace_stage("save_to_wav")
+def save_to_wav(llm_response_audio, audio_output_file_path, response_format=None):
     """
-    一旦mp3形式で音声ファイル作成後、wav形式に変換
+    音声合成の結果をメモリ上で再生用のwav形式に変換
+    pcm形式はwavのヘッダーを付けるだけで変換し、mp3などの圧縮形式はpydub（ffmpeg）で変換する
     Args:
         llm_response_audio: LLMからの回答の音声データ
-        audio_output_file_path: 出力先のファイルパス
+        audio_output_file_path: 音声の保存設定が有効な場合の保存先パス
+        response_format: 音声データの形式（省略時はTTS_RESPONSE_FORMAT）
+    Returns:
+        再生用の音声バッファ（変換できない場合は元の形式のまま）
     """
 
-    temp_audio_output_filename = f"{ct.AUDIO_OUTPUT_DIR}/temp_audio_output_{int(time.time())}.mp3"
+    audio_output = create_speech_buffer(llm_response_audio, audio_output_file_path, response_format)
     
-    try:
-        # mp3ファイルを一時的に保存
-        with open(temp_audio_output_filename, "wb") as temp_audio_output_file:
-            temp_audio_output_file.write(llm_response_audio)
-        
-        # pydubが利用できる場合のみ変換を実行
-        if PYDUB_AVAILABLE:
-            try:
-                audio_mp3 = AudioSegment.from_file(temp_audio_output_filename, format="mp3")
-                audio_mp3.export(audio_output_file_path, format="wav")
-            except Exception as pydub_error:
-                st.warning(f"音声変換をスキップします (pydub利用不可): {pydub_error}")
-                # 変換に失敗した場合、mp3ファイルをそのまま使用
-                import shutil
-                mp3_output_path = audio_output_file_path.replace('.wav', '.mp3')
-                shutil.copy2(temp_audio_output_filename, mp3_output_path)
-                audio_output_file_path = mp3_output_path
-        else:
-            # pydubが利用できない場合、mp3ファイルをそのまま使用
-            import shutil
-            mp3_output_path = audio_output_file_path.replace('.wav', '.mp3')
-            shutil.copy2(temp_audio_output_filename, mp3_output_path)
-            audio_output_file_path = mp3_output_path
-
-        # 音声出力用に一時的に作ったmp3ファイルを削除
-        if os.path.exists(temp_audio_output_filename):
-            os.remove(temp_audio_output_filename)
-            
-    except Exception as e:
-        st.error(f"音声ファイル処理エラー: {e}")
-        # 一時ファイルのクリーンアップ
-        if os.path.exists(temp_audio_output_filename):
-            os.remove(temp_audio_output_filename)
+    # 圧縮形式はpydubとffmpegが利用できる場合のみ変換を実行
+    if get_audio_format(audio_output) != 'audio/wav' and can_convert_audio():
+        try:
+            audio_output = create_audio_buffer(decode_to_wav(audio_output), audio_output_file_path)
+        except Exception as pydub_error:
+            st.warning(f"音声変換をスキップします (pydub利用不可): {pydub_error}")
+            # 変換に失敗した場合、元の形式のまま使用
+            audio_output.seek(0)
+
+    # 選択中の再生速度の音声を事前に作成（他の速度は切り替えた時点で作成）
+    if get_audio_format(audio_output) == 'audio/wav':
+        wav_data = audio_output.getvalue()
+        get_speed_variant_store().prerender(get_clip_id(wav_data), wav_data, st.session_state.get("speed", 1.0))
+
+    persist_audio(audio_output, os.path.join(os.path.dirname(audio_output_file_path), audio_output.name))
+    return audio_output
 
-def play_wav(audio_output_file_path, speed=1.0):
+@trace_stage("play_wav")
+def play_wav(audio_output, speed=1.0):
     """
-    音声ファイルの読み上げ
+    音声データの読み上げ
     Args:
-        audio_output_file_path: 音声ファイルのパス
+        audio_output: 音声バッファ（save_to_wavの戻り値）
         speed: 再生速度（1.0が通常速度、0.5で半分の速さ、2.0で倍速など）
     """
 
+    audio_format = get_audio_format(audio_output)
+    audio_data = audio_output.getvalue()
+
     try:
-        if PYDUB_AVAILABLE:
-            # 音声ファイルの形式を判定
-            if audio_output_file_path.endswith('.wav'):
-                audio = AudioSegment.from_wav(audio_output_file_path)
+        # 速度を変更（事前に作成済みの速度別の音声を使用）
+        if speed != 1.0:
+            if audio_format == 'audio/wav':
+                audio_data = get_speed_variant_store().get(get_clip_id(audio_data), audio_data, speed)
+            elif can_convert_audio():
+                wav_data = decode_to_wav(audio_output)
+                audio_data = get_speed_variant_store().get(get_clip_id(wav_data), wav_data, speed)
                 audio_format = 'audio/wav'
-            elif audio_output_file_path.endswith('.mp3'):
-                audio = AudioSegment.from_mp3(audio_output_file_path)
-                audio_format = 'audio/mp3'
             else:
-                st.error("サポートされていない音声形式です")
-                return
-            
-            # 速度を変更
-            if speed != 1.0:
-                # frame_rateを変更することで速度を調整
-                modified_audio = audio._spawn(
-                    audio.raw_data, 
-                    overrides={"frame_rate": int(audio.frame_rate * speed)}
-                )
-                # 元のframe_rateに戻すことで正常再生させる（ピッチを保持したまま速度だけ変更）
-                modified_audio = modified_audio.set_frame_rate(audio.frame_rate)
-
-                # 一時ファイルとして保存
-                temp_path = audio_output_file_path.replace('.wav', '_temp.wav').replace('.mp3', '_temp.wav')
-                modified_audio.export(temp_path, format="wav")
-                audio_output_file_path = temp_path
-                audio_format = 'audio/wav'
-
-        else:
-            # pydubが利用できない場合は速度変更なしで再生
-            if speed != 1.0:
-                st.warning("pydubが利用できないため、速度変更はスキップされます")
-            audio_format = 'audio/wav' if audio_output_file_path.endswith('.wav') else 'audio/mp3'
+                # pydub・ffmpegが利用できない場合は速度変更なしで再生（pcm形式の音声合成では不要）
+                st.warning("pydub・ffmpegが利用できないため、速度変更はスキップされます")
 
         # Streamlitの音声プレーヤーで再生
-        st.audio(audio_output_file_path, format=audio_format)
+        st.audio(audio_data, format=audio_format)
         
     except Exception as e:
         st.error(f"音声再生エラー: {e}")
-        # フォールバック: 元のファイルをそのまま再生
+        # フォールバック: 元の音声をそのまま再生
         try:
-            format_type = 'audio/wav' if audio_output_file_path.endswith('.wav') else 'audio/mp3'
-            st.audio(audio_output_file_path, format=format_type)
+            st.audio(audio_output.getvalue(), format=get_audio_format(audio_output))
         except Exception as fallback_error:
             st.error(f"音声再生に失敗しました: {fallback_error}")
+
+def request_chat_completion(openai_obj, messages, prompt_cache_stats=None, prompt_name="chat"):
+    """
+    Chat Completions APIを呼び出して回答テキストを取得
+    st.session_stateを参照しないため、バックグラウンドスレッドからも呼び出せる
+    Args:
+        prompt_cache_stats: 応答のusageの記録先（PromptCacheStats。Noneの場合は記録しない）
+        prompt_name: 集計上のプロンプト名
+    """
+    response = openai_obj.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=messages,
+        temperature=0.5,
+        timeout=ct.OPENAI_TIMEOUT_CHAT_SECONDS
+    )
+    if prompt_cache_stats is not None:
+        prompt_cache_stats.record(prompt_name, response.usage)
+    return response.choices[0].message.content
+
+def build_messages(system_template, user_input, conversation_history=None):
+    """
+    Chat Completions APIに渡すメッセージリストを作成
+    プロンプトキャッシュが効くよう、先頭のシステムプロンプトは固定の文字列のみとし、
+    リクエストごとに変わる内容は会話履歴と末尾のユーザーメッセージに含める
+    """
+    messages = [{"role": "system", "content": system_template}]
     
-    # 一定時間後にファイルクリーンアップ（バックグラウンドで実行される想定）
+    # 会話履歴があれば追加（トークン数の上限に収まる要約と直近の会話のみ）
+    if conversation_history is not None:
+        messages.extend(conversation_history.context_messages())
+        
+    messages.append({"role": "user", "content": user_input})
+    return messages
+
+def summarize_conversation(openai_obj, summary, messages, prompt_cache_stats=None):
+    """
+    これまでの要約と古い会話から新しい要約を作成（バックグラウンドスレッドから呼び出される）
+    """
+    transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+    return request_chat_completion(openai_obj, [
+        {"role": "system", "content": ct.SYSTEM_TEMPLATE_CONVERSATION_SUMMARY},
+        {"role": "user", "content": f"Current summary:\n{summary or '(none)'}\n\nNew conversation:\n{transcript}"}
+    ], prompt_cache_stats, "summary")
+
+def create_conversation_memory(session_history=None):
+    """
+    トークン数の上限付きの会話履歴を作成（古い会話はバックグラウンドで要約）
+    Args:
+        session_history: 復元したメッセージ一覧（会話履歴として保存したメッセージを読み込む）
+    """
+    prompt_cache_stats = get_prompt_cache_stats()
+    conversation_memory = ConversationMemory(
+        ct.CONVERSATION_TOKEN_BUDGET,
+        ct.CONVERSATION_MAX_MESSAGES,
+        # OpenAIクライアントは要約の実行時に取得（最初の画面表示ではOpenAI SDKを読み込まない）
+        summarize_func=lambda summary, messages: run_speculative(
+            summarize_conversation, get_openai_client(), summary, messages, prompt_cache_stats
+        ),
+        executor=get_summary_executor()
+    )
+    if session_history is not None:
+        conversation_memory.extend(session_history.conversation_messages(ct.CONVERSATION_MAX_MESSAGES))
+    return conversation_memory
 
-def generate_response(system_template, user_input, conversation_history=None):
+@trace_stage("generate_response")
+def generate_response(system_template, user_input, conversation_history=None, prompt_name="chat"):
     """
     OpenAI APIを直接使用してレスポンスを生成（langchain不使用）
     """
     try:
-        messages = [{"role": "system", "content": system_template}]
-        
-        # 会話履歴があれば追加
-        if conversation_history:
-            messages.extend(conversation_history[-10:])  # 最新10件のみ保持
-            
-        messages.append({"role": "user", "content": user_input})
-        
-        response = st.session_state.openai_obj.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            temperature=0.5
-        )
-        return response.choices[0].message.content
+        messages = build_messages(system_template, user_input, conversation_history)
+        return request_chat_completion(get_openai_client(), messages, get_prompt_cache_stats(), prompt_name)
     except Exception as e:
         st.error(f"OpenAI API エラー: {e}")
         return "申し訳ございません。エラーが発生しました。"
 
+def generate_response_stream(system_template, user_input, conversation_history=None):
+    """
+    generate_responseのストリーミング版。生成されたテキストを届いた順に少しずつ返す
+    """
+    messages = build_messages(system_template, user_input, conversation_history)
+    prompt_cache_stats = get_prompt_cache_stats()
+    stream = get_openai_client().chat.completions.create(
+        model="gpt-4o-mini",
+        messages=messages,
+        temperature=0.5,
+        stream=True,
+        # 最後のチャンクでusageを受け取る
+        stream_options={"include_usage": True},
+        timeout=ct.OPENAI_TIMEOUT_CHAT_SECONDS
+    )
+    for chunk in stream:
+        if chunk.usage is not None:
+            prompt_cache_stats.record("chat", chunk.usage)
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+def generate_response_with_speech(system_template, user_input, conversation_history=None, speed=1.0):
+    """
+    回答を生成しながら画面に表示し、文が完成するたびに音声合成して順番に再生
+    文ごとの音声を連結できない形式（wav・flac・opus）の場合は、回答の生成後に全体をまとめて音声合成する
+    （st.chat_messageの中で呼び出す）
+    Args:
+        speed: 再生速度
+    Returns:
+        (回答テキスト, 回答全体の音声データ)
+    """
+    if not ct.CHAT_STREAMING_ENABLED:
+        llm_response = generate_response(system_template, user_input, conversation_history)
+        st.markdown(llm_response)
+        return llm_response, synthesize_speech_streaming(llm_response, speed)
+
+    openai_obj = get_openai_client()
+    tts_cache = get_tts_cache()
+    tts_executor = get_tts_executor()
+    tracer = get_tracer()
+
+    speech_by_sentence = can_concatenate(ct.TTS_RESPONSE_FORMAT)
+    text_placeholder = st.empty()
+    player = None
+    if speech_by_sentence and ct.TTS_STREAMING_ENABLED and is_streaming_supported(ct.TTS_RESPONSE_FORMAT):
+        player = StreamingAudioPlayer(ct.TTS_RESPONSE_FORMAT, speed, ct.TTS_STREAM_FIRST_FLUSH_BYTES)
+    sentence_buffer = SentenceBuffer(ct.TTS_SENTENCE_MIN_CHARS)
+    speech_futures = deque()
+    speech_audios = []
+
+    def submit_sentence(sentence):
+        # 文ごとに並列で音声合成（再生は文の順番どおりに行う）
+        speech_futures.append(tts_executor.submit(synthesize_speech, sentence, openai_obj, tts_cache, tracer))
+
+    def play_finished_sentences(wait=False):
+        while speech_futures and (wait or speech_futures[0].done()):
+            try:
+                sentence_audio = speech_futures.popleft().result()
+            except Exception as e:
+                st.warning(f"音声合成エラー: {e}")
+                continue
+            speech_audios.append(sentence_audio)
+            if player is not None:
+                player.feed(sentence_audio, flush=True)
+
+    llm_response = ""
+    try:
+        with tracer.span("generate_response"):
+            for delta in generate_response_stream(system_template, user_input, conversation_history):
+                llm_response += delta
+                text_placeholder.markdown(llm_response + "▌")
+                if not speech_by_sentence:
+                    continue
+                for sentence in sentence_buffer.append(delta):
+                    submit_sentence(sentence)
+                play_finished_sentences()
+    except Exception as e:
+        st.error(f"OpenAI API エラー: {e}")
+        if not llm_response:
+            llm_response = "申し訳ございません。エラーが発生しました。"
+    text_placeholder.markdown(llm_response)
+
+    if not speech_by_sentence:
+        return llm_response, synthesize_speech_streaming(llm_response, speed)
+
+    rest = sentence_buffer.flush()
+    if rest:
+        submit_sentence(rest)
+    play_finished_sentences(wait=True)
+    if player is not None:
+        player.close()
+
+    return llm_response, b"".join(speech_audios)
+
+def synthesize_speech(text, openai_obj=None, tts_cache=None, tracer=None):
+    """
+    テキストを音声データに変換（同じテキストは音声合成キャッシュから取得）
+    Args:
+        text: 読み上げるテキスト
+        openai_obj: OpenAIクライアント（省略時は共有クライアント）
+        tts_cache: 音声合成キャッシュ（省略時は共有キャッシュ）
+        tracer: 音声合成の処理時間の記録先（省略時は現在のセッションのTracer）
+    Returns:
+        音声データ（bytes）
+    """
+    if openai_obj is None:
+        openai_obj = get_openai_client()
+    if tts_cache is None:
+        tts_cache = get_tts_cache()
+    if tracer is None:
+        tracer = get_tracer()
+
+    def create_speech():
+        with tracer.span("speech.create"):
+            llm_response_audio = openai_obj.audio.speech.create(
+                model=ct.TTS_MODEL,
+                voice=ct.TTS_VOICE,
+                input=text,
+                response_format=ct.TTS_RESPONSE_FORMAT,
+                timeout=ct.OPENAI_TIMEOUT_TTS_SECONDS
+            )
+            return llm_response_audio.content
+
+    return tts_cache.get_or_create(
+        text, ct.TTS_MODEL, ct.TTS_VOICE, ct.TTS_RESPONSE_FORMAT, create_speech
+    )
+
+def synthesize_speech_streaming(text, speed=1.0):
+    """
+    テキストを音声データに変換し、受信したチャンクから順に再生を開始
+    キャッシュ済みの場合やストリーミングが利用できない場合は synthesize_speech と同じ処理を行う
+    Args:
+        text: 読み上げるテキスト
+        speed: ストリーミング再生時の再生速度
+    Returns:
+        音声データ全体（bytes）
+    """
+    if not ct.TTS_STREAMING_ENABLED or not is_streaming_supported(ct.TTS_RESPONSE_FORMAT):
+        return synthesize_speech(text)
+
+    openai_obj = get_openai_client()
+    tracer = get_tracer()
+
+    def create_speech_streaming():
+        with tracer.span("speech.create"):
+            player = StreamingAudioPlayer(ct.TTS_RESPONSE_FORMAT, speed, ct.TTS_STREAM_FIRST_FLUSH_BYTES)
+            llm_response_audio = bytearray()
+            for chunk in stream_speech(
+                openai_obj, text, ct.TTS_MODEL, ct.TTS_VOICE, ct.TTS_RESPONSE_FORMAT, ct.TTS_STREAM_CHUNK_BYTES,
+                timeout=ct.OPENAI_TIMEOUT_TTS_SECONDS
+            ):
+                llm_response_audio.extend(chunk)
+                player.feed(chunk)
+            player.close()
+            return bytes(llm_response_audio)
+
+    try:
+        return get_tts_cache().get_or_create(
+            text, ct.TTS_MODEL, ct.TTS_VOICE, ct.TTS_RESPONSE_FORMAT, create_speech_streaming
+        )
+    except Exception:
+        # ストリーミングに失敗した場合は通常の音声合成にフォールバック
+        return synthesize_speech(text)
+
+@functools.lru_cache(maxsize=None)
+def get_evaluation_prompt_version():
+    """
+    アドバイス生成のプロンプトの版（プロンプトを変更すると値が変わり、キャッシュ済みのアドバイスを使わなくなる）
+    """
+    payload = "\x1f".join([ct.SYSTEM_TEMPLATE_EVALUATION_ADVICE, ct.EVALUATION_ADVICE_INPUT_TEMPLATE])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+def evaluate_answer(problem, answer, level=None):
+    """
+    問題文と回答を比較し、評価結果を作成
+    単語単位の照合でほぼ一致する場合はLLMを使わず、それ以外は照合結果をもとにアドバイスのみをLLMで生成
+    （同じ問題文・回答・英語レベルのアドバイスは評価結果のキャッシュから取得）
+    Args:
+        problem: LLMによる問題文
+        answer: ユーザーによる回答文
+        level: 英語レベル（アドバイスの説明の難しさを合わせる。省略時は初級者）
+    """
+    result = score_answer(problem, answer)
+    evaluation = format_evaluation(result)
+
+    if result["accuracy"] >= ct.LOCAL_EVALUATION_MIN_ACCURACY:
+        if result["accuracy"] == 1.0:
+            advice = ct.LOCAL_EVALUATION_ADVICE_PERFECT
+        else:
+            advice = ct.LOCAL_EVALUATION_ADVICE_NEAR_PERFECT
+    else:
+        # 指示は固定のシステムプロンプトに、英語レベル・問題文・回答・照合結果は末尾のユーザーメッセージに含める
+        level = level or ct.ENGLISH_LEVEL_OPTION[0]
+        user_input = ct.EVALUATION_ADVICE_INPUT_TEMPLATE.format(
+            level=level,
+            llm_text=problem,
+            user_text=answer,
+            alignment=format_alignment(result)
+        )
+        messages = build_messages(ct.SYSTEM_TEMPLATE_EVALUATION_ADVICE, user_input)
+        evaluation_cache = get_evaluation_cache()
+        # APIエラーは例外のまま受け取り、エラー時の文言をキャッシュしないようにする
+        try:
+            advice = evaluation_cache.get_or_create(
+                evaluation_cache.make_key(problem, answer, level, get_evaluation_prompt_version()),
+                lambda: request_chat_completion(get_openai_client(), messages, get_prompt_cache_stats(), "evaluation")
+            )
+        except Exception as e:
+            st.error(f"OpenAI API エラー: {e}")
+            advice = "申し訳ございません。エラーが発生しました。"
+
+    return f"{evaluation}\n\n【アドバイス】  \n{advice}"
+
+@trace_stage("score_shadowing")
+def score_shadowing(reference_audio, audio_input):
+    """
+    問題文の音声（お手本）と音声入力の発音・リズムを比較（ネットワーク通信なし）
+    Args:
+        reference_audio: 問題文の音声データ（音声合成の結果）
+        audio_input: 音声入力のバッファ
+    Returns:
+        【音声の比較】セクションのテキスト（音声を読み込めない場合や発話が短すぎる場合はNone）
+    """
+    from acoustic_scoring import format_acoustic_evaluation, score_shadowing_audio
+    from audio_processing import decode_audio
+
+    try:
+        reference_samples, reference_rate = decode_audio(create_speech_buffer(reference_audio, "reference"))
+        learner_samples, learner_rate = decode_audio(audio_input)
+    except Exception:
+        # wav以外の読み込みに必要なffmpegが利用できない場合など
+        return None
+
+    result = score_shadowing_audio(
+        reference_samples.mean(axis=1), reference_rate, learner_samples.mean(axis=1), learner_rate
+    )
+    if result is None:
+        return None
+    return format_acoustic_evaluation(result)
+
+def get_level_guide(level):
+    """
+    英語レベルに応じた問題文の難易度の説明を取得（不明なレベルは中級者として扱う）
+    """
+    return ct.PROBLEM_LEVEL_GUIDES.get(level, ct.PROBLEM_LEVEL_GUIDES[ct.ENGLISH_LEVEL_OPTION[1]])
+
+def create_problem(openai_obj, tts_cache, level, prompt_cache_stats=None, tracer=None, problem_bank=None):
+    """
+    問題文の生成と音声合成（画面描画なし。事前生成のためバックグラウンドスレッドから呼び出される）
+    Args:
+        level: 英語レベル
+        problem_bank: 生成した問題の保存先（他のユーザーも再利用できるようにする）
+    Returns:
+        (問題文, 音声データ)
+    """
+    problem = request_chat_completion(openai_obj, [
+        {"role": "system", "content": ct.SYSTEM_TEMPLATE_CREATE_PROBLEM},
+        {"role": "user", "content": ct.CREATE_PROBLEM_INPUT_TEMPLATE.format(level_guide=get_level_guide(level))}
+    ], prompt_cache_stats, "problem")
+    llm_response_audio = synthesize_speech(problem, openai_obj, tts_cache, tracer)
+    if problem_bank is not None:
+        problem_bank.add(level, DEFAULT_CATEGORY, problem, llm_response_audio, ct.TTS_RESPONSE_FORMAT)
+    return problem, llm_response_audio
+
+def create_problem_batch(openai_obj, tts_cache, level, problem_bank, prompt_cache_stats=None, tracer=None):
+    """
+    問題文をまとめて生成して音声合成し、問題文のバンクに追加（バックグラウンドスレッドから呼び出される）
+    Returns:
+        追加した問題数
+    """
+    response = request_chat_completion(openai_obj, [
+        {"role": "system", "content": ct.SYSTEM_TEMPLATE_CREATE_PROBLEM_BATCH},
+        {"role": "user", "content": ct.CREATE_PROBLEM_BATCH_INPUT_TEMPLATE.format(
+            count=ct.PROBLEM_BANK_BATCH_SIZE, level_guide=get_level_guide(level)
+        )}
+    ], prompt_cache_stats, "problem_batch")
+
+    added = 0
+    for category, problem in parse_problem_batch(response, ct.PROBLEM_CATEGORIES):
+        # 保存済みの問題文は音声合成しない
+        if problem_bank.contains(level, problem):
+            continue
+        llm_response_audio = synthesize_speech(problem, openai_obj, tts_cache, tracer)
+        if problem_bank.add(level, category, problem, llm_response_audio, ct.TTS_RESPONSE_FORMAT):
+            added += 1
+    return added
+
 def create_problem_and_play_audio():
     """
     問題生成と音声ファイルの再生（OpenAI API直接使用）
+    問題文のバンクにこのユーザーに未出題の問題があればそれを使い、なければ事前生成済みの問題、
+    それもなければその場で生成する。再生後、未出題の問題が少なければバンクの補充を開始する
     """
 
-    # 問題文を生成
-    problem = generate_response(ct.SYSTEM_TEMPLATE_CREATE_PROBLEM, "")
+    prefetcher = st.session_state.problem_prefetcher
+    level = st.session_state.englv
+    prefetch_key = (level, st.session_state.speed)
+    problem_bank = get_problem_bank() if ct.PROBLEM_BANK_ENABLED else None
+    seen_problems = st.session_state.seen_problems
 
-    # LLMからの回答を音声データに変換
-    llm_response_audio = st.session_state.openai_obj.audio.speech.create(
-        model="tts-1",
-        voice="alloy",
-        input=problem
-    )
+    banked = None
+    if problem_bank is not None:
+        banked = problem_bank.take(level, ct.TTS_RESPONSE_FORMAT, seen_problems)
+    if banked is not None:
+        problem, llm_response_audio = banked
+    else:
+        prefetched = prefetcher.take(prefetch_key)
+        # 事前生成した問題はバンクにも保存されるため、既にバンクから出題済みの場合は使わない
+        if prefetched is not None and normalize_problem_text(prefetched[0]) in seen_problems:
+            prefetched = None
+        if prefetched is not None:
+            problem, llm_response_audio = prefetched
+        else:
+            # 問題文を生成して音声データに変換（失敗した場合はバンクに保存せず、次の操作で作り直す）
+            try:
+                problem, llm_response_audio = create_problem(
+                    get_openai_client(), get_tts_cache(), level, get_prompt_cache_stats(), get_tracer(), problem_bank
+                )
+            except Exception as e:
+                st.error(f"OpenAI API エラー: {e}")
+                st.stop()
+    seen_problems.add(normalize_problem_text(problem))
 
     # 音声ファイルの作成
-    audio_output_file_path = f"{ct.AUDIO_OUTPUT_DIR}/audio_output_{int(time.time())}.wav"
-    save_to_wav(llm_response_audio.content, audio_output_file_path)
+    audio_output_file_path = st.session_state.workspace.output_path()
+    audio_output = save_to_wav(llm_response_audio, audio_output_file_path)
 
     # 音声ファイルの読み上げ
-    play_wav(audio_output_file_path, st.session_state.speed)
+    play_wav(audio_output, st.session_state.speed)
+
+    # 回答の入力中に次の問題を用意
+    openai_obj = get_openai_client()
+    tts_cache = get_tts_cache()
+    prompt_cache_stats = get_prompt_cache_stats()
+    tracer = get_tracer()
+    unseen_count = 0
+    if problem_bank is not None:
+        unseen_count = problem_bank.count_unseen(level, ct.TTS_RESPONSE_FORMAT, seen_problems)
+        if unseen_count < ct.PROBLEM_BANK_REFILL_THRESHOLD:
+            problem_bank.schedule_refill(get_prefetch_executor(), level, lambda: run_speculative(
+                create_problem_batch, openai_obj, tts_cache, level, problem_bank, prompt_cache_stats, tracer
+            ))
+    # バンクに未出題の問題がない場合は、補充を待たずにこのユーザー用の次の問題を事前生成
+    if unseen_count == 0:
+        prefetcher.schedule(prefetch_key, lambda: run_speculative(
+            create_problem, openai_obj, tts_cache, level, prompt_cache_stats, tracer, problem_bank
+        ))
 
     return problem, llm_response_audio
\ No newline at end of file
@@ -1,13 +1,8 @@
 import streamlit as st
-import os
-import time
-from time import sleep
-from pathlib import Path
-from streamlit.components.v1 import html
-from openai import OpenAI
 from dotenv import load_dotenv
 import functions as ft
 import constants as ct
+from prefetch import ProblemPrefetcher
 
 
 # 各種設定
@@ -16,26 +11,25 @@ st.set_page_config(
     page_title=ct.APP_NAME
 )
 
-# 必要なディレクトリを作成
-os.makedirs(ct.AUDIO_INPUT_DIR, exist_ok=True)
-os.makedirs(ct.AUDIO_OUTPUT_DIR, exist_ok=True)
-os.makedirs("images", exist_ok=True)
+# 必要なディレクトリを作成（プロセスで1回のみ）
+ft.prepare_directories()
+# 音声ファイルの保存領域の掃除をバックグラウンドで開始（プロセスで1回のみ）
+ft.get_storage_manager()
 
-# アバター画像のパスを取得する関数
-def get_avatar_path(icon_path):
-    """アイコンファイルが存在する場合はそのパス、存在しない場合はNoneを返す"""
-    if os.path.exists(icon_path):
-        return icon_path
-    return None  # Streamlitのデフォルトアバターを使用
+# アバター画像のパス（存在しない場合はNoneでStreamlitのデフォルトアバターを使用。判定はプロセスで1回のみ）
+ai_avatar = ft.get_avatar_path(ct.AI_ICON_PATH)
+user_avatar = ft.get_avatar_path(ct.USER_ICON_PATH)
 
 # タイトル表示
 st.markdown(f"## {ct.APP_NAME}")
 
 # 初期処理
 if "messages" not in st.session_state:
-    st.session_state.messages = []
+    # メッセージ一覧はディスクに保存し、メモリ上には直近の分のみ保持（サーバーの再起動後も同じURLで復元）
+    st.session_state.messages = ft.create_session_history()
     st.session_state.start_flg = False
     st.session_state.pre_mode = ""
+    st.session_state.pre_englv = ""
     st.session_state.shadowing_flg = False
     st.session_state.shadowing_button_flg = False
     st.session_state.shadowing_count = 0
@@ -50,11 +44,23 @@ if "messages" not in st.session_state:
     st.session_state.dictation_evaluation_first_flg = True
     st.session_state.chat_open_flg = False
     st.session_state.problem = ""
+    # 問題文の音声データ（シャドーイングの音声の比較に使用）
+    st.session_state.problem_audio = None
+    # 表示する直近のメッセージ数と、音声入力欄のキーの番号
+    st.session_state.visible_message_count = ct.CHAT_HISTORY_PAGE_SIZE
+    st.session_state.audio_input_count = 0
     
-    st.session_state.openai_obj = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+    # 音声機能に必要なライブラリ・コマンドが利用できない場合の警告（利用可否の確認はプロセスで1回のみ）
+    ft.display_capability_warnings()
+    # セッション専用の音声ファイルの作業ディレクトリ（セッション終了時に削除）
+    st.session_state.workspace = ft.create_session_workspace()
+    # 次の問題をバックグラウンドで事前生成
+    st.session_state.problem_prefetcher = ProblemPrefetcher(ft.get_prefetch_executor())
+    # このユーザーに出題済みの問題文（正規化済み。問題文のバンクから同じ問題を出題しないようにする）
+    st.session_state.seen_problems = set()
     
-    # シンプルなメッセージ履歴を使用（langchain不使用）
-    st.session_state.conversation_history = []
+    # トークン数の上限付きの会話履歴を使用（langchain不使用。古い会話はバックグラウンドで要約）
+    st.session_state.conversation_history = ft.create_conversation_memory(st.session_state.messages)
 
     # OpenAI APIを直接使用（langchain不使用）
 
@@ -89,11 +95,33 @@ with col3:
             st.session_state.shadowing_flg = False
         # チャット入力欄を非表示にする
         st.session_state.chat_open_flg = False
+        # 音声入力の受け付けを終了し、受け取り済みの音声入力を破棄
+        st.session_state.shadowing_audio_input_flg = False
+        st.session_state.pop("pending_audio_input", None)
+        # 事前生成した問題を破棄
+        st.session_state.problem_prefetcher.cancel()
     st.session_state.pre_mode = st.session_state.mode
 with col4:
     st.session_state.englv = st.selectbox(label="英語レベル", options=ct.ENGLISH_LEVEL_OPTION, label_visibility="collapsed")
-
-with st.chat_message("assistant", avatar=get_avatar_path(ct.AI_ICON_PATH)):
+    # 英語レベルを変更した際は事前生成した問題を破棄
+    if st.session_state.englv != st.session_state.pre_englv:
+        st.session_state.problem_prefetcher.cancel()
+    st.session_state.pre_englv = st.session_state.englv
+
+# 管理者向けに処理時間・キャッシュのヒット率・APIの利用状況・保存領域などを表示（運用時の確認用）
+if ct.ADMIN_SIDEBAR_ENABLED:
+    with st.sidebar:
+        ft.display_latency_stats()
+        ft.display_prompt_cache_stats()
+        ft.display_evaluation_cache_stats()
+        ft.display_tts_cache_stats()
+        ft.display_audio_storage_usage()
+        ft.display_conversation_memory_stats()
+        ft.display_audio_preprocess_stats()
+        ft.display_request_scheduler_stats()
+        ft.display_openai_client_stats()
+
+with st.chat_message("assistant", avatar=ai_avatar):
     st.markdown("こちらは生成AIによる音声英会話の練習アプリです。何度も繰り返し練習し、英語力をアップさせましょう。")
     st.markdown("**【操作説明】**")
     st.success("""
@@ -104,18 +132,26 @@ with st.chat_message("assistant", avatar=get_avatar_path(ct.AI_ICON_PATH)):
     """)
 st.divider()
 
-# メッセージリストの一覧表示
-for message in st.session_state.messages:
+# メッセージリストの一覧表示（直近のメッセージのみ描画し、再実行の負荷が会話の長さに比例して増えないようにする）
+hidden_message_count = max(len(st.session_state.messages) - st.session_state.visible_message_count, 0)
+if hidden_message_count and st.button("過去のメッセージを表示"):
+    st.session_state.visible_message_count += ct.CHAT_HISTORY_PAGE_SIZE
+    hidden_message_count = max(hidden_message_count - ct.CHAT_HISTORY_PAGE_SIZE, 0)
+for message in st.session_state.messages[hidden_message_count:]:
     if message["role"] == "assistant":
-        with st.chat_message(message["role"], avatar=get_avatar_path(ct.AI_ICON_PATH)):
+        with st.chat_message(message["role"], avatar=ai_avatar):
             st.markdown(message["content"])
     elif message["role"] == "user":
-        with st.chat_message(message["role"], avatar=get_avatar_path(ct.USER_ICON_PATH)):
+        with st.chat_message(message["role"], avatar=user_avatar):
             st.markdown(message["content"])
     else:
         st.divider()
 
 # LLMレスポンスの下部にモード実行のボタン表示
+# （この時点で表示していない場合は、評価結果の表示後に画面全体を再実行せずに表示する）
+shadowing_button_shown = st.session_state.shadowing_flg
+dictation_button_shown = st.session_state.dictation_flg
+chat_info_shown = st.session_state.chat_open_flg
 if st.session_state.shadowing_flg:
     st.session_state.shadowing_button_flg = st.button("シャドーイング開始")
 if st.session_state.dictation_flg:
@@ -125,6 +161,9 @@ if st.session_state.dictation_flg:
 if st.session_state.chat_open_flg:
     st.info("AIが読み上げた音声を、画面下部のチャット欄からそのまま入力・送信してください。")
 
+# 画面の表示後、モードの処理で使うOpenAI SDKと音声処理のモジュールをバックグラウンドで読み込んでおく（プロセスで1回のみ）
+ft.preload_modules(ft.PRELOAD_MODULES)
+
 st.session_state.dictation_chat_message = st.chat_input("※「ディクテーション」選択時以外は送信不可")
 
 if st.session_state.dictation_chat_message and not st.session_state.chat_open_flg:
@@ -145,7 +184,9 @@ if st.session_state.start_flg:
 
             st.session_state.chat_open_flg = True
             st.session_state.dictation_flg = False
-            st.rerun()
+            # 問題文の音声を残したまま、チャット入力の案内を表示
+            if not chat_info_shown:
+                st.info("AIが読み上げた音声を、画面下部のチャット欄からそのまま入力・送信してください。")
         # チャット入力時の処理
         else:
             # チャット欄から入力された場合にのみ評価処理が実行されるようにする
@@ -153,9 +194,9 @@ if st.session_state.start_flg:
                 st.stop()
             
             # AIメッセージとユーザーメッセージの画面表示
-            with st.chat_message("assistant", avatar=ct.AI_ICON_PATH):
+            with st.chat_message("assistant", avatar=ai_avatar):
                 st.markdown(st.session_state.problem)
-            with st.chat_message("user", avatar=ct.USER_ICON_PATH):
+            with st.chat_message("user", avatar=user_avatar):
                 st.markdown(st.session_state.dictation_chat_message)
 
             # LLMが生成した問題文とチャット入力値をメッセージリストに追加
@@ -163,15 +204,15 @@ if st.session_state.start_flg:
             st.session_state.messages.append({"role": "user", "content": st.session_state.dictation_chat_message})
             
             with st.spinner('評価結果の生成中...'):
-                system_template = ct.SYSTEM_TEMPLATE_EVALUATION.format(
-                    llm_text=st.session_state.problem,
-                    user_text=st.session_state.dictation_chat_message
-                )
                 # 問題文と回答を比較し、評価結果の生成
-                llm_response_evaluation = ft.generate_response(system_template, "")
+                llm_response_evaluation = ft.evaluate_answer(
+                    st.session_state.problem,
+                    st.session_state.dictation_chat_message,
+                    st.session_state.englv
+                )
             
             # 評価結果のメッセージリストへの追加と表示
-            with st.chat_message("assistant", avatar=ct.AI_ICON_PATH):
+            with st.chat_message("assistant", avatar=ai_avatar):
                 st.markdown(llm_response_evaluation)
             st.session_state.messages.append({"role": "assistant", "content": llm_response_evaluation})
             st.session_state.messages.append({"role": "other"})
@@ -182,7 +223,9 @@ if st.session_state.start_flg:
             st.session_state.dictation_count += 1
             st.session_state.chat_open_flg = False
 
-            st.rerun()
+            # 「ディクテーション開始」ボタンを表示
+            if not dictation_button_shown:
+                st.button("ディクテーション開始")
 
     
     # モード：「日常英会話」
@@ -191,56 +234,51 @@ if st.session_state.start_flg:
         st.info("英語で話してAIと会話しましょう。リアルタイム録音またはファイルアップロードを選択できます。")
         
         # 音声入力を受け取って音声ファイルを作成
-        audio_input_file_path = f"{ct.AUDIO_INPUT_DIR}/audio_input_{int(time.time())}.wav"
+        audio_input_file_path = st.session_state.workspace.input_path()
         
-        # 音声録音・アップロード処理
-        if not ft.record_audio(audio_input_file_path):
+        # 音声録音・アップロード処理（入力欄の操作中は入力欄のみを再実行し、次の発話の入力欄も表示したままにする）
+        audio_input = ft.get_audio_input(audio_input_file_path, keep_open=True)
+        if audio_input is None:
             st.stop()  # 音声入力が完了していない場合は処理を停止
 
         # 音声入力ファイルから文字起こしテキストを取得
         with st.spinner('音声入力をテキストに変換中...'):
-            transcript = ft.transcribe_audio(audio_input_file_path)
+            transcript = ft.transcribe_audio(audio_input)
             audio_input_text = transcript.text
 
         # 音声入力テキストの画面表示
-        with st.chat_message("user", avatar=ct.USER_ICON_PATH):
+        with st.chat_message("user", avatar=user_avatar):
             st.markdown(audio_input_text)
 
-        with st.spinner("回答の音声読み上げ準備中..."):
+        # AIメッセージの画面表示（回答の生成に合わせて表示し、文ごとに音声合成して再生）
+        with st.chat_message("assistant", avatar=ai_avatar):
             # ユーザー入力値をLLMに渡して回答取得（OpenAI API直接使用）
-            llm_response = ft.generate_response(
+            llm_response, llm_response_audio = ft.generate_response_with_speech(
                 ct.SYSTEM_TEMPLATE_BASIC_CONVERSATION, 
                 audio_input_text,
-                st.session_state.conversation_history
+                st.session_state.conversation_history,
+                speed=st.session_state.speed
             )
             
-            # 会話履歴に追加
-            st.session_state.conversation_history.extend([
-                {"role": "user", "content": audio_input_text},
-                {"role": "assistant", "content": llm_response}
-            ])
-            
-            # LLMからの回答を音声データに変換
-            llm_response_audio = st.session_state.openai_obj.audio.speech.create(
-                model="tts-1",
-                voice="alloy",
-                input=llm_response
-            )
-
-            # 一旦mp3形式で音声ファイル作成後、wav形式に変換
-            audio_output_file_path = f"{ct.AUDIO_OUTPUT_DIR}/audio_output_{int(time.time())}.wav"
-            ft.save_to_wav(llm_response_audio.content, audio_output_file_path)
+        # 会話履歴に追加
+        st.session_state.conversation_history.extend([
+            {"role": "user", "content": audio_input_text},
+            {"role": "assistant", "content": llm_response}
+        ])
 
-        # 音声ファイルの読み上げ
-        ft.play_wav(audio_output_file_path, speed=st.session_state.speed)
+        with st.spinner("回答の音声読み上げ準備中..."):
+            # 音声合成の結果をメモリ上で再生用のwav形式に変換
+            audio_output_file_path = st.session_state.workspace.output_path()
+            audio_output = ft.save_to_wav(llm_response_audio, audio_output_file_path)
 
-        # AIメッセージの画面表示とリストへの追加
-        with st.chat_message("assistant", avatar=ct.AI_ICON_PATH):
-            st.markdown(llm_response)
+        # 音声ファイルの読み上げ（聞き直し用）
+        ft.play_wav(audio_output, speed=st.session_state.speed)
 
         # ユーザー入力値とLLMからの回答をメッセージ一覧に追加
-        st.session_state.messages.append({"role": "user", "content": audio_input_text})
-        st.session_state.messages.append({"role": "assistant", "content": llm_response})
+        st.session_state.messages.extend([
+            {"role": "user", "content": audio_input_text},
+            {"role": "assistant", "content": llm_response}
+        ], conversation=True)
 
 
     # モード：「シャドーイング」
@@ -249,9 +287,10 @@ if st.session_state.start_flg:
         if st.session_state.shadowing_first_flg:
             st.session_state.shadowing_first_flg = False
         
-        if not st.session_state.shadowing_audio_input_flg:
+        # 音声入力の受け付け中は問題文を作り直さない（「シャドーイング開始」ボタン押下時を除く）
+        if not st.session_state.shadowing_audio_input_flg or st.session_state.shadowing_button_flg:
             with st.spinner('問題文生成中...'):
-                st.session_state.problem, llm_response_audio = ft.create_problem_and_play_audio()
+                st.session_state.problem, st.session_state.problem_audio = ft.create_problem_and_play_audio()
 
         # 音声入力セクション
         st.write("### 🎤 音声入力")
@@ -260,42 +299,46 @@ if st.session_state.start_flg:
         
         # 音声入力を受け取って音声ファイルを作成
         st.session_state.shadowing_audio_input_flg = True
-        audio_input_file_path = f"{ct.AUDIO_INPUT_DIR}/audio_input_{int(time.time())}.wav"
+        audio_input_file_path = st.session_state.workspace.input_path()
         
-        # 音声録音・アップロード処理
-        if not ft.record_audio(audio_input_file_path):
-            st.session_state.shadowing_audio_input_flg = False
+        # 音声録音・アップロード処理（入力欄の操作中は入力欄のみを再実行）
+        # 音声入力が完了するまでは受け付け中のままにし、入力完了時の再実行でこの処理に戻る
+        audio_input = ft.get_audio_input(audio_input_file_path)
+        if audio_input is None:
             st.stop()  # 音声入力が完了していない場合は処理を停止
             
         st.session_state.shadowing_audio_input_flg = False
 
         with st.spinner('音声入力をテキストに変換中...'):
             # 音声入力ファイルから文字起こしテキストを取得
-            transcript = ft.transcribe_audio(audio_input_file_path)
+            transcript = ft.transcribe_audio(audio_input)
             audio_input_text = transcript.text
 
         # AIメッセージとユーザーメッセージの画面表示
-        with st.chat_message("assistant", avatar=ct.AI_ICON_PATH):
+        with st.chat_message("assistant", avatar=ai_avatar):
             st.markdown(st.session_state.problem)
-        with st.chat_message("user", avatar=ct.USER_ICON_PATH):
+        with st.chat_message("user", avatar=user_avatar):
             st.markdown(audio_input_text)
         
         # LLMが生成した問題文と音声入力値をメッセージリストに追加
         st.session_state.messages.append({"role": "assistant", "content": st.session_state.problem})
         st.session_state.messages.append({"role": "user", "content": audio_input_text})
 
+        # お手本の音声と比較した結果を、評価結果の生成を待たずに表示
+        if ct.ACOUSTIC_SCORING_ENABLED and st.session_state.problem_audio is not None:
+            acoustic_evaluation = ft.score_shadowing(st.session_state.problem_audio, audio_input)
+            if acoustic_evaluation is not None:
+                with st.chat_message("assistant", avatar=ai_avatar):
+                    st.markdown(acoustic_evaluation)
+                st.session_state.messages.append({"role": "assistant", "content": acoustic_evaluation})
+
         with st.spinner('評価結果の生成中...'):
-            if st.session_state.shadowing_evaluation_first_flg:
-                system_template = ct.SYSTEM_TEMPLATE_EVALUATION.format(
-                    llm_text=st.session_state.problem,
-                    user_text=audio_input_text
-                )
-                st.session_state.shadowing_evaluation_first_flg = False
             # 問題文と回答を比較し、評価結果の生成
-            llm_response_evaluation = ft.generate_response(system_template, "")
+            llm_response_evaluation = ft.evaluate_answer(st.session_state.problem, audio_input_text, st.session_state.englv)
+            st.session_state.shadowing_evaluation_first_flg = False
         
         # 評価結果のメッセージリストへの追加と表示
-        with st.chat_message("assistant", avatar=ct.AI_ICON_PATH):
+        with st.chat_message("assistant", avatar=ai_avatar):
             st.markdown(llm_response_evaluation)
         st.session_state.messages.append({"role": "assistant", "content": llm_response_evaluation})
         st.session_state.messages.append({"role": "other"})
@@ -304,5 +347,6 @@ if st.session_state.start_flg:
         st.session_state.shadowing_flg = True
         st.session_state.shadowing_count += 1
 
-        # 「シャドーイング」ボタンを表示するために再描画
-        st.rerun()
\ No newline at end of file
+        # 「シャドーイング開始」ボタンを表示（画面全体を再実行せずに表示）
+        if not shadowing_button_shown:
+            st.button("シャドーイング開始")
\ No newline at end of file
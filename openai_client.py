@@ -0,0 +1,227 @@
+import threading
+import time
+import httpx
+
+# 429の応答にRetry-Afterがない場合に送信を止める秒数
+DEFAULT_RETRY_AFTER_SECONDS = 1.0
+
+# リクエスト先のパスと統計上のエンドポイント名の対応
+ENDPOINT_NAMES = {
+    "/chat/completions": "chat",
+    "/audio/transcriptions": "whisper",
+    "/audio/speech": "tts",
+}
+
+
+def get_endpoint_name(path):
+    """
+    リクエスト先のパスからエンドポイント名を取得
+    """
+    for suffix, name in ENDPOINT_NAMES.items():
+        if path.endswith(suffix):
+            return name
+    return "other"
+
+
+def estimate_request_tokens(endpoint, request):
+    """
+    流量制御のためにリクエストのトークン数を見積もる（Chat Completions APIのみ。本文の約4文字を1トークンとする）
+    """
+    if endpoint != "chat":
+        return 0
+    try:
+        return len(request.content) // 4
+    except httpx.RequestNotRead:
+        return 0
+
+
+def get_retry_after(response):
+    """
+    429の応答から、次のリクエストまで待つべき秒数を取得
+    """
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = response.headers.get(header)
+        if value is None:
+            continue
+        try:
+            return float(value) * scale
+        except ValueError:
+            continue
+    return DEFAULT_RETRY_AFTER_SECONDS
+
+
+class OpenAIClientStats:
+    """
+    共有OpenAIクライアントのリクエスト数・再試行対象の応答数・接続プールの状態を集計する
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self.in_flight = 0
+        self._transport = None
+
+    def attach(self, transport):
+        """
+        接続プールの状態を取得するためのトランスポートを設定
+        """
+        self._transport = transport
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self, endpoint, status_code, elapsed):
+        """
+        リクエスト1回分の結果を記録（status_codeがNoneの場合は通信エラー）
+        """
+        with self._lock:
+            self.in_flight -= 1
+            stats = self._endpoints.setdefault(endpoint, {
+                "requests": 0,
+                "errors": 0,
+                "retryable": 0,
+                "total_seconds": 0.0,
+            })
+            stats["requests"] += 1
+            stats["total_seconds"] += elapsed
+            if status_code is None or status_code >= 400:
+                stats["errors"] += 1
+            # 429・5xx・通信エラーはSDKがジッター付きの指数バックオフで再試行する
+            if status_code is None or status_code == 429 or status_code >= 500:
+                stats["retryable"] += 1
+
+    def pool_stats(self):
+        """
+        接続プール内の接続数（うち待機中の接続数）を返す
+        """
+        pool = getattr(self._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        return {
+            "connections": len(connections),
+            "idle_connections": sum(1 for connection in connections if connection.is_idle()),
+        }
+
+    def snapshot(self):
+        """
+        エンドポイントごとの集計と接続プールの状態を返す
+        """
+        with self._lock:
+            endpoints = {name: dict(stats) for name, stats in self._endpoints.items()}
+            in_flight = self.in_flight
+        return {
+            "endpoints": endpoints,
+            "in_flight": in_flight,
+            "pool": self.pool_stats(),
+        }
+
+
+class InstrumentedTransport(httpx.HTTPTransport):
+    """
+    リクエストごとの結果をOpenAIClientStatsに記録するトランスポート
+    RequestSchedulerを指定した場合は、送信前にエンドポイントの上限に収まるまで待つ
+    （待ち行列が上限に達した場合の例外は、SDKが通信エラーとして間隔を空けて再試行する）
+    """
+
+    def __init__(self, stats, scheduler=None, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+        self.scheduler = scheduler
+
+    def handle_request(self, request):
+        endpoint = get_endpoint_name(request.url.path)
+        if self.scheduler is not None:
+            self.scheduler.acquire(endpoint, estimate_request_tokens(endpoint, request))
+        start_time = time.perf_counter()
+        self.stats.request_started()
+        try:
+            response = super().handle_request(request)
+        except Exception:
+            self.stats.request_finished(endpoint, None, time.perf_counter() - start_time)
+            raise
+        self.stats.request_finished(endpoint, response.status_code, time.perf_counter() - start_time)
+        if response.status_code == 429 and self.scheduler is not None:
+            self.scheduler.penalize(endpoint, get_retry_after(response))
+        return response
+
+
+def create_openai_client(api_key, stats, max_connections, max_keepalive_connections,
+                         keepalive_expiry, max_retries, scheduler=None):
+    """
+    接続プールを共有するOpenAIクライアントを作成
+    Args:
+        stats: リクエストの集計先（OpenAIClientStats）
+        scheduler: エンドポイントごとの流量制御（RequestScheduler）
+        max_connections: 同時接続数の上限
+        max_keepalive_connections: 再利用のために保持する接続数の上限
+        keepalive_expiry: 待機中の接続を保持する秒数
+        max_retries: 429・5xx・タイムアウト時の再試行回数
+    """
+    # OpenAI SDKは読み込みに時間がかかるため、最初のクライアント作成時に読み込む
+    from openai import OpenAI
+
+    transport = InstrumentedTransport(
+        stats,
+        scheduler,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+    )
+    stats.attach(transport)
+    return OpenAI(
+        api_key=api_key,
+        max_retries=max_retries,
+        http_client=httpx.Client(transport=transport),
+    )
+
+
+class PromptCacheStats:
+    """
+    Chat Completions APIの応答のusageから、プロンプトのトークン数とプロンプトキャッシュに
+    ヒットしたトークン数を集計する
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._prompts = {}
+
+    def record(self, prompt_name, usage):
+        """
+        応答1回分のusageを記録（usageがない応答は無視）
+        Args:
+            prompt_name: 集計上のプロンプト名（"evaluation" など）
+            usage: 応答のusage
+        """
+        if usage is None:
+            return
+        prompt_tokens = usage.prompt_tokens or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", None) or 0
+        with self._lock:
+            stats = self._prompts.setdefault(prompt_name, {
+                "requests": 0,
+                "cached_requests": 0,
+                "prompt_tokens": 0,
+                "cached_tokens": 0,
+            })
+            stats["requests"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["cached_tokens"] += cached_tokens
+            if cached_tokens:
+                stats["cached_requests"] += 1
+
+    def snapshot(self):
+        """
+        プロンプトごとの集計と、キャッシュヒット率（キャッシュされたトークン数 / プロンプトのトークン数）を返す
+        """
+        with self._lock:
+            prompts = {name: dict(stats) for name, stats in self._prompts.items()}
+        total = {"requests": 0, "cached_requests": 0, "prompt_tokens": 0, "cached_tokens": 0}
+        for stats in prompts.values():
+            for key in total:
+                total[key] += stats[key]
+        for stats in list(prompts.values()) + [total]:
+            stats["hit_rate"] = stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0
+        return {"prompts": prompts, "total": total}
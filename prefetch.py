@@ -0,0 +1,69 @@
+import threading
+
+
+class ProblemPrefetcher:
+    """
+    次の問題文と音声をバックグラウンドで事前生成する（セッションごとに1つ保持）
+    事前生成した結果は (英語レベル, 再生速度) のキーが一致する場合のみ利用する
+    """
+
+    def __init__(self, executor):
+        """
+        Args:
+            executor: 事前生成を実行するExecutor（全セッションで共有）
+        """
+        self._executor = executor
+        self._lock = threading.Lock()
+        self._future = None
+        self._key = None
+
+    def schedule(self, key, create_func):
+        """
+        次の問題の事前生成を開始（同じキーで実行中・完了済みのものがあれば何もしない）
+        Args:
+            key: 事前生成の条件を表すキー
+            create_func: (問題文, 音声データ) を返す関数
+        """
+        with self._lock:
+            if self._future is not None and self._key == key:
+                return
+            self._discard()
+            self._key = key
+            self._future = self._executor.submit(create_func)
+
+    def take(self, key):
+        """
+        事前生成した (問題文, 音声データ) を取り出す
+        生成中の場合は完了を待ち、キーが異なる場合や生成に失敗した場合はNoneを返す
+        """
+        with self._lock:
+            future = self._future
+            matched = future is not None and self._key == key
+            if not matched:
+                self._discard()
+                return None
+            self._future = None
+            self._key = None
+
+        try:
+            return future.result()
+        except Exception:
+            # 事前生成の失敗は通常の生成処理にフォールバックさせる
+            return None
+
+    def cancel(self):
+        """
+        事前生成を取り消し、生成済みの結果を破棄
+        """
+        with self._lock:
+            self._discard()
+
+    def _discard(self):
+        """
+        保持している事前生成を破棄（ロック取得済みで呼び出す）
+        """
+        if self._future is not None:
+            # 実行中のものは取り消せないが、結果は参照されずに破棄される
+            self._future.cancel()
+        self._future = None
+        self._key = None
@@ -0,0 +1,193 @@
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from scoring import normalize_words
+
+# カテゴリの指定がない問題文のカテゴリ
+DEFAULT_CATEGORY = "general"
+
+# 生成結果の各行の先頭の箇条書き記号・番号（例：「- 」「1. 」「2) 」）
+LINE_PREFIX_PATTERN = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+# 「カテゴリ: 問題文」の形式の行
+CATEGORY_LINE_PATTERN = re.compile(r"^([A-Za-z_]+)\s*:\s*(.+)$")
+
+
+def normalize_problem_text(text):
+    """
+    重複判定用に問題文を正規化（大文字・小文字、句読点、短縮形、数字の表記ゆれを吸収する）
+    """
+    return " ".join(normalize_words(text))
+
+
+def parse_problem_batch(text, categories):
+    """
+    まとめて生成した問題文を (カテゴリ, 問題文) のリストに変換
+    Args:
+        text: 1行に1問、「カテゴリ: 問題文」の形式で生成された文字列
+        categories: 有効なカテゴリのリスト（それ以外はDEFAULT_CATEGORYとして扱う）
+    """
+    problems = []
+    for line in text.splitlines():
+        line = LINE_PREFIX_PATTERN.sub("", line).strip()
+        if not line:
+            continue
+        category = DEFAULT_CATEGORY
+        match = CATEGORY_LINE_PATTERN.match(line)
+        if match and match.group(1).lower() in categories:
+            category = match.group(1).lower()
+            line = match.group(2)
+        line = line.strip().strip('"“”').strip()
+        if normalize_problem_text(line):
+            problems.append((category, line))
+    return problems
+
+
+class ProblemBank:
+    """
+    英語レベル・カテゴリごとの問題文と音声データをSQLiteに保存し、全ユーザーで再利用する
+    同じ英語レベルの中では、正規化した英文が同じ問題文は重複して保存しない
+    """
+
+    def __init__(self, db_path):
+        """
+        Args:
+            db_path: SQLiteのデータベースファイルのパス
+        """
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # 補充中の英語レベル（同じレベルの補充を重複して実行しない）
+        self._refilling = set()
+        self.served = 0
+        self.added = 0
+        self.duplicates = 0
+
+        # 全スレッドで1つの接続を共有し、ロックで直列化する（複数プロセスからの書き込みはWALで扱う）
+        self._connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS problems (
+                    id INTEGER PRIMARY KEY,
+                    level TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    normalized TEXT NOT NULL,
+                    audio BLOB NOT NULL,
+                    audio_format TEXT NOT NULL,
+                    served_count INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    UNIQUE (level, normalized)
+                )
+            """)
+
+    def contains(self, level, text):
+        """
+        正規化した英文が同じ問題文が保存済みかどうか
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM problems WHERE level = ? AND normalized = ?",
+                (level, normalize_problem_text(text))
+            ).fetchone()
+        return row is not None
+
+    def add(self, level, category, text, audio, audio_format):
+        """
+        問題文と音声データを保存
+        Returns:
+            保存した場合はTrue、正規化した英文が同じ問題文が保存済みの場合や英文を含まない場合はFalse
+        """
+        normalized = normalize_problem_text(text)
+        if not normalized:
+            return False
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "INSERT OR IGNORE INTO problems (level, category, text, normalized, audio, audio_format, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (level, category, text, normalized, audio, audio_format, time.time())
+            )
+            if cursor.rowcount:
+                self.added += 1
+                return True
+            self.duplicates += 1
+            return False
+
+    def _unseen_ids(self, level, audio_format, seen):
+        """
+        ユーザーに未出題の問題のIDのリストを取得（ロック取得済みで呼び出す）
+        """
+        rows = self._connection.execute(
+            "SELECT id, normalized FROM problems WHERE level = ? AND audio_format = ?",
+            (level, audio_format)
+        ).fetchall()
+        return [problem_id for problem_id, normalized in rows if normalized not in seen]
+
+    def count_unseen(self, level, audio_format, seen):
+        """
+        ユーザーに未出題の問題数を取得
+        Args:
+            seen: ユーザーに出題済みの問題文（正規化済み）の集合
+        """
+        with self._lock:
+            return len(self._unseen_ids(level, audio_format, seen))
+
+    def take(self, level, audio_format, seen):
+        """
+        ユーザーに未出題の問題をランダムに1つ取り出す
+        Args:
+            level: 英語レベル
+            audio_format: 音声データの形式（異なる形式で保存された問題は使わない）
+            seen: ユーザーに出題済みの問題文（正規化済み）の集合
+        Returns:
+            (問題文, 音声データ)。未出題の問題がない場合はNone
+        """
+        with self._lock:
+            unseen_ids = self._unseen_ids(level, audio_format, seen)
+            if not unseen_ids:
+                return None
+            problem_id = random.choice(unseen_ids)
+            with self._connection:
+                self._connection.execute(
+                    "UPDATE problems SET served_count = served_count + 1 WHERE id = ?", (problem_id,)
+                )
+            text, audio = self._connection.execute(
+                "SELECT text, audio FROM problems WHERE id = ?", (problem_id,)
+            ).fetchone()
+            self.served += 1
+        return text, bytes(audio)
+
+    def schedule_refill(self, executor, level, fill_func):
+        """
+        問題の補充をバックグラウンドで開始（同じ英語レベルの補充が実行中の場合は何もしない）
+        Args:
+            executor: 補充を実行するExecutor
+            level: 英語レベル
+            fill_func: 問題を生成してバンクに追加する関数
+        Returns:
+            補充を開始した場合はTrue
+        """
+        with self._lock:
+            if level in self._refilling:
+                return False
+            self._refilling.add(level)
+
+        def run():
+            try:
+                fill_func()
+            finally:
+                with self._lock:
+                    self._refilling.discard(level)
+
+        try:
+            executor.submit(run)
+        except RuntimeError:
+            # Executorが終了している場合は補充しない
+            with self._lock:
+                self._refilling.discard(level)
+            return False
+        return True
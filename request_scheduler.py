@@ -0,0 +1,217 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from tracing import percentile
+
+# リクエストの優先度（値が小さいほど優先）
+INTERACTIVE = 0
+SPECULATIVE = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", SPECULATIVE: "speculative"}
+
+# 現在のスレッドで送るリクエストの優先度（バックグラウンドの処理では request_priority で変更する）
+current_priority = ContextVar("current_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def request_priority(priority):
+    """
+    この中で送るOpenAI APIのリクエストの優先度を設定
+    """
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+class SchedulerQueueFull(RuntimeError):
+    """
+    エンドポイントの待ち行列が上限に達しているため、リクエストを受け付けられない
+    """
+
+
+class TokenBucket:
+    """
+    1分あたりの上限から一定の速度で補充されるトークンバケット
+    """
+
+    def __init__(self, per_minute, burst_seconds):
+        """
+        Args:
+            per_minute: 1分あたりの上限
+            burst_seconds: 連続して使える量（この秒数分の補充量をバケットの容量とする）
+        """
+        self.rate = per_minute / 60.0
+        self.capacity = max(self.rate * burst_seconds, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def wait_time(self, amount, reserve, now):
+        """
+        amount を使えるようになるまでの秒数（0の場合はすぐに使える）
+        Args:
+            reserve: 使った後も残しておく量（容量に対する割合）
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        # 容量を超える量は、バケットが満杯になった時点で前借りして使う
+        needed = min(min(amount, self.capacity) + reserve * self.capacity, self.capacity)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def consume(self, amount):
+        self.tokens -= amount
+
+
+class RequestScheduler:
+    """
+    全セッションのOpenAI APIのリクエストを、エンドポイントごとのRPM・TPMの上限に収まるように送り出す
+    待ち行列では対話中の処理（ユーザーが結果を待っている処理）を投機的な処理（事前生成・要約など）より優先し、
+    投機的な処理には上限の一部を残しておく。待ち行列が上限に達した場合は新しいリクエストを拒否する
+    """
+
+    def __init__(self, limits, max_queue, burst_seconds=10.0, speculative_reserve=0.2, trace_store=None,
+                 recent_samples=1000):
+        """
+        Args:
+            limits: エンドポイント名 -> {"rpm": 1分あたりのリクエスト数, "tpm": 1分あたりのトークン数（Noneで制限なし）}
+            max_queue: エンドポイントごとの待ち行列の上限（投機的な処理はこの半分で拒否）
+            burst_seconds: 連続して送れる量（この秒数分の上限）
+            speculative_reserve: 投機的な処理が使わずに残しておく、バケットの容量に対する割合
+            trace_store: 待ち時間を記録するTraceStore
+            recent_samples: 待ち時間のパーセンタイルの計算に使う直近のサンプル数
+        """
+        self.max_queue = max_queue
+        self.speculative_reserve = speculative_reserve
+        self.trace_store = trace_store
+        self._buckets = {
+            endpoint: (
+                TokenBucket(limit["rpm"], burst_seconds),
+                TokenBucket(limit["tpm"], burst_seconds) if limit.get("tpm") else None,
+            )
+            for endpoint, limit in limits.items()
+        }
+        self._condition = threading.Condition()
+        self._sequence = itertools.count()
+        # エンドポイント名 -> (優先度, 受付順) のヒープ
+        self._queues = {endpoint: [] for endpoint in limits}
+        # (エンドポイント名, 優先度) -> 集計
+        self._stats = {}
+        self._recent_samples = recent_samples
+
+    def _stats_for(self, endpoint, priority):
+        return self._stats.setdefault((endpoint, priority), {
+            "requests": 0,
+            "rejected": 0,
+            "total_wait": 0.0,
+            "max_wait": 0.0,
+            "recent": deque(maxlen=self._recent_samples),
+        })
+
+    def _wait_time(self, endpoint, tokens, priority, now):
+        """
+        リクエストを送れるようになるまでの秒数（ロック取得済みで呼び出す）
+        """
+        reserve = self.speculative_reserve if priority == SPECULATIVE else 0.0
+        request_bucket, token_bucket = self._buckets[endpoint]
+        wait = request_bucket.wait_time(1, reserve, now)
+        if token_bucket is not None:
+            wait = max(wait, token_bucket.wait_time(tokens, reserve, now))
+        return wait
+
+    def acquire(self, endpoint, tokens=0, priority=None):
+        """
+        リクエストを送れるようになるまで待つ（制限のないエンドポイントはすぐに戻る）
+        Args:
+            endpoint: エンドポイント名
+            tokens: リクエストのトークン数の見積もり
+            priority: 優先度（省略時は現在のスレッドの優先度）
+        Returns:
+            待ち時間（秒）
+        Raises:
+            SchedulerQueueFull: 待ち行列が上限に達している場合
+        """
+        if endpoint not in self._buckets:
+            return 0.0
+        if priority is None:
+            priority = current_priority.get()
+
+        start_time = time.monotonic()
+        with self._condition:
+            queue = self._queues[endpoint]
+            stats = self._stats_for(endpoint, priority)
+            queue_limit = self.max_queue if priority == INTERACTIVE else self.max_queue // 2
+            if len(queue) >= queue_limit:
+                stats["rejected"] += 1
+                raise SchedulerQueueFull(f"{endpoint}: {len(queue)} requests waiting")
+
+            entry = (priority, next(self._sequence))
+            heapq.heappush(queue, entry)
+            # 先頭が入れ替わった可能性があるため、待っているスレッドに再確認させる
+            self._condition.notify_all()
+            try:
+                while True:
+                    if queue[0] == entry:
+                        wait = self._wait_time(endpoint, tokens, priority, time.monotonic())
+                        if wait == 0.0:
+                            break
+                        self._condition.wait(wait)
+                    else:
+                        self._condition.wait()
+            finally:
+                queue.remove(entry)
+                heapq.heapify(queue)
+                self._condition.notify_all()
+
+            request_bucket, token_bucket = self._buckets[endpoint]
+            request_bucket.consume(1)
+            if token_bucket is not None:
+                token_bucket.consume(tokens)
+
+            waited = time.monotonic() - start_time
+            stats["requests"] += 1
+            stats["total_wait"] += waited
+            stats["max_wait"] = max(stats["max_wait"], waited)
+            stats["recent"].append(waited)
+
+        if self.trace_store is not None:
+            self.trace_store.record(f"queue_wait.{endpoint}", waited, {"priority": PRIORITY_NAMES[priority]})
+        return waited
+
+    def penalize(self, endpoint, seconds):
+        """
+        429の応答を受けた場合などに、指定の秒数だけエンドポイントへの送信を止める
+        """
+        if endpoint not in self._buckets:
+            return
+        with self._condition:
+            until = time.monotonic() + seconds
+            for bucket in self._buckets[endpoint]:
+                if bucket is not None:
+                    bucket.blocked_until = max(bucket.blocked_until, until)
+            self._condition.notify_all()
+
+    def snapshot(self):
+        """
+        エンドポイント・優先度ごとのリクエスト数・拒否数・待ち時間と、現在の待ち行列の長さを取得
+        """
+        with self._condition:
+            queues = {endpoint: len(queue) for endpoint, queue in self._queues.items()}
+            stats = {key: dict(value, recent=sorted(value["recent"])) for key, value in self._stats.items()}
+
+        endpoints = {endpoint: {"queue_depth": depth, "priorities": {}} for endpoint, depth in queues.items()}
+        for (endpoint, priority), value in sorted(stats.items()):
+            recent = value.pop("recent")
+            value["mean_wait"] = value["total_wait"] / value["requests"] if value["requests"] else 0.0
+            value["p50_wait"] = percentile(recent, 0.50) if recent else 0.0
+            value["p95_wait"] = percentile(recent, 0.95) if recent else 0.0
+            endpoints[endpoint]["priorities"][PRIORITY_NAMES[priority]] = value
+        return endpoints
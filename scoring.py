@@ -0,0 +1,193 @@
+import re
+
+# 個別に展開する短縮形（規則的に展開できないもの）
+CONTRACTIONS = {
+    "won't": "will not",
+    "can't": "can not",
+    "cannot": "can not",
+    "shan't": "shall not",
+    "ain't": "is not",
+    "let's": "let us",
+    "it's": "it is",
+    "that's": "that is",
+    "what's": "what is",
+    "there's": "there is",
+    "here's": "here is",
+    "he's": "he is",
+    "she's": "she is",
+    "who's": "who is",
+    "where's": "where is",
+    "how's": "how is",
+    "gonna": "going to",
+    "wanna": "want to",
+}
+
+# 規則的に展開できる短縮形の語尾
+CONTRACTION_SUFFIXES = [
+    ("n't", " not"),
+    ("'re", " are"),
+    ("'m", " am"),
+    ("'ll", " will"),
+    ("'ve", " have"),
+    ("'d", " would"),
+]
+
+NUMBER_WORDS = [
+    "zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine",
+    "ten", "eleven", "twelve", "thirteen", "fourteen", "fifteen", "sixteen",
+    "seventeen", "eighteen", "nineteen",
+]
+TENS_WORDS = ["", "", "twenty", "thirty", "forty", "fifty", "sixty", "seventy", "eighty", "ninety"]
+
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+def number_to_words(number):
+    """
+    0〜999,999の整数を英単語に変換
+    """
+    if number < 20:
+        return NUMBER_WORDS[number]
+    if number < 100:
+        tens, ones = divmod(number, 10)
+        return TENS_WORDS[tens] + (f" {NUMBER_WORDS[ones]}" if ones else "")
+    if number < 1000:
+        hundreds, rest = divmod(number, 100)
+        return f"{NUMBER_WORDS[hundreds]} hundred" + (f" {number_to_words(rest)}" if rest else "")
+    thousands, rest = divmod(number, 1000)
+    return f"{number_to_words(thousands)} thousand" + (f" {number_to_words(rest)}" if rest else "")
+
+
+def normalize_words(text):
+    """
+    比較用に英文を正規化して単語リストに変換
+    （大文字・小文字、句読点、短縮形、数字の表記ゆれを吸収する）
+    """
+    text = text.lower().replace("’", "'").replace("‘", "'")
+    # 桁区切りのカンマを除去（例：1,000 → 1000）
+    text = re.sub(r"(?<=\d),(?=\d{3})", "", text)
+
+    words = []
+    for word in WORD_PATTERN.findall(text):
+        word = word.strip("'")
+        if not word:
+            continue
+        if word in CONTRACTIONS:
+            word = CONTRACTIONS[word]
+        else:
+            for suffix, expansion in CONTRACTION_SUFFIXES:
+                if word.endswith(suffix):
+                    word = word[:-len(suffix)] + expansion
+                    break
+        for part in word.split():
+            # 残ったアポストロフィは表記ゆれとして除去（例：o'clock → oclock）
+            part = part.replace("'", "")
+            if part.isdigit() and int(part) < 1000000:
+                words.extend(number_to_words(int(part)).split())
+            else:
+                words.append(part)
+    return words
+
+
+def align_words(reference_words, answer_words):
+    """
+    編集距離で単語単位の対応付けを行う
+    Returns:
+        (種別, 問題文の単語, 回答の単語) のリスト
+        種別は "correct" / "substituted" / "missing" / "extra"
+    """
+    rows = len(reference_words) + 1
+    cols = len(answer_words) + 1
+    distances = [[0] * cols for _ in range(rows)]
+    for i in range(rows):
+        distances[i][0] = i
+    for j in range(cols):
+        distances[0][j] = j
+    for i in range(1, rows):
+        for j in range(1, cols):
+            cost = 0 if reference_words[i - 1] == answer_words[j - 1] else 1
+            distances[i][j] = min(
+                distances[i - 1][j - 1] + cost,
+                distances[i - 1][j] + 1,
+                distances[i][j - 1] + 1,
+            )
+
+    # 末尾から辿って対応付けを復元
+    # 同じ距離の経路が複数ある場合は、一致 → 抜け・余分 → 置き換えの順に優先する
+    # （置き換えを優先すると、1語の抜けの後ろの単語が連鎖的に置き換えと判定される）
+    operations = []
+    i, j = rows - 1, cols - 1
+    while i > 0 or j > 0:
+        if i > 0 and j > 0 and reference_words[i - 1] == answer_words[j - 1] \
+                and distances[i][j] == distances[i - 1][j - 1]:
+            operations.append(("correct", reference_words[i - 1], answer_words[j - 1]))
+            i, j = i - 1, j - 1
+        elif i > 0 and distances[i][j] == distances[i - 1][j] + 1:
+            operations.append(("missing", reference_words[i - 1], None))
+            i -= 1
+        elif j > 0 and distances[i][j] == distances[i][j - 1] + 1:
+            operations.append(("extra", None, answer_words[j - 1]))
+            j -= 1
+        else:
+            operations.append(("substituted", reference_words[i - 1], answer_words[j - 1]))
+            i, j = i - 1, j - 1
+    operations.reverse()
+    return operations
+
+
+def score_answer(problem, answer):
+    """
+    問題文と回答を単語単位で比較して採点
+    Returns:
+        正確な単語・抜け落ちた単語・誤った単語・追加された単語と正確さ（0〜1）を含む辞書
+    """
+    reference_words = normalize_words(problem)
+    answer_words = normalize_words(answer)
+    operations = align_words(reference_words, answer_words)
+
+    correct = [ref for kind, ref, _ in operations if kind == "correct"]
+    missing = [ref for kind, ref, _ in operations if kind == "missing"]
+    substituted = [(ref, ans) for kind, ref, ans in operations if kind == "substituted"]
+    extra = [ans for kind, _, ans in operations if kind == "extra"]
+
+    errors = len(missing) + len(substituted) + len(extra)
+    accuracy = max(0.0, 1.0 - errors / len(reference_words)) if reference_words else 0.0
+    return {
+        "reference_words": reference_words,
+        "answer_words": answer_words,
+        "correct": correct,
+        "missing": missing,
+        "substituted": substituted,
+        "extra": extra,
+        "accuracy": accuracy,
+    }
+
+
+def format_alignment(result):
+    """
+    採点結果をLLMに渡すための比較結果テキストに変換
+    """
+    lines = [
+        f"正確さ：{result['accuracy']:.0%}（{len(result['correct'])}/{len(result['reference_words'])}語一致）",
+        "誤った単語：" + (", ".join(f"{ref} → {ans}" for ref, ans in result["substituted"]) or "なし"),
+        "抜け落ちた単語：" + (", ".join(result["missing"]) or "なし"),
+        "追加された単語：" + (", ".join(result["extra"]) or "なし"),
+    ]
+    return "\n".join(lines)
+
+
+def format_evaluation(result):
+    """
+    採点結果を【評価】セクションのテキストに変換
+    """
+    lines = [
+        "【評価】",
+        f"✓ {len(result['reference_words'])}語中{len(result['correct'])}語を正確に再現できました（正確さ {result['accuracy']:.0%}）",
+    ]
+    for ref, ans in result["substituted"]:
+        lines.append(f"△ 「{ref}」が「{ans}」になっています")
+    if result["missing"]:
+        lines.append("△ 抜け落ちた単語：" + ", ".join(result["missing"]))
+    if result["extra"]:
+        lines.append("△ 追加された単語：" + ", ".join(result["extra"]))
+    return "  \n".join(lines)
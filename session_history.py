@@ -0,0 +1,190 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+
+class SessionHistoryStore:
+    """
+    全セッションのメッセージ一覧をSQLiteに保存する（全セッションで共有）
+    セッションのキーごとに追加順の番号を付けて保存し、サーバーの再起動後も復元できるようにする
+    """
+
+    def __init__(self, db_path, max_age_seconds=None):
+        """
+        Args:
+            db_path: SQLiteのデータベースファイルのパス
+            max_age_seconds: 最後のメッセージからこの秒数が経過したセッションを起動時に削除（Noneの場合は削除しない）
+        """
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # 全スレッドで1つの接続を共有し、ロックで直列化する
+        self._connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            # WALでは通常の書き込みごとのfsyncを省略しても、電源断以外でデータは失われない
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    session_key TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT,
+                    conversation INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (session_key, seq)
+                )
+            """)
+            if max_age_seconds is not None:
+                self._connection.execute("""
+                    DELETE FROM messages WHERE session_key IN (
+                        SELECT session_key FROM messages GROUP BY session_key HAVING MAX(created_at) < ?
+                    )
+                """, (time.time() - max_age_seconds,))
+
+    def append(self, session_key, messages, conversation=False):
+        """
+        メッセージを追加
+        番号はデータベース上の最大の番号の続きを書き込みと同じトランザクション内で割り当てる
+        （同じURLを複数のタブで開いた場合も、互いのメッセージを上書きしない）
+        Args:
+            conversation: 会話履歴（LLMに渡す会話）として復元するメッセージかどうか
+        Returns:
+            最初のメッセージに割り当てた番号
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            # 他のプロセスからの書き込みとも番号が重ならないよう、番号の取得前に書き込みロックを取る
+            self._connection.execute("BEGIN IMMEDIATE")
+            start_seq = self._connection.execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE session_key = ?", (session_key,)
+            ).fetchone()[0]
+            self._connection.executemany(
+                "INSERT INTO messages (session_key, seq, role, content, conversation, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (session_key, start_seq + offset, message["role"], message.get("content"), int(conversation), now)
+                    for offset, message in enumerate(messages)
+                ]
+            )
+        return start_seq
+
+    def count(self, session_key):
+        """
+        セッションのメッセージ数を取得
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE session_key = ?", (session_key,)
+            ).fetchone()
+        return row[0]
+
+    def load(self, session_key, start, end):
+        """
+        番号が start 以上 end 未満のメッセージを古い順に取得
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT role, content FROM messages WHERE session_key = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (session_key, start, end)
+            ).fetchall()
+        return [to_message(role, content) for role, content in rows]
+
+    def load_conversation(self, session_key, limit):
+        """
+        会話履歴として保存した直近のメッセージを、最大 limit 件まで古い順に取得
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT role, content FROM messages WHERE session_key = ? AND conversation = 1 "
+                "ORDER BY seq DESC LIMIT ?",
+                (session_key, limit)
+            ).fetchall()
+        return [to_message(role, content) for role, content in reversed(rows)]
+
+
+def to_message(role, content):
+    """
+    保存した行を画面表示用のメッセージの辞書に変換（区切り線は内容なし）
+    """
+    if content is None:
+        return {"role": role}
+    return {"role": role, "content": content}
+
+
+class SessionHistory:
+    """
+    1セッション分のメッセージ一覧
+    全てのメッセージをSessionHistoryStoreに保存し、メモリ上には直近のメッセージのみを保持する
+    古いメッセージは参照された時にSessionHistoryStoreから読み込む（listと同様に len・append・スライスで参照できる）
+    """
+
+    def __init__(self, store, session_key, memory_messages):
+        """
+        Args:
+            store: メッセージの保存先
+            session_key: セッションのキー（保存済みのメッセージがあれば直近の分を読み込んで復元）
+            memory_messages: メモリ上に保持するメッセージ数
+        """
+        self.store = store
+        self.session_key = session_key
+        self.memory_messages = memory_messages
+        self._load_recent(store.count(session_key))
+
+    def _load_recent(self, count):
+        """
+        保存済みのメッセージ数を count として、直近のメッセージをメモリ上に読み込む
+        """
+        self._count = count
+        self._recent = deque(
+            self.store.load(self.session_key, max(count - self.memory_messages, 0), count),
+            maxlen=self.memory_messages
+        )
+
+    def __len__(self):
+        return self._count
+
+    def append(self, message):
+        self.extend([message])
+
+    def extend(self, messages, conversation=False):
+        """
+        メッセージを追加
+        Args:
+            conversation: 会話履歴（LLMに渡す会話）として復元するメッセージかどうか
+        """
+        messages = list(messages)
+        start_seq = self.store.append(self.session_key, messages, conversation)
+        if start_seq == self._count:
+            self._recent.extend(messages)
+            self._count += len(messages)
+        else:
+            # 同じセッションのキーを開いている別のタブが先に追加していた場合は、その分も含めて読み直す
+            self._load_recent(start_seq + len(messages))
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            if index < 0:
+                index += self._count
+            if not 0 <= index < self._count:
+                raise IndexError("message index out of range")
+            return self[index:index + 1][0]
+
+        start, stop, step = index.indices(self._count)
+        if start >= stop:
+            return []
+        memory_start = self._count - len(self._recent)
+        if start >= memory_start:
+            messages = list(self._recent)[start - memory_start:stop - memory_start]
+        else:
+            messages = self.store.load(self.session_key, start, stop)
+        return messages[::step]
+
+    def conversation_messages(self, limit):
+        """
+        会話履歴として保存した直近のメッセージを取得（サーバーの再起動後の会話履歴の復元に使う）
+        """
+        return self.store.load_conversation(self.session_key, limit)
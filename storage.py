@@ -0,0 +1,268 @@
+import itertools
+import os
+import shutil
+import threading
+import time
+import uuid
+import weakref
+
+# 掃除の対象外とするファイル
+IGNORED_FILE_NAMES = {".gitkeep"}
+
+
+class AudioStorageManager:
+    """
+    音声ファイルの保存領域を経過時間と容量（全体・セッションごと）の上限で管理する
+    バックグラウンドの掃除スレッドが、古いファイルから削除する
+    （音声はメモリ上のバッファで処理し、保存したファイルは読み戻さないため、いつ削除しても処理に影響しない）
+    """
+
+    def __init__(self, directories, max_total_bytes, max_session_bytes, max_age_seconds,
+                 sweep_interval_seconds=60, excluded_directories=()):
+        """
+        Args:
+            directories: 管理対象のディレクトリのリスト
+            max_total_bytes: 全体の容量上限（バイト）
+            max_session_bytes: セッションごとの容量上限（バイト）
+            max_age_seconds: ファイルを残す最大の経過時間（秒）
+            sweep_interval_seconds: 掃除の実行間隔（秒）
+            excluded_directories: 管理対象外のディレクトリ（独自に容量管理している音声合成キャッシュなど）
+        """
+        self.directories = list(directories)
+        self.max_total_bytes = max_total_bytes
+        self.max_session_bytes = max_session_bytes
+        self.max_age_seconds = max_age_seconds
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self.excluded_directories = {os.path.abspath(path) for path in excluded_directories}
+        self._lock = threading.Lock()
+        # ファイルパス -> セッションID
+        self._owners = {}
+        self._usage = {"total_bytes": 0, "files": 0, "sessions": {}}
+        self.deleted_files = 0
+        self.deleted_bytes = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def register(self, path, session_id=None):
+        """
+        保存したファイルをセッションに紐づけて登録
+        """
+        with self._lock:
+            self._owners[os.path.abspath(path)] = session_id
+
+    def forget_session(self, session_id):
+        """
+        セッションに紐づくファイルの登録を解除し、次回の掃除で容量上限の判定から外す
+        """
+        with self._lock:
+            for path, owner in list(self._owners.items()):
+                if owner == session_id:
+                    self._owners[path] = None
+
+    def _scan(self):
+        """
+        管理対象のファイルを (パス, バイト数, 更新時刻) のリストで取得
+        """
+        files = []
+        for directory in self.directories:
+            for root, dirs, names in os.walk(directory):
+                dirs[:] = [
+                    name for name in dirs
+                    if os.path.abspath(os.path.join(root, name)) not in self.excluded_directories
+                ]
+                for name in names:
+                    if name in IGNORED_FILE_NAMES:
+                        continue
+                    path = os.path.abspath(os.path.join(root, name))
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((path, stat.st_size, stat.st_mtime))
+        return files
+
+    def _delete(self, path, size):
+        """
+        ファイルを削除（他のスレッドやプロセスに削除済みの場合は無視）
+        """
+        try:
+            os.remove(path)
+        except OSError:
+            return False
+        self.deleted_files += 1
+        self.deleted_bytes += size
+        return True
+
+    def sweep(self):
+        """
+        経過時間と容量の上限を超えたファイルを古い順に削除
+        Returns:
+            削除したファイル数
+        """
+        now = time.time()
+        files = sorted(self._scan(), key=lambda file: file[2])
+        with self._lock:
+            owners = dict(self._owners)
+
+        deleted = set()
+
+        # 経過時間の上限を超えたファイルを削除
+        for path, size, mtime in files:
+            if now - mtime > self.max_age_seconds:
+                if self._delete(path, size):
+                    deleted.add(path)
+        files = [file for file in files if file[0] not in deleted]
+
+        # セッションごとの容量上限を超えた分を古い順に削除
+        session_bytes = {}
+        for path, size, _ in files:
+            owner = owners.get(path)
+            if owner is not None:
+                session_bytes[owner] = session_bytes.get(owner, 0) + size
+        for path, size, _ in files:
+            owner = owners.get(path)
+            if owner is None or session_bytes[owner] <= self.max_session_bytes:
+                continue
+            if self._delete(path, size):
+                deleted.add(path)
+                session_bytes[owner] -= size
+        files = [file for file in files if file[0] not in deleted]
+
+        # 全体の容量上限を超えた分を古い順に削除
+        total_bytes = sum(size for _, size, _ in files)
+        for path, size, _ in files:
+            if total_bytes <= self.max_total_bytes:
+                break
+            if self._delete(path, size):
+                deleted.add(path)
+                total_bytes -= size
+                owner = owners.get(path)
+                if owner is not None:
+                    session_bytes[owner] -= size
+        files = [file for file in files if file[0] not in deleted]
+        self._remove_empty_directories(now)
+
+        existing = {path for path, _, _ in files}
+        with self._lock:
+            # 削除済み・存在しないファイルの登録を解除
+            for path in list(self._owners):
+                if path not in existing:
+                    del self._owners[path]
+            self._usage = {
+                "total_bytes": total_bytes,
+                "files": len(files),
+                "sessions": {owner: size for owner, size in session_bytes.items() if size > 0},
+            }
+        return len(deleted)
+
+    def _remove_empty_directories(self, now):
+        """
+        終了したセッションなどが残した空のディレクトリを削除（作成直後のものは残す）
+        """
+        for directory in self.directories:
+            for root, dirs, names in os.walk(directory, topdown=False):
+                path = os.path.abspath(root)
+                if path == os.path.abspath(directory) or names or dirs:
+                    continue
+                if any(path.startswith(excluded) for excluded in self.excluded_directories):
+                    continue
+                try:
+                    if now - os.stat(path).st_mtime > self.max_age_seconds:
+                        os.rmdir(path)
+                except OSError:
+                    pass
+
+    def usage(self):
+        """
+        直近の掃除時点の使用量（全体・セッションごと）と、これまでに削除した量を返す
+        """
+        with self._lock:
+            return {
+                **self._usage,
+                "max_total_bytes": self.max_total_bytes,
+                "max_session_bytes": self.max_session_bytes,
+                "deleted_files": self.deleted_files,
+                "deleted_bytes": self.deleted_bytes,
+            }
+
+    def start(self):
+        """
+        掃除スレッドを開始（実行済みの場合は何もしない）
+        """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="audio-storage-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        掃除スレッドを停止
+        """
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.sweep()
+            except Exception:
+                # 掃除の失敗でスレッドを止めない（次回の実行で再試行）
+                pass
+            self._stop_event.wait(self.sweep_interval_seconds)
+
+
+def remove_session_files(directories, session_id, storage_manager=None):
+    """
+    セッションの作業ディレクトリを削除し、保存領域の管理からセッションの登録を解除
+    """
+    for directory in directories:
+        shutil.rmtree(directory, ignore_errors=True)
+    if storage_manager is not None:
+        storage_manager.forget_session(session_id)
+
+
+class SessionWorkspace:
+    """
+    セッションごとの音声ファイルの作業ディレクトリ
+    ファイル名はセッションIDのディレクトリと単調増加の連番で決めるため、同時に利用する他のセッションと衝突しない
+    セッションの終了（st.session_stateの破棄）時に作業ディレクトリを削除する
+    """
+
+    def __init__(self, session_id, input_root, output_root, storage_manager=None):
+        """
+        Args:
+            session_id: StreamlitのセッションID（Noneの場合は新しく採番）
+            input_root: 音声入力ファイルの保存先のルート
+            output_root: 音声出力ファイルの保存先のルート
+            storage_manager: セッション終了時に登録を解除するAudioStorageManager
+        """
+        self.session_id = session_id or uuid.uuid4().hex
+        self.input_dir = os.path.join(input_root, "sessions", self.session_id)
+        self.output_dir = os.path.join(output_root, "sessions", self.session_id)
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        # ディレクトリは保存時に作成する（音声をファイルに保存しない設定では作成しない）
+        self._finalizer = weakref.finalize(
+            self, remove_session_files, [self.input_dir, self.output_dir], self.session_id, storage_manager
+        )
+
+    def _next_number(self):
+        with self._lock:
+            return next(self._counter)
+
+    def input_path(self, extension="wav"):
+        """
+        新しい音声入力ファイルのパスを取得
+        """
+        return os.path.join(self.input_dir, f"audio_input_{self._next_number():06d}.{extension}")
+
+    def output_path(self, extension="wav"):
+        """
+        新しい音声出力ファイルのパスを取得
+        """
+        return os.path.join(self.output_dir, f"audio_output_{self._next_number():06d}.{extension}")
+
+    def close(self):
+        """
+        作業ディレクトリを削除（セッション終了時にも自動で呼び出される）
+        """
+        self._finalizer()
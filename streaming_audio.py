@@ -0,0 +1,404 @@
+import base64
+import io
+import json
+import re
+import uuid
+import wave
+import streamlit as st
+from streamlit.components.v1 import html
+
+# 音声合成APIのpcm形式（ヘッダーなし・24kHz・16bit・モノラル・リトルエンディアン）
+PCM_SAMPLE_RATE = 24000
+PCM_SAMPLE_WIDTH = 2
+PCM_CHANNELS = 1
+
+# ストリーミング再生に対応している音声形式（MediaSourceに渡すMIMEタイプ）
+# pcmはMediaSourceが対応していないため、ブラウザのWeb Audioで区間を隙間なく続けて再生する
+STREAMING_MIME_TYPES = {
+    "mp3": "audio/mpeg",
+    "aac": "audio/aac",
+    "pcm": f"audio/pcm;rate={PCM_SAMPLE_RATE}",
+}
+
+# 文ごとに音声合成した結果をバイト列のまま連結できる音声形式（ヘッダーなし、またはフレーム単位の形式）
+# wav・flac・opusはファイルごとにヘッダー（コンテナ）を持つため、連結すると正しく再生できない
+CONCATENABLE_FORMATS = {"pcm", "mp3", "aac"}
+
+# 親ウィンドウに常駐させるストリーミング再生プレーヤー
+# iframeは再描画のたびに作り直されるため、受信済みの音声データと再生状態は親ウィンドウ側で保持し、再生を終えたら破棄する
+PLAYER_SCRIPT = """
+window.__ttsStreamPlayer = window.__ttsStreamPlayer || (function () {
+  const players = {};
+  // 再生を終えたストリームのID（破棄した後に遅れて届いたデータで再生し直さないようにする）
+  const ended = {};
+  // pcmの最初の区間を再生し始めるまでの余裕（秒）
+  const PCM_START_DELAY = 0.05;
+  let context = null;
+
+  function decode(b64) {
+    const binary = atob(b64);
+    const bytes = new Uint8Array(binary.length);
+    for (let i = 0; i < binary.length; i++) {
+      bytes[i] = binary.charCodeAt(i);
+    }
+    return bytes;
+  }
+
+  // 自動再生が許可されずに再生できなかった場合は、ログを残して次の操作時に再試行する
+  function retryOnGesture(name, resume) {
+    return function (error) {
+      console.warn("tts stream: " + name + " was blocked, retrying on the next user gesture", error);
+      document.addEventListener("pointerdown", function () {
+        resume().catch(function (retryError) {
+          console.warn("tts stream: " + name + " failed", retryError);
+        });
+      }, {once: true});
+    };
+  }
+
+  function play(audio) {
+    audio.play().catch(retryOnGesture("audio playback", function () { return audio.play(); }));
+  }
+
+  // pcmはすべてのストリームで1つのAudioContextを共有して再生する
+  function audioContext() {
+    if (!context) {
+      context = new (window.AudioContext || window.webkitAudioContext)();
+    }
+    if (context.state === "suspended") {
+      context.resume().catch(retryOnGesture("audio context", function () { return context.resume(); }));
+    }
+    return context;
+  }
+
+  function release(p) {
+    if (p.audio && p.audio.src) {
+      URL.revokeObjectURL(p.audio.src);
+    }
+    delete players[p.id];
+    ended[p.id] = true;
+  }
+
+  function pump(p) {
+    if (!p.sourceBuffer || p.sourceBuffer.updating) {
+      return;
+    }
+    if (p.queue.length) {
+      p.sourceBuffer.appendBuffer(p.queue.shift());
+      return;
+    }
+    if (p.finished && p.mediaSource.readyState === "open") {
+      p.mediaSource.endOfStream();
+    }
+  }
+
+  // 16bit・モノラルのPCMデータを、前の区間の終わりに隙間なく続くよう予約して再生
+  // （再生速度の変更はピッチを保つためサーバー側で行い、ここでは等速で再生する）
+  function pushPcm(p, chunks) {
+    let length = p.carry.length;
+    chunks.forEach(function (bytes) { length += bytes.length; });
+    // サンプルの途中で区切られた1バイトは次の区間に回す
+    const usable = length - length % 2;
+    if (usable === 0) {
+      return;
+    }
+    const data = new Uint8Array(length);
+    data.set(p.carry, 0);
+    let offset = p.carry.length;
+    chunks.forEach(function (bytes) { data.set(bytes, offset); offset += bytes.length; });
+    p.carry = data.slice(usable);
+
+    const ctx = audioContext();
+    const view = new DataView(data.buffer, 0, usable);
+    const buffer = ctx.createBuffer(1, usable / 2, p.sampleRate);
+    const channel = buffer.getChannelData(0);
+    for (let i = 0; i < channel.length; i++) {
+      channel[i] = view.getInt16(i * 2, true) / 32768;
+    }
+    const source = ctx.createBufferSource();
+    source.buffer = buffer;
+    source.connect(ctx.destination);
+    // 受信が再生に追いつかなかった場合は、少し先の時刻から再生を再開する
+    p.startAt = Math.max(p.startAt, ctx.currentTime + PCM_START_DELAY);
+    source.start(p.startAt);
+    p.startAt += buffer.duration;
+    p.sources += 1;
+    source.addEventListener("ended", function () {
+      p.sources -= 1;
+      if (p.finished && !p.sources) {
+        release(p);
+      }
+    });
+  }
+
+  function create(id, mime, rate) {
+    const p = {id: id, queue: [], chunks: [], pending: {}, next: 0, total: null, finished: false, mime: mime, rate: rate};
+    if (mime.indexOf("audio/pcm") === 0) {
+      p.sampleRate = parseInt(mime.split("rate=")[1], 10);
+      p.carry = new Uint8Array(0);
+      p.startAt = 0;
+      p.sources = 0;
+      return p;
+    }
+    p.audio = new Audio();
+    p.audio.defaultPlaybackRate = rate;
+    p.audio.playbackRate = rate;
+    p.audio.addEventListener("ended", function () { release(p); });
+    if (window.MediaSource && MediaSource.isTypeSupported(mime)) {
+      p.mediaSource = new MediaSource();
+      p.mediaSource.addEventListener("sourceopen", function () {
+        p.sourceBuffer = p.mediaSource.addSourceBuffer(mime);
+        // 文ごとに合成した音声を連結しても途切れないよう、受信順に並べて再生する
+        p.sourceBuffer.mode = "sequence";
+        p.sourceBuffer.addEventListener("updateend", function () { pump(p); });
+        pump(p);
+      });
+      p.audio.src = URL.createObjectURL(p.mediaSource);
+      play(p.audio);
+    }
+    return p;
+  }
+
+  return {
+    // offset: chunksの先頭のチャンクの番号、total: 終了時のみ全チャンク数（それ以外はnull）
+    push: function (id, mime, rate, offset, chunks, total) {
+      if (ended[id]) {
+        return;
+      }
+      const p = players[id] || (players[id] = create(id, mime, rate));
+      // iframeの実行順は前後することがあるため、番号順に揃えてから続きのチャンクだけを取り出す
+      chunks.forEach(function (chunk, i) {
+        if (offset + i >= p.next) {
+          p.pending[offset + i] = chunk;
+        }
+      });
+      if (total !== null) {
+        p.total = total;
+      }
+      const received = [];
+      for (; p.next in p.pending; p.next++) {
+        received.push(decode(p.pending[p.next]));
+        delete p.pending[p.next];
+      }
+      const finished = p.total !== null && p.next >= p.total;
+      if (p.sampleRate) {
+        pushPcm(p, received);
+        p.finished = finished;
+        if (finished && !p.sources) {
+          release(p);
+        }
+        return;
+      }
+      received.forEach(function (bytes) {
+        if (p.mediaSource) {
+          p.queue.push(bytes);
+        } else {
+          p.chunks.push(bytes);
+        }
+      });
+      if (finished && !p.finished) {
+        p.finished = true;
+        if (!p.mediaSource) {
+          // MediaSource非対応のブラウザでは受信完了後にまとめて再生
+          p.audio.src = URL.createObjectURL(new Blob(p.chunks, {type: p.mime}));
+          play(p.audio);
+        }
+      }
+      if (p.mediaSource) {
+        pump(p);
+      }
+    }
+  };
+})();
+"""
+
+# 文末（句読点の後に空白が続く位置）
+SENTENCE_END_PATTERN = re.compile(r'(?<=[.!?。！？])["\')\]]*\s+')
+
+FEED_TEMPLATE = """
+<script>
+(function () {{
+  const w = window.parent;
+  if (!w.__ttsStreamPlayer) {{
+    const script = w.document.createElement("script");
+    script.textContent = {player_script};
+    w.document.head.appendChild(script);
+  }}
+  w.__ttsStreamPlayer.push({stream_id}, {mime}, {rate}, {offset}, {chunks}, {total});
+}})();
+</script>
+"""
+PLAYER_SCRIPT_JSON = json.dumps(PLAYER_SCRIPT)
+
+
+def pcm_to_wav(pcm_data, sample_rate=PCM_SAMPLE_RATE, sample_width=PCM_SAMPLE_WIDTH, channels=PCM_CHANNELS):
+    """
+    ヘッダーなしのPCMデータにwavのヘッダーを付ける（サンプルの復号・再エンコードは行わない）
+    """
+    wav_buffer = io.BytesIO()
+    with wave.open(wav_buffer, "wb") as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(sample_width)
+        wav_file.setframerate(sample_rate)
+        # 途中で切れたサンプルは捨てる
+        frame_size = sample_width * channels
+        wav_file.writeframes(memoryview(pcm_data)[:len(pcm_data) // frame_size * frame_size])
+    return wav_buffer.getvalue()
+
+
+def is_streaming_supported(response_format):
+    """
+    指定の音声形式がストリーミング再生に対応しているか
+    """
+    return response_format in STREAMING_MIME_TYPES
+
+
+def can_concatenate(response_format):
+    """
+    指定の音声形式の音声データをバイト列のまま連結できるか
+    """
+    return response_format in CONCATENABLE_FORMATS
+
+
+def stream_speech(openai_obj, text, model, voice, response_format, chunk_size, timeout=None):
+    """
+    音声合成結果をチャンク単位で受信しながら順番に返す
+    Args:
+        openai_obj: OpenAIクライアント
+        text: 読み上げるテキスト
+        chunk_size: 1回に受信するバイト数
+        timeout: タイムアウト（秒）
+    """
+    with openai_obj.audio.speech.with_streaming_response.create(
+        model=model,
+        voice=voice,
+        input=text,
+        response_format=response_format,
+        timeout=timeout
+    ) as response:
+        for chunk in response.iter_bytes(chunk_size):
+            yield chunk
+
+
+def create_feed_container():
+    """
+    ブラウザのプレーヤーへデータを送るiframe（高さ0）を並べるコンテナを作成
+    要素間の余白を指定できるStreamlitでは余白をなくし、iframeが増えても表示が広がらないようにする
+    """
+    try:
+        return st.container(gap=None)
+    except TypeError:
+        return st.container()
+
+
+class StreamingAudioPlayer:
+    """
+    受信したチャンクをブラウザのプレーヤーに順次送り、合成完了を待たずに再生を開始する
+    pcm形式はブラウザ側で再生速度を変えるとピッチも変わるため、送る前にピッチを保ったまま速度を変更する
+    """
+
+    def __init__(self, response_format, speed=1.0, first_flush_bytes=4096):
+        """
+        Args:
+            response_format: 音声形式（STREAMING_MIME_TYPESのキー）
+            speed: 再生速度
+            first_flush_bytes: 最初にブラウザへ送るまでに溜めるバイト数（以降は倍々で増やす）
+        """
+        self.mime = STREAMING_MIME_TYPES[response_format]
+        self.speed = speed
+        self._stretch_pcm = response_format == "pcm" and speed != 1.0
+        self._stream_id = uuid.uuid4().hex
+        self._placeholder = create_feed_container()
+        # 未送信のチャンクと、送信済みのチャンク数
+        self._chunks = []
+        self._sent = 0
+        # 速度変更時に、サンプルの途中で区切られて次回に回すバイト
+        self._carry = b""
+        self._pending_bytes = 0
+        self._flush_bytes = first_flush_bytes
+
+    def feed(self, chunk, flush=False):
+        """
+        チャンクを追加し、一定量溜まったらブラウザに送る
+        Args:
+            flush: Trueの場合は溜まった量に関係なくすぐに送る
+        """
+        self._chunks.append(bytes(chunk))
+        self._pending_bytes += len(chunk)
+        if flush:
+            self._flush(finished=False)
+        elif self._pending_bytes >= self._flush_bytes:
+            self._flush(finished=False)
+            # 再描画の回数を抑えるため、送信間隔を倍々で広げる
+            self._flush_bytes *= 2
+
+    def close(self):
+        """
+        残りのチャンクを送り、ストリームの終了をブラウザに通知
+        """
+        self._flush(finished=True)
+
+    def _flush(self, finished):
+        """
+        前回から追加されたチャンクだけを送る
+        送るたびに新しいiframeを追加し、実行前のiframeが差し替えで消えて欠落しないようにする
+        """
+        chunks, self._chunks = self._chunks, []
+        if self._stretch_pcm and chunks:
+            # 送る単位ごとにまとめて速度を変更（ブラウザ側は等速で再生する）
+            from time_stretch import stretch_pcm
+            data = self._carry + b"".join(chunks)
+            usable = len(data) - len(data) % PCM_SAMPLE_WIDTH
+            self._carry = data[usable:]
+            chunks = [stretch_pcm(data[:usable], self.speed, PCM_SAMPLE_RATE)]
+        chunks = [base64.b64encode(chunk).decode("ascii") for chunk in chunks]
+        offset = self._sent
+        self._sent += len(chunks)
+        self._pending_bytes = 0
+        with self._placeholder:
+            html(FEED_TEMPLATE.format(
+                player_script=PLAYER_SCRIPT_JSON,
+                stream_id=json.dumps(self._stream_id),
+                mime=json.dumps(self.mime),
+                rate=json.dumps(1.0 if self._stretch_pcm else self.speed),
+                offset=offset,
+                chunks=json.dumps(chunks),
+                total=json.dumps(self._sent if finished else None),
+            ), height=0)
+
+
+class SentenceBuffer:
+    """
+    ストリーミングで受信したテキストを溜め、文が完成するたびに切り出す
+    """
+
+    def __init__(self, min_chars=20):
+        """
+        Args:
+            min_chars: 切り出す文の最小文字数（短すぎる文は次の文とまとめて音声合成する）
+        """
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def append(self, text):
+        """
+        テキストを追加し、完成した文のリストを返す
+        """
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in SENTENCE_END_PATTERN.finditer(self._buffer):
+            sentence = self._buffer[start:match.end()].strip()
+            if len(sentence) >= self.min_chars:
+                sentences.append(sentence)
+                start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self):
+        """
+        残りのテキストを返して空にする（残りがない場合はNone）
+        """
+        sentence = self._buffer.strip()
+        self._buffer = ""
+        return sentence or None
@@ -0,0 +1,192 @@
+import io
+import threading
+import wave
+from collections import OrderedDict
+from concurrent.futures import Future
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# wavのサンプル幅（バイト数）とNumPyの型の対応
+SAMPLE_DTYPES = {
+    2: np.int16,
+    4: np.int32,
+}
+
+
+def time_stretch(samples, speed, sample_rate, frame_ms=30):
+    """
+    WSOLAでピッチを保ったまま再生速度を変更
+    Args:
+        samples: 音声データ（サンプル数 × チャンネル数のfloat配列）
+        speed: 再生速度（2.0で倍速、0.5で半分の速さ）
+        sample_rate: サンプリング周波数
+        frame_ms: 重ね合わせる1フレームの長さ（ミリ秒）
+    Returns:
+        速度変更後の音声データ（サンプル数 × チャンネル数のfloat配列）
+    """
+    if speed == 1.0 or len(samples) == 0:
+        return samples
+
+    frame_length = max(int(sample_rate * frame_ms / 1000) // 2 * 2, 4)
+    synthesis_hop = frame_length // 2
+    analysis_hop = synthesis_hop * speed
+    tolerance = synthesis_hop // 2
+    window = np.hanning(frame_length).astype(np.float32)
+
+    # 前後に余白を付け、探索範囲が範囲外にはみ出さないようにする
+    padded = np.pad(samples, ((tolerance, frame_length + tolerance), (0, 0)))
+    # 波形の類似度はモノラルに変換した信号で判定する
+    mono = padded.mean(axis=1)
+
+    output_length = int(len(samples) / speed)
+    frame_count = output_length // synthesis_hop + 1
+    output = np.zeros((frame_count * synthesis_hop + frame_length, samples.shape[1]), dtype=np.float32)
+    weights = np.zeros(len(output), dtype=np.float32)
+
+    position = tolerance
+    for k in range(frame_count):
+        nominal = int(round(k * analysis_hop)) + tolerance
+        # 探索範囲か前フレームの自然な続きが末尾を超える場合は終了（遅い再生速度では後者が先に超える）
+        if max(nominal + tolerance, position + synthesis_hop) + frame_length > len(padded):
+            break
+        if k > 0:
+            # 前フレームの自然な続きと最も似ている位置を、許容範囲内から選ぶ
+            natural = mono[position + synthesis_hop:position + synthesis_hop + frame_length]
+            candidates = sliding_window_view(
+                mono[nominal - tolerance:nominal + tolerance + frame_length], frame_length
+            )
+            position = nominal - tolerance + int(np.argmax(candidates @ (natural * window)))
+        else:
+            position = nominal
+
+        start = k * synthesis_hop
+        output[start:start + frame_length] += padded[position:position + frame_length] * window[:, None]
+        weights[start:start + frame_length] += window
+
+    output /= np.maximum(weights, 1e-3)[:, None]
+    return output[:output_length]
+
+
+def read_wav(wav_bytes):
+    """
+    wav形式のバイト列を (float配列, サンプリング周波数, サンプル幅) に変換
+    """
+    with wave.open(io.BytesIO(wav_bytes), "rb") as wav_file:
+        channels = wav_file.getnchannels()
+        sample_width = wav_file.getsampwidth()
+        sample_rate = wav_file.getframerate()
+        frames = wav_file.readframes(wav_file.getnframes())
+
+    if sample_width not in SAMPLE_DTYPES:
+        raise ValueError(f"サポートされていないサンプル幅です: {sample_width}")
+    samples = np.frombuffer(frames, dtype=SAMPLE_DTYPES[sample_width]).reshape(-1, channels)
+    return samples.astype(np.float32), sample_rate, sample_width
+
+
+def write_wav(samples, sample_rate, sample_width):
+    """
+    float配列をwav形式のバイト列に変換
+    """
+    dtype = SAMPLE_DTYPES[sample_width]
+    limits = np.iinfo(dtype)
+    pcm = np.clip(np.round(samples), limits.min, limits.max).astype(dtype)
+
+    wav_buffer = io.BytesIO()
+    with wave.open(wav_buffer, "wb") as wav_file:
+        wav_file.setnchannels(samples.shape[1])
+        wav_file.setsampwidth(sample_width)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm.tobytes())
+    return wav_buffer.getvalue()
+
+
+def stretch_pcm(pcm_data, speed, sample_rate):
+    """
+    ヘッダーなしの16bit・モノラルのPCMデータの再生速度を、ピッチを保ったまま変更
+    """
+    samples = np.frombuffer(pcm_data, dtype="<i2").astype(np.float32)[:, None]
+    stretched = time_stretch(samples, speed, sample_rate)
+    return np.clip(np.round(stretched[:, 0]), -32768, 32767).astype("<i2").tobytes()
+
+
+def render_speed_variant(wav_bytes, speed):
+    """
+    wav形式の音声を指定の再生速度に変換（プロセスプールから呼び出される）
+    """
+    samples, sample_rate, sample_width = read_wav(wav_bytes)
+    return write_wav(time_stretch(samples, speed, sample_rate), sample_rate, sample_width)
+
+
+class SpeedVariantStore:
+    """
+    再生速度ごとの音声をプロセスプールで作成し、(クリップID, 再生速度) ごとにメモリ上で保持する
+    事前に作成するのは学習者が選択中の速度のみとし、全セッションで共有するプールを使われない速度の変換で埋めない
+    """
+
+    def __init__(self, executor, max_clips):
+        """
+        Args:
+            executor: 速度変換を実行するExecutor
+            max_clips: 保持するクリップ数の上限（超えたら古く使われたものから破棄）
+        """
+        self._executor = executor
+        self.max_clips = max_clips
+        self._lock = threading.Lock()
+        # クリップID -> {再生速度: Future}
+        self._variants = OrderedDict()
+
+    def _variants_of(self, clip_id):
+        """
+        クリップの速度ごとのFutureの辞書を取得（ロック取得済みで呼び出す）
+        """
+        variants = self._variants.get(clip_id)
+        if variants is not None:
+            self._variants.move_to_end(clip_id)
+            return variants
+
+        variants = self._variants[clip_id] = {}
+        while len(self._variants) > self.max_clips:
+            _, evicted = self._variants.popitem(last=False)
+            for future in evicted.values():
+                future.cancel()
+        return variants
+
+    def prerender(self, clip_id, wav_bytes, speed):
+        """
+        指定の再生速度の音声作成を開始（作成済み・作成中のものは再利用）
+        """
+        if speed == 1.0:
+            return
+        with self._lock:
+            variants = self._variants_of(clip_id)
+            if speed in variants:
+                return
+            try:
+                variants[speed] = self._executor.submit(render_speed_variant, wav_bytes, speed)
+            except RuntimeError:
+                # プロセスプールが利用できない場合は、取得時にその場で変換する
+                pass
+
+    def get(self, clip_id, wav_bytes, speed):
+        """
+        指定の再生速度の音声を取得
+        作成中の場合は完了を待ち、未作成・順番待ちの場合は他のセッションの変換の後ろに並ばずにその場で変換する
+        """
+        if speed == 1.0:
+            return wav_bytes
+
+        with self._lock:
+            future = self._variants_of(clip_id).get(speed)
+        if future is not None and not future.cancel():
+            try:
+                return future.result()
+            except Exception:
+                # プロセスプールが利用できない場合はその場で変換
+                pass
+
+        data = render_speed_variant(wav_bytes, speed)
+        future = Future()
+        future.set_result(data)
+        with self._lock:
+            self._variants_of(clip_id)[speed] = future
+        return data
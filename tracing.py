@@ -0,0 +1,238 @@
+import bisect
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# ヒストグラムのバケットの上限（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# パーセンタイルの計算に使う直近の計測値の数（系列ごと）
+DEFAULT_RECENT_SAMPLES = 1024
+
+METRIC_NAME = "english_conversation_stage_duration_seconds"
+
+
+class LatencyHistogram:
+    """
+    1つの系列（処理段階とラベルの組み合わせ）の処理時間を集計する
+    エクスポート用の累積バケットと、パーセンタイル計算用の直近の計測値を保持する
+    """
+
+    def __init__(self, buckets, recent_samples):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=recent_samples)
+
+    def observe(self, seconds):
+        self.bucket_counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.recent.append(seconds)
+
+
+def percentile(sorted_values, ratio):
+    """
+    昇順に並んだ値のパーセンタイルを線形補間で求める
+    """
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * ratio
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def escape_label_value(value):
+    """
+    Prometheusのテキスト形式のラベル値をエスケープ
+    """
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class TraceStore:
+    """
+    処理段階ごとの処理時間（スパン）をプロセス内で集計する
+    パーセンタイルの取得と、Prometheusのテキスト形式・JSONでの書き出しに対応する
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, recent_samples=DEFAULT_RECENT_SAMPLES):
+        self.buckets = tuple(buckets)
+        self.recent_samples = recent_samples
+        self._lock = threading.Lock()
+        # (処理段階, ソート済みのラベルのタプル) -> LatencyHistogram
+        self._series = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def record(self, stage, seconds, labels=None):
+        """
+        処理時間を1件記録
+        Args:
+            stage: 処理段階の名前（"transcribe_audio" など）
+            seconds: 処理時間（秒）
+            labels: モード・英語レベル・再生速度などのラベルの辞書
+        """
+        key = (stage, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            histogram = self._series.get(key)
+            if histogram is None:
+                histogram = self._series[key] = LatencyHistogram(self.buckets, self.recent_samples)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def span(self, stage, labels=None):
+        """
+        withブロックの処理時間を記録（例外時はoutcome="error"を付けて記録）
+        st.stop()・st.rerun()による中断（Exception以外の例外）は記録しない
+        """
+        labels = dict(labels or {})
+        start_time = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            labels["outcome"] = "error"
+            self.record(stage, time.perf_counter() - start_time, labels)
+            raise
+        labels["outcome"] = "ok"
+        self.record(stage, time.perf_counter() - start_time, labels)
+
+    def bind(self, labels):
+        """
+        ラベルを固定したTracerを作成（バックグラウンドスレッドに渡す用）
+        """
+        return Tracer(self, labels)
+
+    def summary(self, **filters):
+        """
+        処理段階ごとの件数・平均・p50/p95/p99（秒）を返す（ラベルはまとめて集計）
+        Args:
+            filters: 集計対象を絞り込むラベル（例：mode="MODE_1"）
+        """
+        stages = {}
+        with self._lock:
+            for (stage, labels), histogram in self._series.items():
+                label_dict = dict(labels)
+                if any(label_dict.get(name) != value for name, value in filters.items()):
+                    continue
+                stats = stages.setdefault(stage, {"count": 0, "sum": 0.0, "recent": []})
+                stats["count"] += histogram.count
+                stats["sum"] += histogram.sum
+                stats["recent"].extend(histogram.recent)
+
+        result = {}
+        for stage, stats in sorted(stages.items()):
+            recent = sorted(stats["recent"])
+            result[stage] = {
+                "count": stats["count"],
+                "mean": stats["sum"] / stats["count"] if stats["count"] else 0.0,
+                "p50": percentile(recent, 0.50),
+                "p95": percentile(recent, 0.95),
+                "p99": percentile(recent, 0.99),
+            }
+        return result
+
+    def to_json(self):
+        """
+        系列ごとの件数・合計・パーセンタイルをJSON文字列で返す
+        """
+        with self._lock:
+            items = [
+                (stage, dict(labels), histogram.count, histogram.sum, sorted(histogram.recent))
+                for (stage, labels), histogram in self._series.items()
+            ]
+        series = [
+            {
+                "stage": stage,
+                "labels": labels,
+                "count": count,
+                "sum": total,
+                "p50": percentile(recent, 0.50),
+                "p95": percentile(recent, 0.95),
+                "p99": percentile(recent, 0.99),
+            }
+            for stage, labels, count, total, recent in sorted(items, key=lambda item: (item[0], sorted(item[1].items())))
+        ]
+        return json.dumps({"generated_at": time.time(), "series": series}, ensure_ascii=False, indent=2)
+
+    def to_prometheus(self):
+        """
+        全系列をPrometheusのテキスト形式（histogram）で返す
+        """
+        with self._lock:
+            items = [
+                (stage, labels, list(histogram.bucket_counts), histogram.count, histogram.sum)
+                for (stage, labels), histogram in self._series.items()
+            ]
+
+        lines = [
+            f"# HELP {METRIC_NAME} Duration of each processing stage of a conversation turn.",
+            f"# TYPE {METRIC_NAME} histogram",
+        ]
+        for stage, labels, bucket_counts, count, total in sorted(items):
+            label_text = ",".join(
+                f'{name}="{escape_label_value(value)}"' for name, value in (("stage", stage),) + labels
+            )
+            cumulative = 0
+            for upper, bucket_count in zip(self.buckets + ("+Inf",), bucket_counts):
+                cumulative += bucket_count
+                lines.append(f'{METRIC_NAME}_bucket{{{label_text},le="{upper}"}} {cumulative}')
+            lines.append(f"{METRIC_NAME}_sum{{{label_text}}} {total}")
+            lines.append(f"{METRIC_NAME}_count{{{label_text}}} {count}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, directory):
+        """
+        Prometheusのテキスト形式（metrics.prom）とJSON（metrics.json）をディレクトリに書き出す
+        書き込み途中のファイルを読まれないよう、一時ファイルに書いてから置き換える
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name, content in (("metrics.prom", self.to_prometheus()), ("metrics.json", self.to_json())):
+            path = os.path.join(directory, name)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(temp_path, path)
+
+    def start_export(self, directory, interval_seconds):
+        """
+        一定間隔でファイルに書き出すスレッドを開始（実行済みの場合は何もしない）
+        """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run_export, args=(directory, interval_seconds), name="metrics-exporter", daemon=True
+        )
+        self._thread.start()
+
+    def stop_export(self):
+        """
+        書き出しスレッドを停止
+        """
+        self._stop_event.set()
+
+    def _run_export(self, directory, interval_seconds):
+        while not self._stop_event.wait(interval_seconds):
+            try:
+                self.dump(directory)
+            except Exception:
+                # 書き出しの失敗でスレッドを止めない（次回の実行で再試行）
+                pass
+
+
+class Tracer:
+    """
+    ラベルを固定してTraceStoreにスパンを記録する
+    st.session_stateを参照しないため、バックグラウンドスレッドからも使える
+    """
+
+    def __init__(self, store, labels):
+        self.store = store
+        self.labels = dict(labels)
+
+    def span(self, stage):
+        return self.store.span(stage, self.labels)
@@ -0,0 +1,201 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class TTSCache:
+    """
+    音声合成結果のディスクキャッシュ
+    (テキスト, モデル, 声, 形式) のハッシュをキーとして保存し、容量上限を超えたら最も古く使われたものから削除する
+    同じキーの音声合成が実行中の場合は、その完了を待って結果を共有する（APIの呼び出しは1回のみ）
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        """
+        Args:
+            cache_dir: キャッシュファイルの保存先ディレクトリ
+            max_bytes: キャッシュ全体の容量上限（バイト）
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # キー -> (ファイルパス, バイト数)。先頭ほど古く使われたもの
+        self._entries = OrderedDict()
+        # キー -> 音声合成中の結果を受け取るFuture
+        self._inflight = {}
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.saved_characters = 0
+        self._miss_seconds = 0.0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def make_key(text, model, voice, response_format):
+        """
+        キャッシュキー（SHA-256）を作成
+        """
+        payload = "\x1f".join([model, voice, response_format, text])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _load_index(self):
+        """
+        既存のキャッシュファイルを最終利用時刻順に読み込む
+        """
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".tmp"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, name.split(".", 1)[0], path, stat.st_size))
+
+        for _, key, path, size in sorted(files):
+            self._entries[key] = (path, size)
+            self._total_bytes += size
+        self._evict()
+
+    def _evict(self):
+        """
+        容量上限を超えている間、最も古く使われたエントリを削除（ロック取得済みで呼び出す）
+        """
+        while self._total_bytes > self.max_bytes and self._entries:
+            _, (path, size) = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get(self, key):
+        """
+        キャッシュから音声データを取得（存在しない場合はNone）
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        path, size = entry
+
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # 別プロセスとLRU順を共有するため最終利用時刻を更新
+            os.utime(path)
+        except OSError:
+            # 他のプロセスに削除された場合はミス扱い
+            with self._lock:
+                if self._entries.pop(key, None) is not None:
+                    self._total_bytes -= size
+            return None
+        return data
+
+    def put(self, key, data, response_format):
+        """
+        音声データをキャッシュに保存
+        """
+        path = os.path.join(self.cache_dir, f"{key}.{response_format}")
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+        # 書き込み途中のファイルを読まれないよう、一時ファイル経由で置き換える
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous[1]
+            self._entries[key] = (path, len(data))
+            self._total_bytes += len(data)
+            self._evict()
+
+    def get_or_create(self, text, model, voice, response_format, create_func):
+        """
+        キャッシュにあればそれを返し、なければ create_func で音声合成して保存
+        同じキーの音声合成が実行中の場合は、その完了を待って同じ結果を返す
+        Args:
+            create_func: 音声データ（bytes）を返す関数
+        """
+        key = self.make_key(text, model, voice, response_format)
+
+        data = self.get(key)
+        if data is not None:
+            with self._lock:
+                self.hits += 1
+                self.saved_characters += len(text)
+            return data
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            data = future.result()
+            if data is None:
+                # 実行中の音声合成が失敗・中断された場合は、改めて作成する
+                return self.get_or_create(text, model, voice, response_format, create_func)
+            with self._lock:
+                self.saved_characters += len(text)
+            return data
+
+        start_time = time.perf_counter()
+        try:
+            data = create_func()
+        except BaseException:
+            with self._lock:
+                del self._inflight[key]
+            future.set_result(None)
+            raise
+        elapsed = time.perf_counter() - start_time
+
+        with self._lock:
+            self.misses += 1
+            self._miss_seconds += elapsed
+        try:
+            self.put(key, data, response_format)
+        except OSError:
+            # キャッシュへの保存に失敗しても音声データはそのまま返す
+            pass
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            future.set_result(data)
+        return data
+
+    def stats(self):
+        """
+        ヒット/ミス数と、キャッシュによって削減できた時間・文字数の推計を返す
+        """
+        with self._lock:
+            requests = self.hits + self.misses
+            average_miss_seconds = self._miss_seconds / self.misses if self.misses else 0.0
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": self.hits / requests if requests else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "total_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "saved_characters": self.saved_characters,
+                "saved_seconds": average_miss_seconds * self.hits,
+            }